@@ -1,9 +1,10 @@
 import hashlib
-import json
 from fastapi import APIRouter, Depends
 from redis.asyncio import Redis
 
 from src.api.schemas.ai_analysis import AnalysisRequest, AnalysisResponse
+from src.core.caching import get_cache_engine
+from src.core.inference import BatchedInference
 from src.core.spirit_analyzer import SpiritAnalyzer
 from src.db.redis_client import get_redis_client
 from src.api.deps import get_current_user
@@ -11,16 +12,29 @@ from src.db import models
 
 router = APIRouter()
 CACHE_EXPIRATION_SECONDS = 3600  # 1 час
-# Создаем зависимость для SpiritAnalyzer, чтобы не инициализировать его при каждом запросе.
-# FastAPI кэширует результат функции Depends без параметров в рамках одного запроса.
-def get_spirit_analyzer() -> SpiritAnalyzer:
-    return SpiritAnalyzer()
+
+# Модель загружается один раз на воркер и живет в выделенном потоке-исполнителе.
+# Конкурентные запросы объединяются в батчи, поэтому event loop не блокируется.
+spirit_analyzer_pool = BatchedInference(loader=SpiritAnalyzer)
+
+
+def get_spirit_analyzer() -> BatchedInference:
+    return spirit_analyzer_pool
+
+
+async def start_spirit_analyzer() -> None:
+    """Загружает модель при старте воркера, чтобы первый запрос не ждал загрузки."""
+    await spirit_analyzer_pool.start()
+
+
+async def close_spirit_analyzer() -> None:
+    await spirit_analyzer_pool.close()
 
 
 @router.post("/analyze-text", response_model=AnalysisResponse)
 async def analyze_user_text(
     request_data: AnalysisRequest,
-    analyzer: SpiritAnalyzer = Depends(get_spirit_analyzer),
+    analyzer: BatchedInference = Depends(get_spirit_analyzer),
     redis_client: Redis = Depends(get_redis_client),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -33,19 +47,14 @@ async def analyze_user_text(
     text_hash = hashlib.sha256(f"{current_user.id}:{request_data.text}".encode()).hexdigest()
     cache_key = f"analysis:{text_hash}"
 
-    # 2. Пытаемся получить результат из кэша Redis
-    cached_result = await redis_client.get(cache_key)
-    if cached_result:
-        print(f"CACHE HIT for key: {cache_key}")
-        return {"results": json.loads(cached_result)}
-
-    print(f"CACHE MISS for key: {cache_key}")
-    # 3. Если в кэше ничего нет, выполняем анализ
-    analysis_results = analyzer.analyze_topics(request_data.text)
-
-    # 4. Сохраняем результат в кэш Redis с временем жизни
-    await redis_client.set(
-        cache_key, json.dumps(analysis_results), ex=CACHE_EXPIRATION_SECONDS
+    # 2. Берем результат из кэша (память воркера + Redis, бинарный кодек),
+    #    а при промахе выполняем анализ в общем батче вне event loop.
+    #    Одновременные запросы одного и того же текста анализируются один раз.
+    cache = get_cache_engine(redis_client)
+    analysis_results = await cache.get_or_compute(
+        cache_key,
+        lambda: analyzer.analyze(request_data.text),
+        CACHE_EXPIRATION_SECONDS,
     )
 
-    return {"results": analysis_results}
\ No newline at end of file
+    return {"results": analysis_results}
@@ -0,0 +1,250 @@
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from .block_store import BlockStore
+
+logger = logging.getLogger(__name__)
+
+# Отправитель системных транзакций (начисления), у которого нет баланса.
+SYSTEM_SENDER = "0"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS balances (
+    account TEXT PRIMARY KEY,
+    balance INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS balance_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    applied_length INTEGER NOT NULL,
+    generation INTEGER NOT NULL
+);
+"""
+
+
+def _field(obj: Any, name: str, default: Any = None) -> Any:
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def balance_deltas(blocks: Iterable[Any]) -> Dict[str, int]:
+    """Суммарные изменения балансов по транзакциям блоков."""
+    deltas: Dict[str, int] = defaultdict(int)
+    for block in blocks:
+        for tx in _field(block, "transactions") or ():
+            amount = int(_field(tx, "amount", 0))
+            sender, recipient = _field(tx, "sender"), _field(tx, "recipient")
+            if sender and sender != SYSTEM_SENDER:
+                deltas[str(sender)] -= amount
+            if recipient:
+                deltas[str(recipient)] += amount
+    return deltas
+
+
+class BalanceIndex:
+    """
+    Материализованные балансы Барака-поинтов по подтвержденным блокам.
+
+    Хранится в файле хранилища блоков (таблица balances), поэтому общий для
+    всех воркеров и не требует пересчета при старте. sync() применяет только
+    блоки, добавленные с прошлого раза; при замене хвоста цепочки (консенсус)
+    индекс перестраивается одной транзакцией. Чтение баланса - один поиск по
+    первичному ключу в последнем согласованном состоянии: отставший индекс
+    догоняет цепочку в фоновом потоке (request_sync), а не в запросе.
+    """
+
+    def __init__(self, store: BlockStore, batch_blocks: int = 500):
+        self.store = store
+        self.batch_blocks = batch_blocks
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(store.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute("INSERT OR IGNORE INTO balance_state (id, applied_length, generation) VALUES (1, 0, 0)")
+        # Отдельное соединение для чтения: в WAL оно видит последнее закоммиченное
+        # состояние и не ждет, пока фоновый поток перестраивает индекс
+        self._reader = sqlite3.connect(store.path, check_same_thread=False, isolation_level=None)
+        self._read_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="balance-index")
+        self._sync_scheduled = False
+        self._schedule_lock = threading.Lock()
+
+    def balance(self, account: str) -> int:
+        """Баланс аккаунта по подтвержденным блокам (последнее согласованное состояние индекса)."""
+        self._catch_up()
+        with self._read_lock:
+            row = self._reader.execute("SELECT balance FROM balances WHERE account = ?", (account,)).fetchone()
+        return row[0] if row else 0
+
+    def balances(self, accounts: List[str]) -> Dict[str, int]:
+        """Балансы нескольких аккаунтов одним запросом (отсутствующие - 0)."""
+        self._catch_up()
+        result = dict.fromkeys(accounts, 0)
+        if not accounts:
+            return result
+        placeholders = ",".join("?" * len(accounts))
+        with self._read_lock:
+            rows = self._reader.execute(
+                f"SELECT account, balance FROM balances WHERE account IN ({placeholders})", accounts
+            ).fetchall()
+        result.update(rows)
+        return result
+
+    def current_balances(self, accounts: List[str]) -> Dict[str, int]:
+        """
+        Балансы после применения всех блоков цепочки. Может перестраивать индекс,
+        поэтому вызывается вне event loop (например, через asyncio.to_thread).
+        """
+        self.sync()
+        return self.balances(accounts)
+
+    def is_current(self) -> bool:
+        """Применены ли к индексу все блоки текущей цепочки."""
+        with self._read_lock:
+            applied, generation = self._reader.execute(
+                "SELECT applied_length, generation FROM balance_state WHERE id = 1"
+            ).fetchone()
+        return applied == len(self.store) and generation == self.store.generation
+
+    def request_sync(self) -> None:
+        """Планирует sync() в фоновом потоке индекса; одновременно ждет не больше одной задачи."""
+        with self._schedule_lock:
+            if self._sync_scheduled:
+                return
+            self._sync_scheduled = True
+        self._executor.submit(self._background_sync)
+
+    def sync(self) -> int:
+        """Применяет новые блоки. Возвращает число примененных блоков."""
+        length = len(self.store)
+        generation = self.store.generation
+        with self._lock:
+            applied, indexed_generation = self._state()
+            if generation != indexed_generation or applied > length:
+                return self.rebuild()
+            if applied == length:
+                return 0
+            return self._apply(applied, length, generation)
+
+    def rebuild(self) -> int:
+        """
+        Перестраивает индекс по всей цепочке. Изменения считаются заранее и
+        записываются одной транзакцией: до COMMIT читатели видят прежние балансы.
+        """
+        with self._lock:
+            generation, length = self.store.generation, len(self.store)
+            logger.info("Индекс балансов перестраивается по всей цепочке")
+            deltas = balance_deltas(self.store.iter_blocks(0, length, self.batch_blocks))
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM balances")
+                self._conn.executemany("INSERT INTO balances (account, balance) VALUES (?, ?)", deltas.items())
+                self._conn.execute(
+                    "UPDATE balance_state SET applied_length = ?, generation = ?", (length, generation)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return length
+
+    def _catch_up(self) -> None:
+        if not self.is_current():
+            self.request_sync()
+
+    def _background_sync(self) -> None:
+        with self._schedule_lock:
+            self._sync_scheduled = False
+        try:
+            self.sync()
+        except Exception:
+            logger.exception("Не удалось обновить индекс балансов")
+
+    def _state(self):
+        return self._conn.execute("SELECT applied_length, generation FROM balance_state WHERE id = 1").fetchone()
+
+    def _apply(self, start: int, stop: int, generation: int) -> int:
+        applied = 0
+        for batch_start in range(start, stop, self.batch_blocks):
+            batch_stop = min(stop, batch_start + self.batch_blocks)
+            deltas = balance_deltas(self.store.iter_blocks(batch_start, batch_stop))
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Другой воркер мог применить эти блоки раньше нас
+                current, current_generation = self._state()
+                if current != batch_start or current_generation != generation:
+                    self._conn.execute("ROLLBACK")
+                    return applied
+                self._conn.executemany(
+                    "INSERT INTO balances (account, balance) VALUES (?, ?) "
+                    "ON CONFLICT(account) DO UPDATE SET balance = balance + excluded.balance",
+                    deltas.items(),
+                )
+                self._conn.execute("UPDATE balance_state SET applied_length = ?", (batch_stop,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            applied += batch_stop - batch_start
+        return applied
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+        with self._read_lock:
+            self._reader.close()
+
+
+async def reconcile_balances(
+    index: BalanceIndex,
+    db_session,
+    user_model: Any,
+    id_column: str = "user_id",
+    points_column: str = "baraka_points",
+    batch_size: int = 1000,
+    fix: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Сравнивает баллы пользователей в БД с балансами по леджеру пачками по `batch_size`
+    (постранично по первичному ключу модели, без OFFSET). `id_column` - столбец,
+    по которому пользователь ведет счет в леджере; он может не совпадать с первичным
+    ключом. Возвращает расхождения; при fix=True записывает в БД балансы из леджера.
+    """
+    from sqlalchemy import inspect, select, tuple_, update
+
+    mapper = inspect(user_model)
+    pk_names = [mapper.get_property_by_column(column).key for column in mapper.primary_key]
+    pk_attrs = [getattr(user_model, name) for name in pk_names]
+    id_attr, points_attr = getattr(user_model, id_column), getattr(user_model, points_column)
+    mismatches: List[Dict[str, Any]] = []
+    last_key: Optional[tuple] = None
+    while True:
+        stmt = select(*pk_attrs, id_attr, points_attr).order_by(*pk_attrs).limit(batch_size)
+        if last_key is not None:
+            stmt = stmt.where(pk_attrs[0] > last_key[0] if len(pk_attrs) == 1 else tuple_(*pk_attrs) > last_key)
+        rows = (await db_session.execute(stmt)).all()
+        if not rows:
+            break
+        keys = [tuple(row[:len(pk_attrs)]) for row in rows]
+        ledger_balances = index.balances([str(row[-2]) for row in rows])
+        batch = [
+            (key, {"user_id": row[-2], "db_points": row[-1] or 0, "ledger_balance": ledger_balances[str(row[-2])]})
+            for key, row in zip(keys, rows)
+            if (row[-1] or 0) != ledger_balances[str(row[-2])]
+        ]
+        if fix and batch:
+            # Пакетный UPDATE ORM сопоставляет строки по первичному ключу
+            await db_session.execute(
+                update(user_model),
+                [{**dict(zip(pk_names, key)), points_column: item["ledger_balance"]} for key, item in batch],
+            )
+        mismatches.extend(item for _, item in batch)
+        last_key = keys[-1]
+    if fix and mismatches:
+        await db_session.commit()
+    return mismatches
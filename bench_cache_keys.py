@@ -0,0 +1,27 @@
+"""
+Замер стоимости построения ключей кэша.
+
+Запуск: python bench_cache_keys.py
+"""
+import timeit
+from datetime import datetime
+
+from src.core.cache_keys import make_cache_key
+
+CASES = {
+    "скаляры": {"user_id": "a1b2c3d4e5f6", "limit": 20},
+    "словарь фильтров": {"filters": {"category": "education", "min_goal": 1000, "tags": ["waqf", "school"]}},
+    "длинный текст": {"text": "Ассаляму алейкум, хочу узнать о вакфе. " * 200},
+    "дата и список": {"since": datetime(2025, 1, 1), "ids": list(range(100))},
+}
+
+
+def main(number: int = 20000) -> None:
+    for name, arguments in CASES.items():
+        seconds = timeit.timeit(lambda: make_cache_key("bench.function", arguments), number=number)
+        key = make_cache_key("bench.function", arguments)
+        print(f"{name:<20} {seconds / number * 1e6:8.2f} мкс/ключ  длина ключа {len(key)}")
+
+
+if __name__ == "__main__":
+    main()
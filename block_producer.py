@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import weakref
+from typing import Any, Callable, List, Optional
+
+from opentelemetry import metrics
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+# Блок создается, как только в пуле набирается столько транзакций...
+BLOCK_MAX_PENDING_TRANSACTIONS = int(os.getenv("BLOCK_MAX_PENDING_TRANSACTIONS", "5"))
+# ...или когда самая старая транзакция ждет дольше этого времени.
+BLOCK_MAX_INTERVAL_SECONDS = float(os.getenv("BLOCK_MAX_INTERVAL_SECONDS", "600"))
+
+block_build_duration = meter.create_histogram(
+    "blockchain.block_build.duration",
+    unit="ms",
+    description="Время сборки блока",
+)
+blocks_produced = meter.create_counter(
+    "blockchain.blocks_produced",
+    description="Количество созданных блоков",
+)
+
+# Производители процесса для общего gauge (инструмент регистрируется один раз на модуль)
+_producers: "weakref.WeakSet[BlockProducer]" = weakref.WeakSet()
+
+
+def _observe_queue_depth(options):
+    yield metrics.Observation(sum(len(producer.ledger.pending_transactions) for producer in list(_producers)))
+
+
+meter.create_observable_gauge(
+    "blockchain.pending_transactions",
+    callbacks=[_observe_queue_depth],
+    description="Количество транзакций, ожидающих включения в блок",
+)
+
+
+class _SealingPool(list):
+    """
+    Пул на время сборки блока в потоке-исполнителе.
+    create_block видит зафиксированный набор транзакций, а транзакции,
+    добавленные запросами во время сборки, откладываются в `arrived`
+    и после сборки возвращаются в пул леджера.
+    """
+
+    def __init__(self, transactions: List[Any]):
+        super().__init__(transactions)
+        self.arrived: List[Any] = []
+
+    def append(self, tx: Any) -> None:
+        self.arrived.append(tx)
+
+    def extend(self, transactions) -> None:
+        self.arrived.extend(transactions)
+
+    def __iadd__(self, transactions):
+        self.arrived.extend(transactions)
+        return self
+
+    def __setitem__(self, index, value) -> None:
+        # Консенсус возвращает транзакции отброшенных блоков в начало пула: pool[:0] = returned
+        if isinstance(index, slice) and not index.start and index.stop == 0:
+            self.arrived[:0] = value
+            return
+        raise TypeError("Пул собираемого блока нельзя изменять")
+
+
+class BlockProducer:
+    """
+    Фоновый производитель блоков.
+
+    Запросы только добавляют транзакции в пул леджера и вызывают notify().
+    Блок собирается в отдельной задаче, когда срабатывает один из триггеров:
+    размер пула достиг max_pending или самая старая транзакция ждет max_interval.
+    """
+
+    def __init__(
+        self,
+        ledger: Any,
+        miner: str,
+        max_pending: int = BLOCK_MAX_PENDING_TRANSACTIONS,
+        max_interval: float = BLOCK_MAX_INTERVAL_SECONDS,
+        on_block: Optional[Callable[[], Any]] = None,
+    ):
+        """
+        :param on_block: Вызывается после записи каждого блока
+            (например, BalanceIndex.request_sync планирует применение к балансам).
+        """
+        self.ledger = ledger
+        self.miner = miner
+        self.max_pending = max(1, max_pending)
+        self.max_interval = max_interval
+        self.on_block = on_block
+        self._wakeup = asyncio.Event()
+        # Момент, когда пул стал непустым (для триггера по времени)
+        self._pending_since: Optional[float] = None
+        _producers.add(self)
+
+    def notify(self) -> None:
+        """Сообщает производителю, что в пул могли быть добавлены транзакции."""
+        pending = len(self.ledger.pending_transactions)
+        if pending and self._pending_since is None:
+            self._pending_since = time.monotonic()
+        if pending >= self.max_pending:
+            self._wakeup.set()
+
+    async def run(self) -> None:
+        """Основной цикл. Запускается одной фоновой задачей на процесс."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._time_until_due())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._is_due():
+                await self.produce_block()
+
+    async def produce_block(self) -> None:
+        """
+        Собирает блок из текущего пула транзакций.
+        Сборка (дерево Меркла, запись на диск, обновление балансов) выполняется
+        в потоке-исполнителе и не блокирует обработку запросов.
+        """
+        transactions = len(self.ledger.pending_transactions)
+        if not transactions:
+            self._pending_since = None
+            return
+        pool = _SealingPool(self.ledger.pending_transactions)
+        self.ledger.pending_transactions = pool
+        build = asyncio.ensure_future(asyncio.to_thread(self._build_block, transactions))
+        try:
+            await asyncio.shield(build)
+        except asyncio.CancelledError:
+            # Поток нельзя прервать: дожидаемся его, чтобы при остановке не потерять пул
+            await build
+            raise
+        finally:
+            # Пул, заведенный create_block, плюс транзакции, пришедшие во время сборки;
+            # если блок не записан - транзакции блока возвращаются в начало пула
+            current = self.ledger.pending_transactions
+            leftover = [] if current is pool else list(current)
+            written = build.done() and not build.cancelled() and build.exception() is None and build.result()
+            restored = [] if written else list(pool)
+            self.ledger.pending_transactions = restored + pool.arrived + leftover
+            # В пул могли попасть транзакции, добавленные без notify()
+            self._pending_since = time.monotonic() if self.ledger.pending_transactions else None
+
+    def _build_block(self, transactions: int) -> bool:
+        """Выполняется в потоке-исполнителе. Возвращает True, если блок записан."""
+        started = time.perf_counter()
+        try:
+            self.ledger.create_block(proof=random.randint(1, 100000), miner=self.miner)
+        except Exception:
+            # Блок не записан (например, другой воркер занял эту позицию в хранилище):
+            # транзакции вернутся в пул и попадут в следующий блок
+            logger.exception("Не удалось создать блок из %d транзакций", transactions)
+            return False
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        block_build_duration.record(elapsed_ms)
+        blocks_produced.add(1)
+        if self.on_block is not None:
+            try:
+                self.on_block()
+            except Exception:
+                # Блок уже записан; индексы догонят цепочку при следующем обращении
+                logger.exception("Ошибка обработчика нового блока")
+        logger.info("Создан блок из %d транзакций за %.1f мс", transactions, elapsed_ms)
+        return True
+
+    def _is_due(self) -> bool:
+        pending = len(self.ledger.pending_transactions)
+        if not pending:
+            self._pending_since = None
+            return False
+        if self._pending_since is None:
+            # Транзакции добавлены в обход notify(): отсчитываем время с этого момента
+            self._pending_since = time.monotonic()
+        return pending >= self.max_pending or time.monotonic() - self._pending_since >= self.max_interval
+
+    def _time_until_due(self) -> float:
+        if self._pending_since is None:
+            return self.max_interval
+        return max(0.0, self._pending_since + self.max_interval - time.monotonic())
@@ -0,0 +1,374 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableSequence
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Файл хранилища блоков. Общий для всех воркеров одного узла.
+LEDGER_STORE_PATH = os.getenv("LEDGER_STORE_PATH", os.path.join(os.getcwd(), "data", "ledger.db"))
+# Сколько байт файла отображать в память для чтения (PRAGMA mmap_size).
+LEDGER_STORE_MMAP_BYTES = int(os.getenv("LEDGER_STORE_MMAP_BYTES", str(256 * 1024 * 1024)))
+# Сколько последних прочитанных блоков держать в памяти воркера.
+LEDGER_STORE_CACHE_BLOCKS = int(os.getenv("LEDGER_STORE_CACHE_BLOCKS", "1024"))
+# Снимок (checkpoint) делается каждые N блоков.
+LEDGER_CHECKPOINT_EVERY_BLOCKS = int(os.getenv("LEDGER_CHECKPOINT_EVERY_BLOCKS", "100"))
+
+# Хэш "предыдущего блока" для первого блока в хранилище.
+_GENESIS_PARENT = "0" * 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    position INTEGER PRIMARY KEY,
+    parent_hash TEXT NOT NULL,
+    block_hash TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chain_length INTEGER NOT NULL,
+    tip_hash TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS spilled_transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data BLOB NOT NULL
+);
+"""
+
+
+class BlockStoreError(Exception):
+    """Базовая ошибка хранилища блоков."""
+
+
+class BlockConflictError(BlockStoreError):
+    """Другой воркер уже записал блок на эту позицию; цепочка перечитана."""
+
+
+class BlockStoreCorrupted(BlockStoreError):
+    """Содержимое блока не совпадает с сохраненным хэшем."""
+
+
+def _encode(value: Any) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode()
+
+
+def _decode(data: bytes) -> Any:
+    return json.loads(data)
+
+
+class BlockStore:
+    """
+    Хранилище блоков только на добавление поверх SQLite (WAL, чтение через mmap).
+
+    Каждый блок хранится вместе с SHA-256 своих байт и хэшем предыдущей записи,
+    поэтому повреждение хвоста обнаруживается при старте. Снимки фиксируют
+    проверенную длину цепочки: при старте проверяются только блоки после снимка.
+    """
+
+    def __init__(self, path: str = LEDGER_STORE_PATH, cache_blocks: int = LEDGER_STORE_CACHE_BLOCKS):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        # Соединение используется из event loop и из потоков-исполнителей, поэтому под замком
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={LEDGER_STORE_MMAP_BYTES}")
+        self._conn.executescript(_SCHEMA)
+        self._cache: "OrderedDict[int, Any]" = OrderedDict()
+        self._cache_blocks = cache_blocks
+        self._length = 0
+        self._tip_hash = _GENESIS_PARENT
+        self._data_version: Optional[int] = None
+        # Поколение цепочки: увеличивается при замене хвоста (консенсус)
+        self._generation = 0
+        self._refresh(force=True)
+
+    # --- Чтение ---
+
+    def __len__(self) -> int:
+        self._refresh()
+        return self._length
+
+    @property
+    def generation(self) -> int:
+        """Поколение цепочки: меняется при каждой замене хвоста (BlockStore.replace_tail)."""
+        self._refresh()
+        return self._generation
+
+    def get(self, position: int) -> Any:
+        """Возвращает блок по позиции (с 0)."""
+        # LRU общий для потока производителя блоков и обработчиков запросов
+        with self._lock:
+            block = self._cache.get(position)
+            if block is not None:
+                self._cache.move_to_end(position)
+                return block
+            row = self._conn.execute("SELECT data FROM blocks WHERE position = ?", (position,)).fetchone()
+            if row is None:
+                raise IndexError(position)
+            block = _decode(row[0])
+            self._remember(position, block)
+            return block
+
+    def iter_blocks(self, start: int = 0, stop: Optional[int] = None, batch: int = 500) -> Iterator[Any]:
+        """Последовательно читает блоки пачками, не загружая цепочку в память целиком."""
+        stop = len(self) if stop is None else stop
+        position = start
+        while position < stop:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT data FROM blocks WHERE position >= ? AND position < ? ORDER BY position",
+                    (position, min(stop, position + batch)),
+                ).fetchall()
+            if not rows:
+                return
+            for (data,) in rows:
+                yield _decode(data)
+            position += len(rows)
+
+    # --- Запись ---
+
+    def append(self, block: Any) -> int:
+        """
+        Добавляет блок в конец цепочки и возвращает его позицию.
+        Если другой воркер успел добавить блок раньше, выбрасывает BlockConflictError
+        (состояние хранилища при этом уже перечитано).
+        """
+        data = _encode(block)
+        block_hash = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                row = self._conn.execute(
+                    "SELECT position, block_hash FROM blocks ORDER BY position DESC LIMIT 1"
+                ).fetchone()
+                length, tip_hash = (row[0] + 1, row[1]) if row else (0, _GENESIS_PARENT)
+                if length != self._length:
+                    raise BlockConflictError(f"Ожидалась позиция {self._length}, хранилище уже содержит {length} блоков")
+                self._conn.execute(
+                    "INSERT INTO blocks (position, parent_hash, block_hash, data) VALUES (?, ?, ?, ?)",
+                    (length, tip_hash, block_hash, data),
+                )
+                self._conn.execute("COMMIT")
+            except (sqlite3.IntegrityError, BlockConflictError) as e:
+                self._conn.execute("ROLLBACK")
+                self._refresh(force=True)
+                raise e if isinstance(e, BlockConflictError) else BlockConflictError(str(e)) from e
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._length, self._tip_hash = length + 1, block_hash
+            self._data_version = self._read_data_version()
+        # Кэшируем декодированную копию, чтобы блок из кэша не отличался от прочитанного с диска
+        self._remember(length, _decode(data))
+        if self._length % LEDGER_CHECKPOINT_EVERY_BLOCKS == 0:
+            self.checkpoint()
+        return length
+
+    def replace_tail(self, start: int, blocks: List[Any]) -> None:
+        """
+        Заменяет блоки начиная с позиции `start` на `blocks` одной транзакцией.
+        Используется только консенсусом при переходе на более длинную цепочку.
+        """
+        rows = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                parent = self._conn.execute(
+                    "SELECT block_hash FROM blocks WHERE position = ?", (start - 1,)
+                ).fetchone()
+                parent_hash = parent[0] if parent else _GENESIS_PARENT
+                for offset, block in enumerate(blocks):
+                    data = _encode(block)
+                    block_hash = hashlib.sha256(data).hexdigest()
+                    rows.append((start + offset, parent_hash, block_hash, data))
+                    parent_hash = block_hash
+                self._conn.execute("DELETE FROM blocks WHERE position >= ?", (start,))
+                self._conn.executemany(
+                    "INSERT INTO blocks (position, parent_hash, block_hash, data) VALUES (?, ?, ?, ?)", rows
+                )
+                # Снимки за пределами общей части цепочки больше не действительны
+                self._conn.execute("DELETE FROM snapshots WHERE chain_length > ?", (start,))
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('generation', 1) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._refresh(force=True)
+
+    def checkpoint(self) -> None:
+        """Фиксирует проверенную длину цепочки и переносит WAL в основной файл."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO snapshots (chain_length, tip_hash, created_at) VALUES (?, ?, ?)",
+                (self._length, self._tip_hash, time.time()),
+            )
+            self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def replay(self) -> int:
+        """
+        Проверяет блоки, записанные после последнего снимка, и возвращает длину цепочки.
+        Выбрасывает BlockStoreCorrupted при несовпадении хэшей.
+        """
+        with self._lock:
+            snapshot = self._conn.execute(
+                "SELECT chain_length, tip_hash FROM snapshots ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+            start, parent = snapshot if snapshot else (0, _GENESIS_PARENT)
+            rows = self._conn.execute(
+                "SELECT position, parent_hash, block_hash, data FROM blocks WHERE position >= ? ORDER BY position",
+                (start,),
+            )
+            for position, parent_hash, block_hash, data in rows:
+                if parent_hash != parent or hashlib.sha256(data).hexdigest() != block_hash:
+                    raise BlockStoreCorrupted(f"Блок на позиции {position} поврежден")
+                parent = block_hash
+        self._refresh(force=True)
+        logger.info("Хранилище блоков %s: %s блоков, проверено с позиции %s", self.path, self._length, start)
+        return self._length
+
+    def spill_pending(self, transactions: List[Any]) -> None:
+        """Сохраняет транзакции пула при остановке воркера, чтобы они не потерялись."""
+        if not transactions:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO spilled_transactions (data) VALUES (?)", [(_encode(tx),) for tx in transactions]
+            )
+
+    def claim_pending(self) -> List[Any]:
+        """Забирает транзакции, сохраненные остановленными воркерами (каждую получит один воркер)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute("SELECT id, data FROM spilled_transactions ORDER BY id").fetchall()
+                self._conn.execute("DELETE FROM spilled_transactions")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [_decode(data) for _, data in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # --- Внутреннее ---
+
+    def _remember(self, position: int, block: Any) -> None:
+        with self._lock:
+            self._cache[position] = block
+            self._cache.move_to_end(position)
+            while len(self._cache) > self._cache_blocks:
+                self._cache.popitem(last=False)
+
+    def _read_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _refresh(self, force: bool = False) -> None:
+        """Перечитывает длину цепочки, если другой воркер изменил файл."""
+        with self._lock:
+            version = self._read_data_version()
+            if not force and version == self._data_version:
+                return
+            row = self._conn.execute(
+                "SELECT position, block_hash FROM blocks ORDER BY position DESC LIMIT 1"
+            ).fetchone()
+            self._length, self._tip_hash = (row[0] + 1, row[1]) if row else (0, _GENESIS_PARENT)
+            self._data_version = version
+            generation = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+            generation = generation[0] if generation else 0
+            if generation != self._generation:
+                # Хвост цепочки был заменен: закэшированные блоки могли устареть
+                self._cache.clear()
+                self._generation = generation
+
+
+class PersistentChain(MutableSequence):
+    """
+    Цепочка блоков для BlockchainLedger.chain, хранящаяся в BlockStore.
+
+    Ведет себя как список (len, индексы, срезы, итерация, append), но в памяти
+    держит только недавно прочитанные блоки. Все воркеры видят одну цепочку.
+    Блоки только добавляются: изменение и удаление не поддерживаются
+    (замена хвоста при консенсусе - через BlockStore.replace_tail).
+    """
+
+    def __init__(self, store: BlockStore, on_append: Optional[Callable[[Any], Any]] = None):
+        """
+        :param on_append: Вызывается с блоком перед записью и возвращает блок для записи
+            (например, LedgerIndex.seal_block добавляет корень дерева Меркла).
+        """
+        self.store = store
+        self.on_append = on_append
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __getitem__(self, index):
+        length = len(self.store)
+        if isinstance(index, slice):
+            return [self.store.get(i) for i in range(*index.indices(length))]
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("индекс блока вне цепочки")
+        return self.store.get(index)
+
+    def __iter__(self) -> Iterator[Any]:
+        return self.store.iter_blocks()
+
+    def append(self, block: Any) -> None:
+        if self.on_append is not None:
+            block = self.on_append(block)
+        self.store.append(block)
+
+    def insert(self, index: int, block: Any) -> None:
+        if index != len(self.store):
+            raise BlockStoreError("Цепочка поддерживает только добавление в конец")
+        self.append(block)
+
+    def __setitem__(self, index, value) -> None:
+        raise BlockStoreError("Блоки цепочки неизменяемы")
+
+    def __delitem__(self, index) -> None:
+        raise BlockStoreError("Блоки цепочки неизменяемы")
+
+
+def open_persistent_ledger(ledger: Any, path: str = LEDGER_STORE_PATH) -> Tuple[BlockStore, int]:
+    """
+    Переключает ledger.chain на хранилище на диске.
+
+    Если хранилище пустое, в него записывается текущая цепочка леджера
+    (обычно генезис-блок). В пул добавляются транзакции, сохраненные
+    остановленными воркерами. Возвращает хранилище и число восстановленных транзакций.
+    """
+    store = BlockStore(path)
+    store.replay()
+    if len(store) == 0:
+        try:
+            for block in ledger.chain:
+                store.append(block)
+        except BlockConflictError:
+            # Цепочку одновременно инициализировал другой воркер - используем его генезис
+            pass
+    ledger.chain = PersistentChain(store)
+    restored = store.claim_pending()
+    ledger.pending_transactions.extend(restored)
+    return store, len(restored)
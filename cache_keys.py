@@ -0,0 +1,134 @@
+import dataclasses
+import hashlib
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Dict, Optional
+from uuid import UUID
+
+# Префикс всех ключей, которые строит redis_cache.
+CACHE_KEY_PREFIX = "cache"
+# Аргументы длиннее этого (в символах канонической записи) заменяются хэшем.
+CACHE_KEY_MAX_ARG_LENGTH = int(os.getenv("CACHE_KEY_MAX_ARG_LENGTH", "64"))
+# Если ключ целиком длиннее, хэшируется вся часть с аргументами.
+CACHE_KEY_MAX_LENGTH = int(os.getenv("CACHE_KEY_MAX_LENGTH", "250"))
+# Длина хэша в байтах (в ключе - вдвое больше hex-символов).
+_DIGEST_SIZE = 16
+
+class UncacheableArgument(TypeError):
+    """Аргумент не имеет стабильного представления для ключа кэша."""
+
+
+def _to_builtin(value: Any) -> Any:
+    """dataclass и pydantic-модели в ключе описываются значениями своих полей."""
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    raise TypeError(f"Тип {type(value).__name__} не поддерживается")
+
+
+def _digest(text: str) -> str:
+    return "h:" + hashlib.blake2b(text.encode(), digest_size=_DIGEST_SIZE).hexdigest()
+
+
+def _sequence(tag: str, parts) -> str:
+    # Каждый элемент с префиксом длины: запятые и скобки внутри элементов не делают запись неоднозначной
+    return tag + "".join(f"{len(part)}.{part}" for part in parts)
+
+
+def _canonical(value: Any) -> str:
+    """
+    Стабильная и однозначная запись значения: первый символ - тип
+    (1 и "1", None и "None" различаются), элементы коллекций с префиксом длины.
+    Не зависит от адресов в памяти и от порядка ключей словарей и элементов множеств.
+    """
+    if value is None:
+        return "n"
+    if isinstance(value, bool):
+        return "b1" if value else "b0"
+    if isinstance(value, Enum):
+        return "e" + _canonical(value.value)
+    if isinstance(value, str):
+        return "s" + value
+    if isinstance(value, int):
+        return f"i{int(value)}"
+    if isinstance(value, float):
+        return "f" + repr(float(value))
+    if isinstance(value, Decimal):
+        return "d" + str(value)
+    if isinstance(value, UUID):
+        return "u" + value.hex
+    if isinstance(value, datetime):
+        return "t" + value.isoformat()
+    if isinstance(value, date):
+        return "D" + value.isoformat()
+    if isinstance(value, bytes):
+        return "x" + hashlib.blake2b(value, digest_size=_DIGEST_SIZE).hexdigest()
+    if isinstance(value, list):
+        return _sequence("l", (_canonical(item) for item in value))
+    if isinstance(value, tuple):
+        return _sequence("T", (_canonical(item) for item in value))
+    if isinstance(value, (set, frozenset)):
+        return _sequence("S", sorted(_canonical(item) for item in value))
+    if isinstance(value, dict):
+        pairs = sorted((_canonical(k), _canonical(v)) for k, v in value.items())
+        return _sequence("m", (part for pair in pairs for part in pair))
+    try:
+        return _sequence("o", (type(value).__qualname__, _canonical(_to_builtin(value))))
+    except TypeError:
+        raise UncacheableArgument(
+            f"Аргумент типа {type(value).__name__} нельзя использовать в ключе кэша; "
+            "передайте key_func в redis_cache"
+        ) from None
+
+
+def _bounded(value: Any) -> str:
+    """
+    Запись значения в ключе. Строки остаются читаемыми, остальные значения
+    пишутся типизированной записью после "%" (в экранированной строке за "%"
+    всегда идет цифра); длинные значения заменяются хэшем.
+    """
+    plain = type(value) is str
+    text = value if plain else _canonical(value)
+    if len(text) > CACHE_KEY_MAX_ARG_LENGTH:
+        return _digest(_canonical(value))
+    # Двоеточие - разделитель частей ключа, в значении оно сделало бы ключ неоднозначным
+    escaped = text.replace("%", "%25").replace(":", "%3A")
+    return escaped if plain else "%" + escaped
+
+
+def function_namespace(func: Callable) -> str:
+    """Пространство имен функции по умолчанию: модуль и полное имя (с классом)."""
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def make_cache_key(
+    namespace: str,
+    arguments: Dict[str, Any],
+    version: Optional[int] = None,
+    key_func: Optional[Callable[..., Any]] = None,
+) -> str:
+    """
+    Строит ключ вида "cache:<namespace>[:v<version>]:<имя>=<значение>:...".
+
+    :param namespace: Пространство имен (обычно function_namespace(func)).
+    :param arguments: Аргументы вызова по имени, уже без self и сессий БД.
+    :param version: Версия формата результата; увеличение сбрасывает старые записи.
+    :param key_func: Функция, получающая аргументы по имени и возвращающая
+        значимую для кэша часть (строку, кортеж или словарь).
+    """
+    parts = [CACHE_KEY_PREFIX, namespace]
+    if version is not None:
+        parts.append(f"v{version}")
+    prefix = ":".join(parts)
+
+    if key_func is not None:
+        body = _bounded(key_func(**arguments))
+    else:
+        body = ":".join(f"{name}={_bounded(value)}" for name, value in arguments.items())
+
+    if len(prefix) + len(body) + 1 > CACHE_KEY_MAX_LENGTH:
+        body = _digest(body)
+    return f"{prefix}:{body}" if body else prefix
@@ -1,25 +1,558 @@
+import asyncio
+import copy
+import inspect
 import json
+import logging
+import os
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from functools import wraps
-from typing import Callable, Coroutine, Any
+from typing import Awaitable, Callable, Coroutine, Any, Dict, Iterable, List, Optional, Sequence, Union
+from uuid import uuid4
 
+from opentelemetry import metrics
 
-def _generate_cache_key(func: Callable, *args, **kwargs) -> str:
-    """Генерирует уникальный ключ для кэша на основе имени функции и аргументов."""
-    key_parts = [func.__name__]
-    # Пропускаем 'self' и 'db_session' из ключа
-    key_parts.extend(map(str, (arg for arg in args if not (hasattr(arg, '__class__') and arg.__class__.__name__ == 'AsyncSession'))))
-    key_parts.extend(f"{k}={v}" for k, v in sorted(kwargs.items()) if k != 'db_session')
-    cache_key = f"cache:{':'.join(key_parts)}"
-    return cache_key
+from .cache_keys import UncacheableArgument, function_namespace, make_cache_key
+from .codec import CODEC_VERSION, decode, encode
 
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
 
-def redis_cache(expiration: int = 3600):
+# Максимальное количество записей в локальном (in-process) кэше одного воркера.
+CACHE_LOCAL_MAX_SIZE = int(os.getenv("CACHE_LOCAL_MAX_SIZE", "10000"))
+# Локальная копия живет не дольше этого времени, даже если TTL в Redis больше.
+CACHE_LOCAL_TTL_SECONDS = int(os.getenv("CACHE_LOCAL_TTL_SECONDS", "60"))
+# Канал Redis Pub/Sub, через который воркеры сообщают друг другу об инвалидации.
+CACHE_INVALIDATION_CHANNEL = "cache:invalidate"
+# Как часто подписчик проверяет, не пора ли ему остановиться.
+CACHE_PUBSUB_POLL_SECONDS = 1.0
+# Время жизни межворкерной блокировки на пересчет ключа.
+CACHE_LOCK_TIMEOUT_SECONDS = int(os.getenv("CACHE_LOCK_TIMEOUT_SECONDS", "10"))
+# Как часто воркер, не получивший блокировку, проверяет появление значения.
+CACHE_LOCK_POLL_SECONDS = 0.05
+# Сколько помнить время инвалидации тега (должно превышать время самого долгого вычисления).
+CACHE_TAG_STAMP_TTL_SECONDS = 3600
+
+# Снимает блокировку, только если она все еще принадлежит нам.
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Метрики по уровням кэша: tier = "local" | "redis", result = "hit" | "miss".
+cache_requests_counter = meter.create_counter(
+    "cache.requests", description="Количество обращений к кэшу по уровням и результатам"
+)
+cache_latency_histogram = meter.create_histogram(
+    "cache.latency", unit="ms", description="Время обращения к уровню кэша"
+)
+
+# Маркер отсутствия значения (None - валидный результат функции).
+MISSING = object()
+
+
+class LocalCache:
+    """
+    Ограниченный по размеру LRU-кэш с TTL в памяти процесса.
+    Значения возвращаются "как есть", без копирования, поэтому их нельзя изменять.
+    """
+
+    def __init__(self, max_size: int = CACHE_LOCAL_MAX_SIZE, default_ttl: int = CACHE_LOCAL_TTL_SECONDS):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        ttl = self.default_ttl if ttl is None else min(ttl, self.default_ttl)
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TwoTierCache:
     """
-    Асинхронный декоратор для кэширования результатов функций в Redis.
+    Двухуровневый кэш: локальный LRU воркера перед общим Redis.
+
+    Чтение сначала идет в локальный уровень и только при промахе - в Redis.
+    Записи и удаления публикуются в канал инвалидации, чтобы остальные
+    воркеры сбросили свои локальные копии.
+    """
+
+    def __init__(self, redis, local: Optional[LocalCache] = None):
+        # Текстовый клиент - для блокировок и Pub/Sub, бинарный - для значений
+        self.redis = redis
+        self.raw = binary_client(redis)
+        self.local = local if local is not None else LocalCache()
+        # Идентификатор воркера, чтобы игнорировать собственные сообщения об инвалидации
+        self.node_id = uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing = False
+        # Текущие вычисления по ключам (single-flight внутри воркера)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def get(self, key: str) -> Any:
+        """Возвращает свежее значение из кэша или MISSING."""
+        entry = await self._get_entry(key)
+        if entry is MISSING or entry[0] <= time.time():
+            return MISSING
+        return entry[1]
+
+    async def set(
+        self,
+        key: str,
+        value: Any,
+        expiration: int,
+        stale_ttl: int = 0,
+        tags: Iterable[str] = (),
+        computed_since: Optional[float] = None,
+    ) -> None:
+        """
+        Сохраняет значение в оба уровня.
+        Значение считается свежим `expiration` секунд и еще `stale_ttl` секунд
+        может отдаваться как устаревшее, пока идет фоновое обновление.
+        Теги (например, "user:42", "waqf:list") позволяют позже сбросить запись
+        через invalidate_tags. Если указан `computed_since` и какой-либо из тегов
+        был инвалидирован после этого момента, значение не сохраняется.
+        Выбрасывает TypeError/OverflowError/ValueError, если значение не сериализуется.
+        """
+        tags = list(tags)
+        if tags and computed_since is not None and await self._invalidated_since(tags, computed_since):
+            # Значение вычислено по данным, которые уже изменились
+            return
+
+        ttl = expiration + stale_ttl
+        fresh_until = time.time() + expiration
+        payload = encode({"v": value, "exp": fresh_until})
+        await self.raw.set(self._storage_key(key), payload, ex=ttl)
+        if tags:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for tag in tags:
+                    tag_key = self._tag_key(tag)
+                    pipe.sadd(tag_key, key)
+                    # Множество тегов живет не меньше самой долгоживущей записи в нем
+                    pipe.expire(tag_key, ttl, nx=True)
+                    pipe.expire(tag_key, ttl, gt=True)
+                await pipe.execute()
+        # Локально храним собственную копию значения: последующие изменения объекта
+        # вызывающим кодом не попадают в кэш
+        self.local.set(key, (fresh_until, copy.deepcopy(value)), ttl)
+        await self._publish(key)
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        expiration: int,
+        stale_ttl: int = 0,
+        refresh: Optional[Callable[[], Awaitable[Any]]] = None,
+        tags: Iterable[str] = (),
+    ) -> Any:
+        """
+        Возвращает значение из кэша, а при промахе вычисляет его ровно один раз.
+
+        - Внутри воркера конкурентные промахи по одному ключу ждут одно вычисление.
+        - Между воркерами вычисление защищено блокировкой в Redis: остальные
+          воркеры ждут появления значения, а не идут в БД одновременно.
+        - Если stale_ttl > 0, устаревшее значение отдается сразу, а обновление
+          выполняется в фоне функцией `refresh` (по умолчанию - `compute`).
+        - Значение помечается тегами `tags` для последующей инвалидации.
+        """
+        tags = tuple(tags)
+        entry = await self._get_entry(key)
+        if entry is not MISSING:
+            fresh_until, value = entry
+            if fresh_until > time.time():
+                return value
+            if stale_ttl > 0:
+                self._refresh_in_background(key, refresh or compute, expiration, stale_ttl, tags)
+                return value
+
+        return await self._single_flight(
+            key, lambda: self._load(key, compute, expiration, stale_ttl, tags, wait_for_owner=True)
+        )
+
+    async def delete(self, *keys: str) -> None:
+        """Удаляет ключи из обоих уровней на всех воркерах."""
+        if not keys:
+            return
+        self.local.delete(*keys)
+        await self.raw.delete(*(self._storage_key(key) for key in keys))
+        await self._publish(*keys)
+
+    async def invalidate_tags(self, *tags: str) -> int:
+        """
+        Сбрасывает на всех воркерах все записи, помеченные любым из тегов.
+        Возвращает количество сброшенных ключей.
+        """
+        if not tags:
+            return 0
+        now = time.time()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for tag in tags:
+                pipe.smembers(self._tag_key(tag))
+                pipe.delete(self._tag_key(tag))
+                # Отметка нужна, чтобы вычисления, начатые до инвалидации, не записали устаревшие данные
+                pipe.set(self._tag_stamp_key(tag), now, ex=CACHE_TAG_STAMP_TTL_SECONDS)
+            results = await pipe.execute()
+
+        keys = set()
+        for members in results[0::3]:
+            keys.update(member.decode() if isinstance(member, bytes) else member for member in members)
+        await self.delete(*keys)
+        return len(keys)
+
+    async def close(self) -> None:
+        """Останавливает подписчика на канал инвалидации."""
+        self._closing = True
+        if self._listener is not None:
+            await asyncio.wait([self._listener], timeout=CACHE_PUBSUB_POLL_SECONDS * 2)
+            self._listener = None
+
+    def _record(self, tier: str, hit: bool, start: float) -> None:
+        attributes = {"tier": tier, "result": "hit" if hit else "miss"}
+        cache_requests_counter.add(1, attributes)
+        cache_latency_histogram.record((time.perf_counter() - start) * 1000, {"tier": tier})
+
+    async def _get_entry(self, key: str) -> Any:
+        """Возвращает (fresh_until, value) сначала из локального уровня, затем из Redis."""
+        self._ensure_listener()
+
+        start = time.perf_counter()
+        cached = self.local.get(key)
+        self._record("local", cached is not MISSING, start)
+        if cached is not MISSING:
+            # Локальный уровень хранит декодированное значение; каждый читатель
+            # получает свою копию и может менять ее, не затрагивая кэш
+            return cached[0], copy.deepcopy(cached[1])
+
+        start = time.perf_counter()
+        entry = await self._fetch(key)
+        self._record("redis", entry is not MISSING, start)
+        return entry
+
+    @staticmethod
+    def _storage_key(key: str) -> str:
+        # Версия кодека входит в ключ: воркеры со старым и новым форматом
+        # во время выкатки не читают значения друг друга.
+        return f"v{CODEC_VERSION}:{key}"
+
+    @staticmethod
+    def _tag_key(tag: str) -> str:
+        return f"cache:tag:{tag}"
+
+    @staticmethod
+    def _tag_stamp_key(tag: str) -> str:
+        return f"cache:tag-invalidated:{tag}"
+
+    async def _invalidated_since(self, tags: List[str], since: float) -> bool:
+        stamps = await self.redis.mget([self._tag_stamp_key(tag) for tag in tags])
+        return any(stamp is not None and float(stamp) >= since for stamp in stamps)
+
+    async def _fetch(self, key: str) -> Any:
+        """Читает запись из Redis и кладет декодированное значение в локальный уровень."""
+        payload = await self.raw.get(self._storage_key(key))
+        if payload is None:
+            return MISSING
+        entry = self._decode_entry(key, payload)
+        if entry is not MISSING:
+            # Локальная копия не переживет обновление: при пересчете ключа
+            # воркер-писатель публикует инвалидацию для остальных.
+            self.local.set(key, entry)
+            return entry[0], copy.deepcopy(entry[1])
+        return entry
+
+    @staticmethod
+    def _decode_entry(key: str, payload: bytes) -> Any:
+        """Декодирует запись в (fresh_until, value); старые или поврежденные значения считаются промахом."""
+        try:
+            data = decode(payload)
+            return data["exp"], data["v"]
+        except Exception as e:
+            # CodecError, ошибки JSON/распаковки и записи старого формата без "exp"/"v"
+            logger.warning("Не удалось декодировать значение кэша для ключа %s: %s", key, e)
+            return MISSING
+
+    async def _single_flight(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(loader())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: отмена одного ожидающего не должна отменять вычисление для остальных
+        return await asyncio.shield(future)
+
+    def _refresh_in_background(self, key: str, refresh, expiration: int, stale_ttl: int, tags: tuple) -> None:
+        if key in self._inflight:
+            return
+        future = asyncio.ensure_future(self._load(key, refresh, expiration, stale_ttl, tags, wait_for_owner=False))
+        self._inflight[key] = future
+
+        def _done(task: asyncio.Future) -> None:
+            self._inflight.pop(key, None)
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning("Фоновое обновление кэша для ключа %s не удалось: %s", key, task.exception())
+
+        future.add_done_callback(_done)
+
+    async def _load(self, key: str, compute, expiration: int, stale_ttl: int, tags: tuple, wait_for_owner: bool) -> Any:
+        """Вычисляет значение под межворкерной блокировкой и сохраняет его в кэш."""
+        lock_key = f"lock:{key}"
+        token = uuid4().hex
+        if not await self.redis.set(lock_key, token, nx=True, ex=CACHE_LOCK_TIMEOUT_SECONDS):
+            if not wait_for_owner:
+                # Значение уже обновляет другой воркер
+                return MISSING
+            value = await self._wait_for_owner(key)
+            if value is not MISSING:
+                return value
+            # Владелец блокировки не успел (или упал) - вычисляем сами
+            return await self._compute_and_store(key, compute, expiration, stale_ttl, tags)
+
+        try:
+            return await self._compute_and_store(key, compute, expiration, stale_ttl, tags)
+        finally:
+            await self.redis.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+    async def _wait_for_owner(self, key: str) -> Any:
+        """Ждет, пока воркер-владелец блокировки положит свежее значение в Redis."""
+        deadline = time.monotonic() + CACHE_LOCK_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(CACHE_LOCK_POLL_SECONDS)
+            entry = await self._fetch(key)
+            if entry is not MISSING and entry[0] > time.time():
+                return entry[1]
+        return MISSING
+
+    async def _compute_and_store(self, key: str, compute, expiration: int, stale_ttl: int, tags: tuple) -> Any:
+        started = time.time()
+        value = await compute()
+        try:
+            await self.set(key, value, expiration, stale_ttl, tags=tags, computed_since=started)
+        except (TypeError, OverflowError, ValueError) as e:
+            # Не удалось сериализовать, просто пропускаем кэширование
+            logger.warning("Не удалось кэшировать результат для ключа %s: %s", key, e)
+        return value
+
+    async def _publish(self, *keys: str) -> None:
+        message = json.dumps({"origin": self.node_id, "keys": list(keys)})
+        await self.redis.publish(CACHE_INVALIDATION_CHANNEL, message)
+
+    def _ensure_listener(self) -> None:
+        """Лениво запускает подписчика на канал инвалидации в текущем event loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._listener is not None and not self._listener.done():
+            return
+        self._loop = loop
+        self._closing = False
+        self._listener = loop.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        # Используем опрос get_message с таймаутом вместо listen(): так подписчик
+        # гарантированно замечает остановку и не зависает на пустом канале.
+        while not self._closing:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                while not self._closing:
+                    message = await pubsub.get_message(timeout=CACHE_PUBSUB_POLL_SECONDS)
+                    if message is None:
+                        continue
+                    data = json.loads(message["data"])
+                    if data.get("origin") != self.node_id:
+                        self.local.delete(*data.get("keys", []))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Пока подписка не работает, локальный уровень может устареть - сбрасываем его.
+                logger.warning("Подписка на инвалидацию кэша прервана, локальный кэш сброшен: %s", e)
+                self.local.clear()
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+
+_binary_clients: "weakref.WeakKeyDictionary[Any, Any]" = weakref.WeakKeyDictionary()
+
+
+def binary_client(redis):
+    """
+    Возвращает клиент Redis без декодирования ответов, использующий те же
+    настройки подключения. Нужен для хранения бинарных значений кодека,
+    так как основной клиент приложения создан с decode_responses=True.
+    """
+    pool = getattr(redis, "connection_pool", None)
+    if pool is None or not pool.connection_kwargs.get("decode_responses"):
+        return redis
+    client = _binary_clients.get(redis)
+    if client is None:
+        binary_pool = pool.__class__(
+            connection_class=pool.connection_class,
+            max_connections=pool.max_connections,
+            **{**pool.connection_kwargs, "decode_responses": False},
+        )
+        client = redis.__class__(connection_pool=binary_pool)
+        _binary_clients[redis] = client
+    return client
+
+
+_engines: "weakref.WeakKeyDictionary[Any, TwoTierCache]" = weakref.WeakKeyDictionary()
+
+
+def get_cache_engine(redis) -> TwoTierCache:
+    """Возвращает общий для воркера двухуровневый кэш поверх указанного клиента Redis."""
+    engine = _engines.get(redis)
+    if engine is None:
+        engine = TwoTierCache(redis)
+        _engines[redis] = engine
+    return engine
+
+
+def _is_db_session(value: Any) -> bool:
+    return hasattr(value, '__class__') and value.__class__.__name__ == 'AsyncSession'
+
+
+@asynccontextmanager
+async def _fresh_db_sessions(args: tuple, kwargs: dict):
+    """
+    Подменяет сессии БД в аргументах на новые, привязанные к тому же движку.
+    Нужно для фонового обновления: сессия исходного запроса к этому моменту
+    уже может быть закрыта.
+    """
+    opened = []
+
+    def replace(value):
+        if not _is_db_session(value):
+            return value
+        session = value.__class__(bind=value.bind, expire_on_commit=False)
+        opened.append(session)
+        return session
+
+    try:
+        yield tuple(replace(arg) for arg in args), {k: replace(v) for k, v in kwargs.items()}
+    finally:
+        for session in opened:
+            await session.close()
+
+
+# Ключ в Session.info, где копятся теги для инвалидации после коммита.
+_DEFERRED_TAGS_KEY = "cache_invalidation_tags"
+
+
+async def invalidate_tags(redis, *tags: str) -> int:
+    """
+    Сбрасывает все закэшированные результаты, помеченные тегами.
+
+    Соглашение по тегам: "<сущность>:<id>" для конкретных объектов
+    ("user:42", "waqf:7", "vacancy:13") и "<сущность>:list" для списков,
+    которые зависят от любого объекта этого типа ("waqf:list").
+    """
+    if redis is None or not tags:
+        return 0
+    return await get_cache_engine(redis).invalidate_tags(*tags)
+
+
+def defer_invalidation(db_session, *tags: str) -> None:
+    """
+    Откладывает инвалидацию тегов до успешного коммита сессии.
+    Модули вызывают это при записи, а MubarakAI.process_request сбрасывает
+    теги после commit (или отбрасывает их при rollback).
+    """
+    db_session.info.setdefault(_DEFERRED_TAGS_KEY, set()).update(tags)
+
+
+async def flush_deferred_invalidations(redis, db_session) -> int:
+    """Выполняет отложенную инвалидацию. Вызывается после успешного коммита."""
+    tags = db_session.info.pop(_DEFERRED_TAGS_KEY, None)
+    if not tags:
+        return 0
+    return await invalidate_tags(redis, *sorted(tags))
+
+
+def discard_deferred_invalidations(db_session) -> None:
+    """Отбрасывает отложенную инвалидацию. Вызывается после rollback."""
+    db_session.info.pop(_DEFERRED_TAGS_KEY, None)
+
+
+def redis_cache(
+    expiration: int = 3600,
+    stale_while_revalidate: int = 0,
+    tags: Union[Sequence[str], Callable[..., Iterable[str]]] = (),
+    key_func: Optional[Callable[..., Any]] = None,
+    namespace: Optional[str] = None,
+    version: Optional[int] = None,
+):
+    """
+    Асинхронный декоратор для кэширования результатов функций
+    в двухуровневом кэше (память воркера + Redis).
+
+    Одновременные промахи по одному ключу приводят к одному вызову функции
+    (внутри воркера и между воркерами).
 
     :param expiration: Время жизни кэша в секундах.
+    :param stale_while_revalidate: Сколько секунд после истечения `expiration`
+        отдавать устаревшее значение, пока оно обновляется в фоне. 0 - отключено.
+    :param tags: Теги записи для invalidate_tags. Либо шаблоны, которые
+        заполняются аргументами функции (например, ("user:{user_id}", "waqf:list")),
+        либо функция, принимающая аргументы по имени и возвращающая теги.
+    :param key_func: Функция, принимающая аргументы по имени и возвращающая
+        значимую для ключа часть. По умолчанию в ключ идут все аргументы,
+        кроме self и сессий БД.
+    :param namespace: Пространство имен ключа. По умолчанию - модуль и имя функции.
+    :param version: Версия результата; ее увеличение делает старые записи недоступными.
     """
     def decorator(func: Callable[..., Coroutine[Any, Any, Any]]):
+        signature = inspect.signature(func)
+        key_namespace = namespace or function_namespace(func)
+
+        def bind_arguments(args: tuple, kwargs: dict) -> Dict[str, Any]:
+            """Аргументы вызова по имени (с учетом значений по умолчанию), без self и сессий БД."""
+            bound = signature.bind(None, *args, **kwargs)
+            bound.apply_defaults()
+            return {
+                name: value
+                for name, value in list(bound.arguments.items())[1:]
+                if name != 'db_session' and not _is_db_session(value)
+            }
+
+        def resolve_tags(arguments: Dict[str, Any]) -> tuple:
+            if not tags:
+                return ()
+            if callable(tags):
+                return tuple(tags(**arguments))
+            return tuple(template.format(**arguments) for template in tags)
+
         @wraps(func)
         async def wrapper(self, *args, **kwargs):
             # Ожидается, что у объекта 'self' есть атрибут 'redis'
@@ -27,26 +560,26 @@ def redis_cache(expiration: int = 3600):
                 # Если Redis не настроен, просто вызываем функцию
                 return await func(self, *args, **kwargs)
 
-            cache_key = _generate_cache_key(func, *args, **kwargs)
-
-            # 1. Попытка получить данные из кэша
-            cached_result = await self.redis.get(cache_key)
-            if cached_result:
-                # Если данные найдены, десериализуем и возвращаем их
-                return json.loads(cached_result)
-
-            # 2. Если в кэше данных нет (cache miss)
-            # Выполняем оригинальную функцию для получения данных из БД
-            result = await func(self, *args, **kwargs)
-
-            # 3. Сериализуем результат в JSON и сохраняем в Redis с указанным временем жизни
+            arguments = bind_arguments(args, kwargs)
             try:
-                json_result = json.dumps(result)
-                await self.redis.setex(cache_key, expiration, json_result)
-            except (TypeError, OverflowError) as e:
-                # Не удалось сериализовать, просто пропускаем кэширование
-                self.logger.warning(f"Не удалось кэшировать результат для ключа {cache_key}: {e}")
+                cache_key = make_cache_key(key_namespace, arguments, version=version, key_func=key_func)
+            except UncacheableArgument as e:
+                logger.warning("Кэш для %s пропущен: %s", key_namespace, e)
+                return await func(self, *args, **kwargs)
+            cache = get_cache_engine(self.redis)
+
+            async def refresh():
+                async with _fresh_db_sessions(args, kwargs) as (fresh_args, fresh_kwargs):
+                    return await func(self, *fresh_args, **fresh_kwargs)
 
-            return result
+            # Сначала локальный уровень, затем Redis; при промахе - один вызов функции
+            return await cache.get_or_compute(
+                cache_key,
+                lambda: func(self, *args, **kwargs),
+                expiration,
+                stale_ttl=stale_while_revalidate,
+                refresh=refresh,
+                tags=resolve_tags(arguments),
+            )
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
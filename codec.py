@@ -0,0 +1,304 @@
+import base64
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Dict, Tuple, Union
+from uuid import UUID
+
+# Необязательные зависимости: быстрые сериализаторы и компрессоры.
+# Если пакет не установлен, кодек использует следующий доступный вариант.
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover
+    lz4_frame = None
+
+# Версия формата. Увеличивается при любом несовместимом изменении кодека;
+# значения с неизвестной версией считаются промахом кэша.
+# 2 - типизированные значения в JSON-форматах, tuple и set в msgpack.
+CODEC_VERSION = 2
+
+# Первый байт закодированного значения. 0xC1 не используется ни в msgpack,
+# ни в UTF-8, поэтому его нельзя спутать со старыми JSON-строками.
+MAGIC = b"\xc1"
+HEADER_SIZE = 4  # MAGIC + версия + сериализатор + компрессор
+
+SERIALIZER_MSGPACK = 1
+SERIALIZER_ORJSON = 2
+SERIALIZER_JSON = 3
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZSTD = 1
+COMPRESSION_LZ4 = 2
+
+# Значения меньше порога (в байтах) не сжимаются: на маленьких данных это только трата CPU.
+CACHE_COMPRESSION_THRESHOLD = int(os.getenv("CACHE_COMPRESSION_THRESHOLD", "1024"))
+
+# Типы расширений msgpack для типов, которые нужно восстанавливать при чтении
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+_EXT_DECIMAL = 3
+_EXT_UUID = 4
+_EXT_TUPLE = 5
+_EXT_SET = 6
+_EXT_FROZENSET = 7
+
+# Ключ-метка типизированного значения в JSON-форматах: {"\x00t": [тип, данные]}.
+# Словари с таким ключом или с нестроковыми ключами тоже записываются с меткой.
+_TAG = "\x00t"
+_TAG_JSON = json.dumps(_TAG).encode()
+
+
+class CodecError(ValueError):
+    """Значение не может быть декодировано этой версией кодека."""
+
+
+def _unsupported(value: Any) -> TypeError:
+    """
+    dataclass, pydantic-модели, Enum и прочие объекты не кодируются: после чтения
+    из кэша они вернулись бы словарями и строками, то есть другим типом, чем при
+    промахе. Такие значения нужно приводить к базовым типам до кэширования.
+    """
+    return TypeError(f"Тип {type(value).__name__} не поддерживается кодеком кэша")
+
+
+def _msgpack_default(value: Any) -> Any:
+    # strict_types=True: сюда приходят и подклассы базовых типов (tuple, Enum на основе str/int)
+    if isinstance(value, Enum):
+        raise _unsupported(value)
+    if isinstance(value, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, value.isoformat().encode())
+    if isinstance(value, date):
+        return msgpack.ExtType(_EXT_DATE, value.isoformat().encode())
+    if isinstance(value, Decimal):
+        return msgpack.ExtType(_EXT_DECIMAL, str(value).encode())
+    if isinstance(value, UUID):
+        return msgpack.ExtType(_EXT_UUID, value.bytes)
+    if isinstance(value, tuple):
+        return msgpack.ExtType(_EXT_TUPLE, _dumps_msgpack(list(value)))
+    if isinstance(value, frozenset):
+        return msgpack.ExtType(_EXT_FROZENSET, _dumps_msgpack(list(value)))
+    if isinstance(value, set):
+        return msgpack.ExtType(_EXT_SET, _dumps_msgpack(list(value)))
+    for base in (dict, list, str, bytes, int, float):
+        if isinstance(value, base):
+            # defaultdict, OrderedDict и т.п. сравниваются равными базовому типу
+            return base(value)
+    raise _unsupported(value)
+
+
+def _msgpack_ext_hook(code: int, data: bytes) -> Any:
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == _EXT_DATE:
+        return date.fromisoformat(data.decode())
+    if code == _EXT_DECIMAL:
+        return Decimal(data.decode())
+    if code == _EXT_UUID:
+        return UUID(bytes=data)
+    if code == _EXT_TUPLE:
+        return tuple(_loads_msgpack(data))
+    if code == _EXT_SET:
+        return set(_loads_msgpack(data))
+    if code == _EXT_FROZENSET:
+        return frozenset(_loads_msgpack(data))
+    return msgpack.ExtType(code, data)
+
+
+def _to_text(value: Any) -> Any:
+    """Для JSON-форматов: заменяет типы, которых нет в JSON, словарями с меткой _TAG."""
+    if value is None or type(value) in (bool, str, int, float):
+        return value
+    if isinstance(value, Enum):
+        raise _unsupported(value)
+    for base in (str, int, float):
+        if isinstance(value, base):
+            return base(value)
+    if isinstance(value, dict):
+        if _TAG not in value and all(type(key) is str for key in value):
+            return {key: _to_text(item) for key, item in value.items()}
+        return {_TAG: ["map", [[_to_text(key), _to_text(item)] for key, item in value.items()]]}
+    if isinstance(value, list):
+        return [_to_text(item) for item in value]
+    if isinstance(value, tuple):
+        return {_TAG: ["tuple", [_to_text(item) for item in value]]}
+    if isinstance(value, (set, frozenset)):
+        kind = "frozenset" if isinstance(value, frozenset) else "set"
+        return {_TAG: [kind, [_to_text(item) for item in value]]}
+    if isinstance(value, datetime):
+        return {_TAG: ["datetime", value.isoformat()]}
+    if isinstance(value, date):
+        return {_TAG: ["date", value.isoformat()]}
+    if isinstance(value, Decimal):
+        return {_TAG: ["decimal", str(value)]}
+    if isinstance(value, UUID):
+        return {_TAG: ["uuid", str(value)]}
+    if isinstance(value, bytes):
+        return {_TAG: ["bytes", base64.b64encode(value).decode()]}
+    raise _unsupported(value)
+
+
+_FROM_TEXT: Dict[str, Callable[[Any], Any]] = {
+    "map": lambda pairs: {key: item for key, item in pairs},
+    "tuple": tuple,
+    "set": set,
+    "frozenset": frozenset,
+    "datetime": datetime.fromisoformat,
+    "date": date.fromisoformat,
+    "decimal": Decimal,
+    "uuid": UUID,
+    "bytes": base64.b64decode,
+}
+
+
+def _tagged_object(obj: Dict[str, Any]) -> Any:
+    """object_hook для json.loads: вложенные значения к этому моменту уже восстановлены."""
+    if len(obj) == 1 and _TAG in obj:
+        kind, data = obj[_TAG]
+        return _FROM_TEXT[kind](data)
+    return obj
+
+
+def _from_text(value: Any) -> Any:
+    """Обратное к _to_text для разобранного JSON (orjson не поддерживает object_hook)."""
+    if isinstance(value, list):
+        return [_from_text(item) for item in value]
+    if isinstance(value, dict):
+        return _tagged_object({key: _from_text(item) for key, item in value.items()})
+    return value
+
+
+def _dumps_msgpack(value: Any) -> bytes:
+    return msgpack.packb(value, default=_msgpack_default, use_bin_type=True, datetime=False, strict_types=True)
+
+
+def _loads_msgpack(data: bytes) -> Any:
+    return msgpack.unpackb(data, ext_hook=_msgpack_ext_hook, raw=False, strict_map_key=False, use_list=True)
+
+
+def _dumps_orjson(value: Any) -> bytes:
+    return orjson.dumps(_to_text(value))
+
+
+def _loads_orjson(data: bytes) -> Any:
+    value = orjson.loads(data)
+    # Обход нужен, только если в значении есть типизированные элементы
+    return _from_text(value) if _TAG_JSON in data else value
+
+
+def _dumps_json(value: Any) -> bytes:
+    return json.dumps(_to_text(value), separators=(",", ":")).encode()
+
+
+def _loads_json(data: bytes) -> Any:
+    return json.loads(data, object_hook=_tagged_object)
+
+
+_SERIALIZERS: Dict[int, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]] = {
+    SERIALIZER_JSON: (_dumps_json, _loads_json),
+}
+if msgpack is not None:
+    _SERIALIZERS[SERIALIZER_MSGPACK] = (_dumps_msgpack, _loads_msgpack)
+if orjson is not None:
+    _SERIALIZERS[SERIALIZER_ORJSON] = (_dumps_orjson, _loads_orjson)
+
+_COMPRESSORS: Dict[int, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {}
+if zstandard is not None:
+    _COMPRESSORS[COMPRESSION_ZSTD] = (
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
+if lz4_frame is not None:
+    _COMPRESSORS[COMPRESSION_LZ4] = (lz4_frame.compress, lz4_frame.decompress)
+
+_SERIALIZER_NAMES = {"msgpack": SERIALIZER_MSGPACK, "orjson": SERIALIZER_ORJSON, "json": SERIALIZER_JSON}
+_COMPRESSION_NAMES = {"zstd": COMPRESSION_ZSTD, "lz4": COMPRESSION_LZ4, "none": COMPRESSION_NONE}
+
+
+def _pick(configured: str, names: Dict[str, int], available: Dict[int, Any], preference: Tuple[int, ...], fallback: int) -> int:
+    """Выбирает реализацию из настроек или первую доступную по порядку предпочтения."""
+    if configured:
+        code = names.get(configured.lower())
+        if code is None:
+            raise ValueError(f"Неизвестный вариант кодека: {configured}")
+        if code == fallback or code in available:
+            return code
+    return next((code for code in preference if code in available), fallback)
+
+
+# Сериализатор и компрессор для записи. Читать кодек умеет все установленные варианты,
+# поэтому смена настроек не делает старые значения нечитаемыми.
+CACHE_SERIALIZER = _pick(
+    os.getenv("CACHE_SERIALIZER", ""), _SERIALIZER_NAMES, _SERIALIZERS,
+    (SERIALIZER_MSGPACK, SERIALIZER_ORJSON), SERIALIZER_JSON,
+)
+CACHE_COMPRESSION = _pick(
+    os.getenv("CACHE_COMPRESSION", ""), _COMPRESSION_NAMES, _COMPRESSORS,
+    (COMPRESSION_ZSTD, COMPRESSION_LZ4), COMPRESSION_NONE,
+)
+
+
+def encode(value: Any) -> bytes:
+    """
+    Кодирует значение для хранения в Redis. Любой сериализатор восстанавливает
+    значение с теми же типами: базовые типы JSON, bytes, tuple, set, frozenset,
+    datetime, date, Decimal и UUID. Для прочих объектов (dataclass, pydantic,
+    Enum) выбрасывает TypeError.
+    """
+    dumps, _ = _SERIALIZERS[CACHE_SERIALIZER]
+    body = dumps(value)
+    compression = COMPRESSION_NONE
+    if CACHE_COMPRESSION != COMPRESSION_NONE and len(body) >= CACHE_COMPRESSION_THRESHOLD:
+        compress, _ = _COMPRESSORS[CACHE_COMPRESSION]
+        compressed = compress(body)
+        if len(compressed) < len(body):
+            body, compression = compressed, CACHE_COMPRESSION
+    return MAGIC + bytes((CODEC_VERSION, CACHE_SERIALIZER, compression)) + body
+
+
+def decode(data: Union[bytes, str]) -> Any:
+    """
+    Декодирует значение, записанное `encode`.
+    Значения без заголовка считаются JSON, записанным до появления кодека.
+    """
+    if isinstance(data, str):
+        return json.loads(data)
+    if not data.startswith(MAGIC):
+        return json.loads(data)
+    if len(data) < HEADER_SIZE:
+        raise CodecError("Поврежденный заголовок значения")
+
+    version, serializer, compression = data[1], data[2], data[3]
+    if version != CODEC_VERSION:
+        raise CodecError(f"Неподдерживаемая версия кодека: {version}")
+    if serializer not in _SERIALIZERS:
+        raise CodecError(f"Сериализатор {serializer} недоступен")
+
+    body = data[HEADER_SIZE:]
+    if compression != COMPRESSION_NONE:
+        if compression not in _COMPRESSORS:
+            raise CodecError(f"Компрессор {compression} недоступен")
+        _, decompress = _COMPRESSORS[compression]
+        body = decompress(body)
+
+    _, loads = _SERIALIZERS[serializer]
+    try:
+        return loads(body)
+    except Exception as e:
+        raise CodecError(f"Не удалось декодировать значение: {e}") from e
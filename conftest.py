@@ -1,3 +1,8 @@
+import os
+
+# Тесты подменяют анализатор, реальную модель при старте приложения не загружаем
+os.environ.setdefault("INFERENCE_PRELOAD", "false")
+
 import pytest
 from fastapi.testclient import TestClient
 from typing import Generator
@@ -0,0 +1,312 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+from .balance_index import SYSTEM_SENDER, balance_deltas
+from .ledger_index import transaction_hash
+from .merkle import MerkleTree
+
+logger = logging.getLogger(__name__)
+
+# Таймаут одного запроса к соседнему узлу.
+CONSENSUS_HTTP_TIMEOUT_SECONDS = float(os.getenv("CONSENSUS_HTTP_TIMEOUT_SECONDS", "5"))
+# Сколько соединений держать в пуле HTTP-клиента.
+CONSENSUS_MAX_CONNECTIONS = int(os.getenv("CONSENSUS_MAX_CONNECTIONS", "20"))
+# Сколько блоков загружать одним запросом и проверять одной задачей пула процессов.
+CONSENSUS_PAGE_SIZE = int(os.getenv("CONSENSUS_PAGE_SIZE", "500"))
+# Число процессов для проверки блоков.
+CONSENSUS_VALIDATION_WORKERS = int(os.getenv("CONSENSUS_VALIDATION_WORKERS", str(os.cpu_count() or 1)))
+
+# Сложность proof-of-work: сколько ведущих нулей должен иметь хэш доказательства блока.
+# 0 - проверка отключена (BlockProducer пока подбирает proof случайно, без майнинга).
+CONSENSUS_POW_DIFFICULTY = int(os.getenv("CONSENSUS_POW_DIFFICULTY", "0"))
+
+# Путь к эндпоинтам протокола узлов (см. nodes.py) относительно адреса узла.
+NODE_API_PREFIX = os.getenv("CONSENSUS_NODE_API_PREFIX", "/api/v1/nodes/chain")
+
+
+def block_hash(block: Any) -> str:
+    """SHA-256 блока в каноническом JSON - так же, как его считает леджер для previous_hash."""
+    return hashlib.sha256(json.dumps(block, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def valid_proof(previous: Any, block: Any, difficulty: int) -> bool:
+    """Доказательство блока: SHA-256 от proof предыдущего блока, своего proof и previous_hash с `difficulty` ведущими нулями."""
+    proof = block.get("proof")
+    if not isinstance(proof, int) or isinstance(proof, bool) or proof <= 0:
+        return False
+    guess = f"{previous.get('proof')}{proof}{block.get('previous_hash')}".encode()
+    return hashlib.sha256(guess).hexdigest().startswith("0" * difficulty)
+
+
+def validate_segment(blocks: List[Any], difficulty: int = 0) -> Optional[int]:
+    """
+    Проверяет последовательные блоки: previous_hash каждого блока должен совпадать
+    с хэшем предыдущего, index - расти на единицу, merkle_root (если есть) -
+    совпадать с деревом его транзакций, а при difficulty > 0 - proof удовлетворять
+    proof-of-work. Первый блок списка считается уже проверенным.
+    Возвращает позицию (в списке) первого некорректного блока или None.
+    Выполняется в процессе пула, поэтому функция должна быть на уровне модуля.
+    """
+    for position in range(1, len(blocks)):
+        previous, block = blocks[position - 1], blocks[position]
+        if block.get("previous_hash") != block_hash(previous):
+            return position
+        if "index" in previous and block.get("index") != previous["index"] + 1:
+            return position
+        if difficulty > 0 and not valid_proof(previous, block, difficulty):
+            return position
+        merkle_root = block.get("merkle_root")
+        if merkle_root and MerkleTree(transaction_hash(tx) for tx in block.get("transactions", ())).root != merkle_root:
+            return position
+    return None
+
+
+def validate_balances(blocks: List[Any], opening: Dict[str, int]) -> Optional[int]:
+    """
+    Проверяет транзакции блоков по порядку: сумма - положительное целое, отправитель
+    и получатель указаны, а баланс отправителя (кроме системного) не уходит в минус.
+    `opening` - балансы отправителей до первого блока. Возвращает позицию первого
+    некорректного блока или None. Выполняется в процессе пула.
+    """
+    balances = dict(opening)
+    for position, block in enumerate(blocks):
+        for tx in block.get("transactions", ()):
+            amount, sender, recipient = tx.get("amount"), tx.get("sender"), tx.get("recipient")
+            if not isinstance(amount, int) or isinstance(amount, bool) or amount <= 0:
+                return position
+            if not sender or not recipient:
+                return position
+            sender, recipient = str(sender), str(recipient)
+            if sender != SYSTEM_SENDER:
+                if balances.get(sender, 0) < amount:
+                    return position
+                balances[sender] -= amount
+            balances[recipient] = balances.get(recipient, 0) + amount
+    return None
+
+
+class ChainConsensus:
+    """
+    Консенсус "самая длинная корректная цепочка" между узлами из register_nodes.
+
+    - Сводки цепочек запрашиваются у всех узлов параллельно через общий пул соединений.
+    - Общий предок находится бинарным поиском по хэшам блоков, поэтому
+      загружаются только блоки после него.
+    - Загруженные блоки проверяются пачками в пуле процессов: хэши и proof-of-work,
+      затем транзакции по балансам на общем предке. Подписей у транзакций леджера
+      нет, поэтому отправитель не проверяется - регистрация узлов и запуск
+      консенсуса доступны только администраторам (nodes.py).
+    """
+
+    def __init__(
+        self,
+        ledger: Any,
+        nodes: Callable[[], Iterable[str]],
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        executor: Optional[Executor] = None,
+        page_size: int = CONSENSUS_PAGE_SIZE,
+        difficulty: int = CONSENSUS_POW_DIFFICULTY,
+        balances: Optional[Callable[[List[str]], Dict[str, int]]] = None,
+    ):
+        """
+        :param ledger: Леджер с атрибутами chain и pending_transactions.
+        :param nodes: Функция, возвращающая текущие адреса узлов (host:port).
+        :param transport: Транспорт httpx (в тестах - httpx.MockTransport).
+        :param executor: Пул для проверки блоков. По умолчанию создается пул процессов.
+        :param difficulty: Сложность proof-of-work для загружаемых блоков (0 - не проверять).
+        :param balances: Балансы аккаунтов по текущей цепочке (BalanceIndex.current_balances);
+            вызывается в потоке-исполнителе.
+            По умолчанию считаются по блокам цепочки до общего предка.
+        """
+        self.ledger = ledger
+        self.nodes = nodes
+        self.page_size = max(1, page_size)
+        self.difficulty = difficulty
+        self.balances = balances
+        self._transport = transport
+        self._executor = executor
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock = asyncio.Lock()
+
+    async def resolve(self) -> bool:
+        """Переходит на самую длинную корректную цепочку соседей. Возвращает True, если цепочка заменена."""
+        async with self._lock:
+            local_length = len(self.ledger.chain)
+            summaries = await asyncio.gather(*(self._fetch_summary(node) for node in self.nodes()))
+            candidates = sorted(
+                (summary for summary in summaries if summary and summary["length"] > local_length),
+                key=lambda summary: summary["length"],
+                reverse=True,
+            )
+            for summary in candidates:
+                try:
+                    if await self._adopt(summary["node"], summary["length"]):
+                        return True
+                except (httpx.HTTPError, ValueError, KeyError, IndexError) as e:
+                    logger.warning("Не удалось загрузить цепочку узла %s: %s", summary["node"], e)
+            return False
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    # --- Работа с узлами ---
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=CONSENSUS_HTTP_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_connections=CONSENSUS_MAX_CONNECTIONS),
+                transport=self._transport,
+            )
+        return self._client
+
+    async def _get(self, node: str, path: str, **params) -> Any:
+        response = await self._get_client().get(f"http://{node}{NODE_API_PREFIX}{path}", params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def _fetch_summary(self, node: str) -> Optional[Dict[str, Any]]:
+        try:
+            summary = await self._get(node, "/summary")
+            return {"node": node, "length": int(summary["length"])}
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            logger.warning("Узел %s недоступен: %s", node, e)
+            return None
+
+    async def _peer_hashes(self, node: str, start: int, stop: int) -> List[str]:
+        return (await self._get(node, "/hashes", start=start, stop=stop))["hashes"]
+
+    async def _find_common_ancestor(self, node: str, peer_length: int) -> int:
+        """
+        Возвращает длину общей части цепочек (0 - общих блоков нет).
+        Общая часть - префикс, поэтому совпадение хэшей монотонно и подходит бинарный поиск.
+        """
+        chain = self.ledger.chain
+        low, high = 0, min(len(chain), peer_length)
+        # Частый случай: соседняя цепочка просто продолжает нашу
+        if high and (await self._peer_hashes(node, high - 1, high))[0] == block_hash(chain[high - 1]):
+            return high
+        while low < high:
+            middle = (low + high) // 2
+            if (await self._peer_hashes(node, middle, middle + 1))[0] == block_hash(chain[middle]):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    async def _download(self, node: str, start: int, stop: int) -> List[Any]:
+        pages = await asyncio.gather(*(
+            self._download_page(node, offset, min(offset + self.page_size, stop))
+            for offset in range(start, stop, self.page_size)
+        ))
+        return [block for page in pages for block in page]
+
+    async def _download_page(self, node: str, start: int, stop: int) -> List[Any]:
+        """Блоки [start, stop); узел с меньшим лимитом страницы отдает их за несколько запросов."""
+        blocks: List[Any] = []
+        while start + len(blocks) < stop:
+            page = (await self._get(node, "/blocks", start=start + len(blocks), limit=stop - start - len(blocks)))["blocks"]
+            if not page:
+                raise ValueError(f"Узел вернул {len(blocks)} блоков вместо {stop - start}")
+            blocks.extend(page)
+        return blocks[:stop - start]
+
+    # --- Проверка и переход на цепочку ---
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=CONSENSUS_VALIDATION_WORKERS)
+        return self._executor
+
+    def _opening_balances(self, ancestor: int, accounts: List[str]) -> Dict[str, int]:
+        """Балансы аккаунтов на общем предке: текущие минус изменения отбрасываемых блоков."""
+        chain = self.ledger.chain
+        if self.balances is None:
+            deltas = balance_deltas(chain[:ancestor])
+            return {account: deltas.get(account, 0) for account in accounts}
+        current = self.balances(accounts)
+        orphaned = balance_deltas(chain[ancestor:])
+        return {account: current[account] - orphaned.get(account, 0) for account in accounts}
+
+    async def _validate_balances(self, ancestor: int, blocks: List[Any]) -> bool:
+        senders = sorted({
+            str(tx.get("sender")) for block in blocks for tx in block.get("transactions", ())
+            if tx.get("sender") and str(tx.get("sender")) != SYSTEM_SENDER
+        })
+        opening = await asyncio.to_thread(self._opening_balances, ancestor, senders)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), validate_balances, blocks, opening) is None
+
+    async def _validate(self, anchor: Optional[Any], blocks: List[Any]) -> bool:
+        """Проверяет блоки пачками параллельно; каждая пачка включает последний блок предыдущей."""
+        segments: List[List[Any]] = []
+        previous = anchor
+        for offset in range(0, len(blocks), self.page_size):
+            page = blocks[offset:offset + self.page_size]
+            segments.append([previous, *page] if previous is not None else page)
+            previous = page[-1]
+
+        # Даже одна пачка проверяется в пуле: хэширование сотен блоков не должно блокировать event loop
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        check = partial(validate_segment, difficulty=self.difficulty)
+        results = await asyncio.gather(*(loop.run_in_executor(executor, check, segment) for segment in segments))
+        return all(result is None for result in results)
+
+    async def _adopt(self, node: str, peer_length: int) -> bool:
+        ancestor = await self._find_common_ancestor(node, peer_length)
+        chain = self.ledger.chain
+        if ancestor == 0 and len(chain):
+            # Разный генезис-блок - это другая сеть, а не более длинная версия нашей цепочки
+            logger.warning("Цепочка узла %s начинается с другого генезис-блока", node)
+            return False
+        blocks = await self._download(node, ancestor, peer_length)
+        anchor = chain[ancestor - 1] if ancestor else None
+        if not await self._validate(anchor, blocks):
+            logger.warning("Цепочка узла %s не прошла проверку", node)
+            return False
+        if not await self._validate_balances(ancestor, blocks):
+            logger.warning("Транзакции цепочки узла %s тратят больше баланса отправителя", node)
+            return False
+        # Пока шла загрузка, наша цепочка могла вырасти
+        if len(chain) >= peer_length:
+            return False
+
+        orphaned = list(chain[ancestor:])
+        if hasattr(chain, "store"):
+            chain.store.replace_tail(ancestor, blocks)
+        else:
+            chain[ancestor:] = blocks
+        self._return_orphaned_transactions(orphaned, blocks)
+        logger.info(
+            "Цепочка заменена цепочкой узла %s: общий предок на позиции %s, загружено %d блоков, отброшено %d",
+            node, ancestor, len(blocks), len(orphaned),
+        )
+        return True
+
+    def _return_orphaned_transactions(self, orphaned: List[Any], adopted: List[Any]) -> None:
+        """
+        Транзакции из отброшенных блоков, которых нет в новой цепочке, возвращаются в пул.
+        Системные транзакции (отправитель "0", например вознаграждение за блок) не возвращаются.
+        """
+        if not orphaned:
+            return
+        included = {transaction_hash(tx) for block in adopted for tx in block.get("transactions", ())}
+        returned = [
+            tx for block in orphaned for tx in block.get("transactions", ())
+            if tx.get("sender") != "0" and transaction_hash(tx) not in included
+        ]
+        self.ledger.pending_transactions[:0] = returned
@@ -1,9 +1,84 @@
-from sqlalchemy import select
+import dataclasses
+import enum
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import DateTime, Enum, delete, inspect, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.api.schemas.user import UserCreate, UserUpdate
-from src.core.security import get_password_hash
+from src.core.caching import LocalCache, TwoTierCache
+from src.core.security import get_password_hash_async
 from src.db.models import User
+from src.db.redis_client import redis_pool
+
+# Сколько секунд данные аутентифицированного пользователя живут в кэше.
+# Изменения через update_user сбрасывают кэш сразу на всех воркерах.
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_MAX_SIZE = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", "10000"))
+
+_principal_cache: Optional[TwoTierCache] = None
+
+
+def _get_principal_cache() -> TwoTierCache:
+    """Отдельный кэш с коротким TTL локального уровня, общий для воркера."""
+    global _principal_cache
+    if _principal_cache is None:
+        _principal_cache = TwoTierCache(
+            redis_pool, local=LocalCache(PRINCIPAL_CACHE_MAX_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+        )
+    return _principal_cache
+
+
+def _principal_tag(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+# Колонки с секретами не попадают в Redis и отсутствуют в CachedUser.
+PRINCIPAL_CACHE_EXCLUDED_COLUMNS = frozenset({"hashed_password", "api_key"})
+
+# Неизменяемая копия пользователя из кэша: все колонки User, кроме секретных.
+# Это не ORM-объект: для изменения пользователя загрузите его через get_user.
+CachedUser = dataclasses.make_dataclass(
+    "CachedUser",
+    [attr.key for attr in inspect(User).column_attrs if attr.key not in PRINCIPAL_CACHE_EXCLUDED_COLUMNS],
+    frozen=True,
+)
+
+
+def _user_to_row(user: User) -> Dict[str, Any]:
+    """
+    Значения колонок пользователя (без связей и секретов) для хранения в кэше.
+    Enum хранится значением: кодек кэша не сериализует Enum (см. _user_from_row).
+    """
+    row = {}
+    for attr in inspect(User).column_attrs:
+        if attr.key in PRINCIPAL_CACHE_EXCLUDED_COLUMNS:
+            continue
+        value = getattr(user, attr.key)
+        row[attr.key] = value.value if isinstance(value, enum.Enum) else value
+    return row
+
+
+def _user_from_row(row: Dict[str, Any]) -> "CachedUser":
+    """
+    Восстанавливает пользователя из значений колонок.
+    Enum приводятся к исходному типу; даты - на случай записей старого формата.
+    """
+    values = {}
+    for attr in inspect(User).column_attrs:
+        if attr.key not in row:
+            continue
+        value = row[attr.key]
+        column_type = attr.columns[0].type
+        if value is not None:
+            if isinstance(column_type, Enum) and column_type.enum_class is not None and not isinstance(value, enum.Enum):
+                value = column_type.enum_class(value)
+            elif isinstance(column_type, DateTime) and isinstance(value, str):
+                value = datetime.fromisoformat(value)
+        values[attr.key] = value
+    return CachedUser(**values)
 
 
 async def get_user(db: AsyncSession, user_id: int) -> User | None:
@@ -12,6 +87,31 @@ async def get_user(db: AsyncSession, user_id: int) -> User | None:
     return result.scalars().first()
 
 
+async def get_user_cached(db: AsyncSession, user_id: int) -> Optional["CachedUser"]:
+    """
+    Получить пользователя по ID через кэш аутентифицированных пользователей.
+
+    Возвращает CachedUser - неизменяемую копию без секретных колонок
+    (PRINCIPAL_CACHE_EXCLUDED_COLUMNS), не привязанную к сессии. Для проверки
+    пароля или изменения пользователя используйте get_user.
+    """
+    async def load_row() -> Optional[Dict[str, Any]]:
+        user = await get_user(db, user_id)
+        return _user_to_row(user) if user is not None else None
+
+    row = await _get_principal_cache().get_or_compute(
+        f"principal:{user_id}", load_row, PRINCIPAL_CACHE_TTL_SECONDS, tags=(_principal_tag(user_id),)
+    )
+    if row is None:
+        return None
+    return _user_from_row(row)
+
+
+async def invalidate_user_cache(user_id: int) -> None:
+    """Сбрасывает закэшированного пользователя на всех воркерах (после изменения роли, блокировки и т.п.)."""
+    await _get_principal_cache().invalidate_tags(_principal_tag(user_id))
+
+
 async def get_user_by_email(db: AsyncSession, email: str) -> User | None:
     """Получить пользователя по email."""
     result = await db.execute(select(User).filter(User.email == email))
@@ -28,7 +128,7 @@ async def create_user(db: AsyncSession, user: UserCreate) -> User:
     """
     Создать нового пользователя.
     """
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = User(
         email=user.email, hashed_password=hashed_password
     )
@@ -38,12 +138,13 @@ async def create_user(db: AsyncSession, user: UserCreate) -> User:
     return db_user
 
 
-async def update_user(db: AsyncSession, *, db_user: User, user_in: UserUpdate) -> User:
+async def update_user(db: AsyncSession, *, db_user: User, user_in: UserUpdate | Dict[str, Any]) -> User:
     """Обновить данные пользователя."""
-    user_data = user_in.model_dump(exclude_unset=True)
+    # Административные действия (блокировка) передают словарь полей
+    user_data = user_in if isinstance(user_in, dict) else user_in.model_dump(exclude_unset=True)
 
     if "password" in user_data and user_data["password"]:
-        hashed_password = get_password_hash(user_data["password"])
+        hashed_password = await get_password_hash_async(user_data["password"])
         del user_data["password"]
         db_user.hashed_password = hashed_password
 
@@ -52,5 +153,14 @@ async def update_user(db: AsyncSession, *, db_user: User, user_in: UserUpdate) -
 
     db.add(db_user)
     await db.commit()
+    # Роль, блокировка и прочие поля должны сразу действовать в get_current_user
+    await invalidate_user_cache(db_user.id)
     await db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    return db_user
+
+
+async def delete_user(db: AsyncSession, user_id: int) -> None:
+    """Удалить пользователя и сбросить его в кэше, чтобы токены перестали действовать."""
+    await db.execute(delete(User).where(User.id == user_id))
+    await db.commit()
+    await invalidate_user_cache(user_id)
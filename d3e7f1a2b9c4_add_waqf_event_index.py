@@ -0,0 +1,81 @@
+"""add waqf event index
+
+Revision ID: d3e7f1a2b9c4
+Revises: c8a9b7d6e5f4
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3e7f1a2b9c4'
+down_revision: Union[str, None] = 'c8a9b7d6e5f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('indexed_projects',
+    sa.Column('address', sa.String(length=42), nullable=False),
+    sa.Column('beneficiary', sa.String(length=42), nullable=True),
+    sa.Column('goal_amount', sa.Numeric(precision=78, scale=0), server_default='0', nullable=False),
+    sa.Column('deadline', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('raised_amount', sa.Numeric(precision=78, scale=0), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('address')
+    )
+    op.create_table('indexed_donors',
+    sa.Column('project_address', sa.String(length=42), nullable=False),
+    sa.Column('address', sa.String(length=42), nullable=False),
+    sa.Column('total_donated', sa.Numeric(precision=78, scale=0), nullable=False),
+    sa.Column('contributions_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['project_address'], ['indexed_projects.address'], ),
+    sa.PrimaryKeyConstraint('project_address', 'address')
+    )
+    op.create_table('indexed_contributions',
+    sa.Column('tx_hash', sa.String(length=66), nullable=False),
+    sa.Column('log_index', sa.Integer(), nullable=False),
+    sa.Column('project_address', sa.String(length=42), nullable=False),
+    sa.Column('donor_address', sa.String(length=42), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=78, scale=0), nullable=False),
+    sa.Column('block_number', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['project_address'], ['indexed_projects.address'], ),
+    sa.PrimaryKeyConstraint('tx_hash', 'log_index')
+    )
+    op.create_index(op.f('ix_indexed_contributions_project_address'), 'indexed_contributions', ['project_address'], unique=False)
+    op.create_index(op.f('ix_indexed_contributions_block_number'), 'indexed_contributions', ['block_number'], unique=False)
+    op.create_table('indexed_milestones',
+    sa.Column('project_address', sa.String(length=42), nullable=False),
+    sa.Column('milestone_index', sa.Integer(), nullable=False),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('amount', sa.Numeric(precision=78, scale=0), server_default='0', nullable=False),
+    sa.Column('is_paid', sa.Boolean(), server_default='false', nullable=False),
+    sa.Column('paid_block', sa.BigInteger(), nullable=True),
+    sa.ForeignKeyConstraint(['project_address'], ['indexed_projects.address'], ),
+    sa.PrimaryKeyConstraint('project_address', 'milestone_index')
+    )
+    op.create_table('indexed_blocks',
+    sa.Column('number', sa.BigInteger(), nullable=False),
+    sa.Column('hash', sa.String(length=66), nullable=False),
+    sa.PrimaryKeyConstraint('number')
+    )
+    op.create_table('indexer_checkpoints',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('block_number', sa.BigInteger(), nullable=False),
+    sa.Column('block_hash', sa.String(length=66), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('indexer_checkpoints')
+    op.drop_table('indexed_blocks')
+    op.drop_table('indexed_milestones')
+    op.drop_index(op.f('ix_indexed_contributions_block_number'), table_name='indexed_contributions')
+    op.drop_index(op.f('ix_indexed_contributions_project_address'), table_name='indexed_contributions')
+    op.drop_table('indexed_contributions')
+    op.drop_table('indexed_donors')
+    op.drop_table('indexed_projects')
@@ -5,7 +5,6 @@ from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.config import settings
-from src.db import models
 from src.crud import user as crud_user
 from src.db.session import get_db
 from src.api.v1.schemas.token import TokenPayload
@@ -23,10 +22,10 @@ oauth2_scheme = OAuth2PasswordBearer(
 
 async def get_current_user(
     db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> models.User:
+) -> crud_user.CachedUser:
     """
-    Декодирует JWT-токен, валидирует его и возвращает
-    полную модель пользователя из базы данных.
+    Декодирует JWT-токен, валидирует его и возвращает пользователя
+    (CachedUser - неизменяемую копию без секретных колонок, см. crud.get_user_cached).
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -46,8 +45,8 @@ async def get_current_user(
     except (JWTError, ValidationError):
         raise credentials_exception
 
-    # Ищем пользователя в БД по ID из токена
-    user = await crud_user.get_user(db, user_id=int(token_data.sub))
+    # Ищем пользователя по ID из токена: сначала в кэше, затем в БД
+    user = await crud_user.get_user_cached(db, user_id=int(token_data.sub))
     if user is None:
         raise credentials_exception
     return user
\ No newline at end of file
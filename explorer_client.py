@@ -0,0 +1,371 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# API блокчейн-эксплорера в формате Etherscan (module=account&action=txlist).
+EXPLORER_API_URL = os.getenv("EXPLORER_API_URL", "https://api.etherscan.io/api")
+EXPLORER_API_KEY = os.getenv("EXPLORER_API_KEY", "")
+EXPLORER_TIMEOUT_SECONDS = float(os.getenv("EXPLORER_TIMEOUT_SECONDS", "10"))
+# Лимит запросов к эксплореру в секунду на ключ API (бесплатный тариф Etherscan - 5).
+# Делится между всеми воркерами через Redis; без Redis - поровну на WEB_CONCURRENCY процессов.
+EXPLORER_RATE_LIMIT_PER_SECOND = float(os.getenv("EXPLORER_RATE_LIMIT_PER_SECOND", "5"))
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+EXPLORER_RATE_LIMIT_KEY = "explorer:rate"
+# Сколько раз повторять запрос после ответа "превышен лимит".
+EXPLORER_MAX_RETRIES = 3
+# Транзакций в одной странице ответа эксплорера.
+EXPLORER_PAGE_SIZE = int(os.getenv("EXPLORER_PAGE_SIZE", "1000"))
+# Как часто догружать новые транзакции адреса (между обновлениями отдается кэш).
+EXPLORER_REFRESH_SECONDS = int(os.getenv("EXPLORER_REFRESH_SECONDS", "15"))
+# Сколько хранить кэш адреса, к которому не обращаются.
+EXPLORER_CACHE_TTL_SECONDS = 7 * 24 * 3600
+# Время жизни блокировки обновления адреса; продлевается после каждой загруженной страницы.
+EXPLORER_REFRESH_LOCK_SECONDS = 60
+# Сколько запрос без кэша ждет, пока другой воркер загрузит адрес впервые.
+EXPLORER_REFRESH_WAIT_SECONDS = float(os.getenv("EXPLORER_REFRESH_WAIT_SECONDS", "10"))
+EXPLORER_REFRESH_POLL_SECONDS = 0.1
+
+# Снимает блокировку, только если она все еще принадлежит нам.
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+# Общий для воркеров token bucket: возвращает, сколько секунд ждать (0 - запрос разрешен).
+_TAKE_TOKEN_SCRIPT = """
+local rate, capacity, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call("hmget", KEYS[1], "tokens", "updated", "paused_until")
+local paused_until = tonumber(state[3]) or 0
+if now < paused_until then
+    return tostring(paused_until - now)
+end
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call("hset", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("expire", KEYS[1], ARGV[4])
+return tostring(wait)
+"""
+# Приостанавливает запросы всех воркеров (эксплорер ответил "превышен лимит").
+_PAUSE_SCRIPT = """
+local paused_until = math.max(tonumber(redis.call("hget", KEYS[1], "paused_until")) or 0, tonumber(ARGV[1]))
+redis.call("hset", KEYS[1], "paused_until", tostring(paused_until), "tokens", "0")
+redis.call("expire", KEYS[1], ARGV[2])
+return 1
+"""
+# Продлевает блокировку, только если она все еще принадлежит нам.
+_EXTEND_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("expire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class ExplorerError(Exception):
+    """Эксплорер вернул ошибку или продолжает отвечать "превышен лимит"."""
+
+
+class ExplorerRefreshPending(ExplorerError):
+    """Адрес впервые загружает другой воркер, а кэша для ответа еще нет."""
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов: не больше `rate` запросов в секунду
+    с короткими всплесками до `capacity`. pause() приостанавливает все запросы,
+    когда эксплорер сам сообщил о превышении лимита.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class RedisTokenBucket:
+    """
+    Тот же ограничитель, но состояние хранится в Redis и общее для всех воркеров:
+    лимит эксплорера действует на ключ API, а не на процесс.
+    """
+
+    def __init__(self, redis, key: str, rate: float, capacity: Optional[float] = None):
+        self.redis = redis
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        # Состояние не нужно дольше, чем бакет наполняется с нуля
+        self._ttl = max(60, int(self.capacity / rate) + 1)
+
+    async def acquire(self) -> None:
+        while True:
+            wait = await self._take()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def pause(self, seconds: float) -> None:
+        await self.redis.eval(_PAUSE_SCRIPT, 1, self.key, time.time() + seconds, self._ttl + int(seconds))
+
+    async def _take(self) -> float:
+        """Берет токен, если он есть; иначе возвращает время ожидания в секундах."""
+        return float(await self.redis.eval(
+            _TAKE_TOKEN_SCRIPT, 1, self.key, self.rate, self.capacity, time.time(), self._ttl
+        ))
+
+
+class ExplorerClient:
+    """HTTP-клиент эксплорера с общим пулом соединений и ограничением частоты запросов."""
+
+    def __init__(
+        self,
+        api_url: str = EXPLORER_API_URL,
+        api_key: str = EXPLORER_API_KEY,
+        rate_limit: float = EXPLORER_RATE_LIMIT_PER_SECOND,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        redis=None,
+    ):
+        """
+        :param redis: Клиент Redis для общего лимита всех воркеров. Без него
+            каждый процесс получает rate_limit / WEB_CONCURRENCY запросов в секунду.
+        """
+        self.api_url = api_url
+        self.api_key = api_key
+        if redis is not None:
+            self.bucket = RedisTokenBucket(redis, EXPLORER_RATE_LIMIT_KEY, rate_limit)
+        else:
+            self.bucket = TokenBucket(rate_limit / WEB_CONCURRENCY)
+        self._client = httpx.AsyncClient(timeout=EXPLORER_TIMEOUT_SECONDS, transport=transport)
+
+    async def txlist(self, address: str, start_block: int, page: int = 1, offset: int = EXPLORER_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """Транзакции адреса начиная с блока `start_block` (включительно), по возрастанию блока."""
+        params = {
+            "module": "account",
+            "action": "txlist",
+            "address": address,
+            "startblock": start_block,
+            "endblock": 99999999,
+            "page": page,
+            "offset": offset,
+            "sort": "asc",
+            "apikey": self.api_key,
+        }
+        for _ in range(EXPLORER_MAX_RETRIES + 1):
+            await self.bucket.acquire()
+            response = await self._client.get(self.api_url, params=params)
+            if response.status_code == 429:
+                await self.bucket.pause(float(response.headers.get("Retry-After", "1")))
+                continue
+            response.raise_for_status()
+            payload = response.json()
+            result = payload.get("result")
+            if payload.get("status") == "1":
+                return result
+            if isinstance(result, str) and "rate limit" in result.lower():
+                await self.bucket.pause(1)
+                continue
+            if result == [] or payload.get("message") == "No transactions found":
+                return []
+            raise ExplorerError(result or payload.get("message"))
+        raise ExplorerError("Эксплорер продолжает отвечать превышением лимита запросов")
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def _member(tx: Dict[str, Any]) -> str:
+    """Ключ транзакции в индексе; лексикографический порядок совпадает с порядком в цепочке."""
+    return f"{int(tx['blockNumber']):012d}:{int(tx.get('transactionIndex') or 0):06d}:{tx['hash']}"
+
+
+def encode_cursor(member: str) -> str:
+    return base64.urlsafe_b64encode(member.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    """Выбрасывает ValueError для некорректного курсора."""
+    try:
+        member = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Некорректный курсор") from e
+    if member.count(":") != 2:
+        raise ValueError("Некорректный курсор")
+    return member
+
+
+class AddressTransactionCache:
+    """
+    Инкрементальный кэш транзакций адресов в Redis.
+
+    - explorer:txs:<address>   - отсортированное множество ключей транзакций (порядок по цепочке);
+    - explorer:tx:<address>    - хэш "ключ -> JSON транзакции";
+    - explorer:meta:<address>  - последний загруженный блок и время обновления.
+
+    При обновлении у эксплорера запрашиваются только транзакции начиная
+    с последнего загруженного блока; страницы для клиента читаются из Redis по курсору.
+    """
+
+    def __init__(self, redis, explorer: ExplorerClient):
+        self.redis = redis
+        self.explorer = explorer
+
+    async def page(self, address: str, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Страница транзакций от новых к старым, начиная после `cursor`.
+        Возвращает транзакции и курсор следующей страницы (None - страниц больше нет).
+        """
+        address = address.lower()
+        after = decode_cursor(cursor) if cursor else None
+        try:
+            await self.refresh(address)
+        except ExplorerRefreshPending:
+            # Частично загруженный адрес не отдается: в кэше пока только старые транзакции
+            raise
+        except (ExplorerError, httpx.HTTPError) as e:
+            # Отдаем то, что уже загружено; без кэша ошибку увидит клиент
+            if not await self.redis.exists(self._index_key(address)):
+                raise
+            logger.warning("Не удалось обновить транзакции %s из эксплорера: %s", address, e)
+
+        members = await self.redis.zrevrangebylex(
+            self._index_key(address), f"({after}" if after else "+", "-", start=0, num=limit + 1
+        )
+        has_more = len(members) > limit
+        members = members[:limit]
+        payloads = await self.redis.hmget(self._data_key(address), members) if members else []
+        transactions = [json.loads(payload) for payload in payloads if payload]
+        return transactions, encode_cursor(members[-1]) if has_more else None
+
+    async def refresh(self, address: str) -> int:
+        """Догружает новые транзакции адреса. Возвращает число загруженных транзакций."""
+        meta = await self.redis.hgetall(self._meta_key(address))
+        if meta and time.time() - float(meta.get("synced_at", 0)) < EXPLORER_REFRESH_SECONDS:
+            return 0
+        lock_key = f"explorer:lock:{address}"
+        token = uuid4().hex
+        if not await self.redis.set(lock_key, token, nx=True, ex=EXPLORER_REFRESH_LOCK_SECONDS):
+            # Адрес обновляет другой запрос или воркер: есть завершенная загрузка - отдаем ее
+            if meta.get("synced_at"):
+                return 0
+            await self._wait_for_unlock(lock_key)
+            return await self.refresh(address)
+        try:
+            # Последний блок загружается повторно: в нем могли появиться транзакции
+            start_block = int(meta.get("last_block", 0)) if meta else 0
+            page, loaded = 1, 0
+            while True:
+                transactions = await self.explorer.txlist(address, start_block, page, EXPLORER_PAGE_SIZE)
+                await self._store(address, transactions)
+                loaded += len(transactions)
+                if len(transactions) < EXPLORER_PAGE_SIZE:
+                    break
+                last_block = int(transactions[-1]["blockNumber"])
+                if last_block == start_block:
+                    # Вся страница из одного блока - листаем дальше внутри него
+                    page += 1
+                else:
+                    start_block, page = last_block, 1
+                    # Прогресс сохраняется после каждой страницы, чтобы таймаут не терял загруженное
+                    await self.redis.hset(self._meta_key(address), "last_block", start_block)
+                    await self.redis.expire(self._meta_key(address), EXPLORER_CACHE_TTL_SECONDS)
+                if not await self.redis.eval(_EXTEND_LOCK_SCRIPT, 1, lock_key, token, EXPLORER_REFRESH_LOCK_SECONDS):
+                    # Блокировка истекла и ее взял другой воркер - он продолжит с сохраненного блока
+                    logger.warning("Блокировка обновления транзакций %s потеряна", address)
+                    return loaded
+            if transactions:
+                start_block = int(transactions[-1]["blockNumber"])
+            await self.redis.hset(self._meta_key(address), mapping={"last_block": start_block, "synced_at": time.time()})
+            for key in (self._index_key(address), self._data_key(address), self._meta_key(address)):
+                await self.redis.expire(key, EXPLORER_CACHE_TTL_SECONDS)
+            return loaded
+        finally:
+            await self.redis.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+    async def _wait_for_unlock(self, lock_key: str) -> None:
+        """Ждет снятия блокировки другим воркером; по таймауту выбрасывает ExplorerRefreshPending."""
+        deadline = time.monotonic() + EXPLORER_REFRESH_WAIT_SECONDS
+        while await self.redis.exists(lock_key):
+            if time.monotonic() >= deadline:
+                raise ExplorerRefreshPending("Транзакции адреса еще загружаются")
+            await asyncio.sleep(EXPLORER_REFRESH_POLL_SECONDS)
+
+    async def _store(self, address: str, transactions: List[Dict[str, Any]]) -> None:
+        if not transactions:
+            return
+        members = {_member(tx): json.dumps(tx) for tx in transactions}
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(self._index_key(address), dict.fromkeys(members, 0))
+            pipe.hset(self._data_key(address), mapping=members)
+            # Срок ставится сразу: прерванная загрузка не должна оставить ключи навсегда
+            pipe.expire(self._index_key(address), EXPLORER_CACHE_TTL_SECONDS)
+            pipe.expire(self._data_key(address), EXPLORER_CACHE_TTL_SECONDS)
+            await pipe.execute()
+
+    @staticmethod
+    def _index_key(address: str) -> str:
+        return f"explorer:txs:{address}"
+
+    @staticmethod
+    def _data_key(address: str) -> str:
+        return f"explorer:tx:{address}"
+
+    @staticmethod
+    def _meta_key(address: str) -> str:
+        return f"explorer:meta:{address}"
+
+
+_explorer: Optional[ExplorerClient] = None
+
+
+async def get_explorer_client() -> ExplorerClient:
+    """Зависимость FastAPI: один клиент (пул соединений) на процесс, лимит запросов - общий в Redis."""
+    global _explorer
+    if _explorer is None:
+        from src.db.redis_client import redis_pool
+
+        _explorer = ExplorerClient(redis=redis_pool)
+    return _explorer
+
+
+async def close_explorer_client() -> None:
+    global _explorer
+    if _explorer is not None:
+        await _explorer.close()
+        _explorer = None
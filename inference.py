@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество текстов, объединяемых в один батч для модели.
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "16"))
+# Сколько миллисекунд ждать "попутчиков" для батча после первого запроса.
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+# Загружать модель при старте воркера, а не на первом запросе.
+INFERENCE_PRELOAD = os.getenv("INFERENCE_PRELOAD", "true").lower() == "true"
+
+
+class BatchedInference:
+    """
+    Резидентная модель с микро-батчингом запросов.
+
+    Модель загружается один раз на воркер в выделенном потоке-исполнителе,
+    а конкурентные запросы собираются в очередь и передаются модели одним
+    батчем. Прямой проход модели никогда не выполняется в event loop.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], Any],
+        max_batch_size: int = INFERENCE_MAX_BATCH_SIZE,
+        max_wait_ms: float = INFERENCE_MAX_WAIT_MS,
+    ):
+        """
+        :param loader: Фабрика, создающая модель (например, класс SpiritAnalyzer).
+        :param max_batch_size: Максимальный размер батча.
+        :param max_wait_ms: Максимальное ожидание добора батча в миллисекундах.
+        """
+        self._loader = loader
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._model: Any = None
+        self._loading: Optional[asyncio.Future] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self) -> None:
+        """Загружает модель (если еще не загружена) и запускает обработчик очереди."""
+        loop = asyncio.get_running_loop()
+        if self._executor is None:
+            # Один поток: модель не потокобезопасна, а батчинг и так дает параллелизм.
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        # Конкурентные первые запросы ждут одну загрузку и продолжают в порядке вызова
+        if self._loading is None or self._loading.get_loop() is not loop:
+            self._loading = loop.run_in_executor(self._executor, self._load_model)
+        try:
+            await asyncio.shield(self._loading)
+        except Exception:
+            self._loading = None
+            raise
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            # Очередь и задача привязаны к конкретному event loop (например, в тестах
+            # каждый TestClient создает свой), поэтому пересоздаем их при смене цикла.
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def analyze(self, text: str) -> Any:
+        """Ставит текст в очередь на анализ и дожидается результата своего батча."""
+        await self.start()
+        future = self._loop.create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def close(self) -> None:
+        """Останавливает обработчик очереди и освобождает поток-исполнитель."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._loading = None
+
+    def _load_model(self) -> None:
+        if self._model is None:
+            logger.info("Загрузка модели для инференса...")
+            self._model = self._loader()
+
+    async def _run(self) -> None:
+        """Основной цикл: собирает батч и отправляет его в поток-исполнитель."""
+        while True:
+            batch = await self._collect_batch()
+            texts = [text for text, _ in batch]
+            try:
+                results = await self._loop.run_in_executor(self._executor, self._predict, texts)
+            except Exception as e:
+                logger.exception("Ошибка инференса для батча из %d текстов", len(texts))
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                # Клиент мог отменить запрос, пока батч обрабатывался
+                if not future.done():
+                    future.set_result(result)
+            if len(results) < len(batch):
+                logger.error("Модель вернула %d результатов для батча из %d текстов", len(results), len(texts))
+                for _, future in batch[len(results):]:
+                    if not future.done():
+                        future.set_exception(RuntimeError("Модель не вернула результат для текста"))
+
+    async def _collect_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        """Ждет первый запрос, затем добирает батч до лимита или до истечения max_wait."""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _predict(self, texts: List[str]) -> List[Any]:
+        """Выполняется в потоке-исполнителе. Использует батчевый метод модели, если он есть."""
+        if hasattr(self._model, "analyze_topics_batch"):
+            return list(self._model.analyze_topics_batch(texts))
+        return [self._model.analyze_topics(text) for text in texts]
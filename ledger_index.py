@@ -0,0 +1,191 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .merkle import MerkleTree, leaf_hash
+
+# Поля, в которых леджер может хранить собственный хэш транзакции.
+_HASH_FIELDS = ("tx_hash", "hash", "transaction_id")
+# Для скольких последних блоков держать деревья Меркла в памяти (для доказательств).
+MERKLE_TREE_CACHE_BLOCKS = 256
+
+
+def _field(obj: Any, name: str, default: Any = None) -> Any:
+    """Читает поле блока или транзакции, хранящихся как словарь или как объект."""
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def _as_dict(obj: Any) -> Dict[str, Any]:
+    if isinstance(obj, dict):
+        return obj
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    return dict(vars(obj))
+
+
+def transaction_hash(tx: Any) -> str:
+    """
+    Хэш транзакции: собственный хэш леджера, если он есть,
+    иначе SHA-256 канонического JSON транзакции.
+    """
+    for name in _HASH_FIELDS:
+        value = _field(tx, name)
+        if value:
+            return str(value)
+    canonical = json.dumps(_as_dict(tx), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class LedgerIndex:
+    """
+    Индекс "хэш транзакции -> (позиция блока, смещение в блоке)" поверх леджера.
+
+    Индекс обновляется инкрементально: при каждом sync() индексируются только
+    блоки, добавленные с прошлого раза, и только новые транзакции пула.
+    Если цепочка была заменена (например, при консенсусе), индекс перестраивается.
+
+    Для пула транзакций инкрементально строится дерево Меркла, поэтому при
+    запечатывании блока (seal_block) его корень берется готовым.
+    seal_block вызывается из потока сборки блока, поэтому методы защищены замком.
+    """
+
+    def __init__(self, ledger: Any):
+        self.ledger = ledger
+        self._confirmed: Dict[str, Tuple[int, int]] = {}
+        self._pending: Dict[str, int] = {}
+        self._indexed_blocks = 0
+        self._last_block: Any = None
+        self._pending_list: Optional[List] = None
+        self._pending_indexed = 0
+        self._last_pending: Any = None
+        self._pending_tree = MerkleTree()
+        # Деревья последних блоков по позиции: доказательства без повторного хэширования
+        self._block_trees: "OrderedDict[int, MerkleTree]" = OrderedDict()
+        # Дерево последнего запечатанного блока. Блок мог не попасть в хранилище
+        # (позицию занял другой воркер), поэтому дерево используется, только если
+        # его корень совпадает с merkle_root записанного блока.
+        self._sealed_tree: Optional[MerkleTree] = None
+        self._lock = threading.RLock()
+
+    def sync(self) -> None:
+        """Индексирует новые блоки и транзакции пула."""
+        with self._lock:
+            chain = self.ledger.chain
+            if self._indexed_blocks and (
+                len(chain) < self._indexed_blocks or chain[self._indexed_blocks - 1] != self._last_block
+            ):
+                self.rebuild()
+                return
+            for position in range(self._indexed_blocks, len(chain)):
+                self._index_block(position, chain[position])
+            self._indexed_blocks = len(chain)
+            self._last_block = chain[-1] if chain else None
+            self._sync_pending()
+
+    def rebuild(self) -> None:
+        """Полностью перестраивает индекс по текущей цепочке."""
+        with self._lock:
+            self._confirmed.clear()
+            self._block_trees.clear()
+            self._indexed_blocks = 0
+            self._last_block = None
+            self._pending_list = None
+            self.sync()
+
+    def find(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает транзакцию с полями "status" ("confirmed"/"pending") и "block_index"
+        или None, если транзакция не найдена.
+        """
+        with self._lock:
+            self.sync()
+            location = self._confirmed.get(tx_hash)
+            if location is not None:
+                position, offset = location
+                block = self.ledger.chain[position]
+                tx = _field(block, "transactions")[offset]
+                result = {**_as_dict(tx), "status": "confirmed", "block_index": _field(block, "index", position)}
+                merkle_root = _field(block, "merkle_root")
+                if merkle_root:
+                    result["merkle_root"] = merkle_root
+                    result["merkle_proof"] = self._block_tree(position, block).proof(offset)
+                return result
+
+            offset = self._pending.get(tx_hash)
+            if offset is not None:
+                tx = self.ledger.pending_transactions[offset]
+                return {**_as_dict(tx), "status": "pending", "block_index": None}
+            return None
+
+    def seal_block(self, block: Any) -> Any:
+        """
+        Записывает в блок корень дерева Меркла его транзакций перед добавлением в цепочку.
+        Если транзакции блока - это отслеживаемый пул, корень уже посчитан инкрементально.
+        """
+        with self._lock:
+            transactions = _field(block, "transactions") or []
+            # Леджер мог уже завести новый пул; досчитываем дерево по списку, который отслеживали
+            if self._pending_list is not None:
+                self._index_pending(self._pending_list)
+            tree = self._pending_tree
+            if len(tree) != len(transactions) or (
+                transactions and tree.last_leaf != leaf_hash(transaction_hash(transactions[-1]))
+            ):
+                # Блок собран не из текущего пула - строим дерево заново
+                tree = MerkleTree(transaction_hash(tx) for tx in transactions)
+            if isinstance(block, dict):
+                block["merkle_root"] = tree.root
+            else:
+                block.merkle_root = tree.root
+            self._sealed_tree = tree
+            return block
+
+    def _block_tree(self, position: int, block: Any) -> MerkleTree:
+        """Дерево записанного блока; кэш проверяется по merkle_root блока."""
+        merkle_root = _field(block, "merkle_root")
+        tree = self._block_trees.get(position)
+        if tree is None or tree.root != merkle_root:
+            transactions = _field(block, "transactions") or ()
+            sealed = self._sealed_tree
+            if sealed is not None and sealed.root == merkle_root and len(sealed) == len(transactions):
+                tree = sealed
+            else:
+                tree = MerkleTree(transaction_hash(tx) for tx in transactions)
+        self._remember_tree(position, tree)
+        return tree
+
+    def _remember_tree(self, position: int, tree: MerkleTree) -> None:
+        self._block_trees[position] = tree
+        self._block_trees.move_to_end(position)
+        while len(self._block_trees) > MERKLE_TREE_CACHE_BLOCKS:
+            self._block_trees.popitem(last=False)
+
+    def _index_block(self, position: int, block: Any) -> None:
+        for offset, tx in enumerate(_field(block, "transactions") or ()):
+            self._confirmed[transaction_hash(tx)] = (position, offset)
+
+    def _sync_pending(self) -> None:
+        pending = self.ledger.pending_transactions
+        # После создания блока леджер заводит новый список пула или очищает текущий
+        if (
+            pending is not self._pending_list
+            or len(pending) < self._pending_indexed
+            or (self._pending_indexed and pending[self._pending_indexed - 1] is not self._last_pending)
+        ):
+            self._pending.clear()
+            self._pending_list = pending
+            self._pending_indexed = 0
+            self._pending_tree = MerkleTree()
+        self._index_pending(pending)
+
+    def _index_pending(self, pending: List) -> None:
+        for offset in range(self._pending_indexed, len(pending)):
+            tx_hash = transaction_hash(pending[offset])
+            self._pending[tx_hash] = offset
+            self._pending_tree.append(tx_hash)
+        self._pending_indexed = len(pending)
+        self._last_pending = pending[-1] if pending else None
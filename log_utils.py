@@ -0,0 +1,146 @@
+import atexit
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Iterable, List, Optional
+
+# Максимальная длина сводки payload в логе (символов).
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "500"))
+# Доля подробных событий (полные payload на DEBUG), которые попадают в лог.
+LOG_VERBOSE_SAMPLE_RATE = float(os.getenv("LOG_VERBOSE_SAMPLE_RATE", "0.01"))
+# Размер очереди записей; при переполнении записи отбрасываются, а не блокируют event loop.
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+_ELLIPSIS = "…"
+
+
+def _summarize(value: Any, budget: int) -> str:
+    """
+    Краткое представление значения не длиннее `budget` символов.
+    Обходит только ту часть структуры, которая помещается в бюджет,
+    поэтому стоимость не зависит от размера payload.
+    """
+    if budget <= 0:
+        return _ELLIPSIS
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        text = f"<{type(value).__name__} {len(value)}>"
+    elif isinstance(value, str):
+        text = repr(value[:budget])
+    elif isinstance(value, dict):
+        parts, used = [], 2
+        for key, item in value.items():
+            if used >= budget:
+                parts.append(_ELLIPSIS)
+                break
+            part = f"{key!r}: {_summarize(item, budget - used - len(str(key)) - 4)}"
+            parts.append(part)
+            used += len(part) + 2
+        text = "{" + ", ".join(parts) + "}"
+    elif isinstance(value, (list, tuple, set)):
+        parts, used = [], 2
+        for item in value:
+            if used >= budget:
+                parts.append(f"{_ELLIPSIS} ({len(value)} items)")
+                break
+            part = _summarize(item, budget - used)
+            parts.append(part)
+            used += len(part) + 2
+        text = "[" + ", ".join(parts) + "]"
+    else:
+        text = repr(value)
+    return text if len(text) <= budget else text[:budget] + _ELLIPSIS
+
+
+class Payload:
+    """
+    Ленивая сводка payload для аргументов логгера:
+
+        logger.debug("Результат: %s", Payload(result))
+
+    Строка строится только если запись действительно выводится, и не длиннее
+    `max_chars`; байты (например, file_content) заменяются на их размер.
+    """
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value: Any, max_chars: int = LOG_PAYLOAD_MAX_CHARS):
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        return _summarize(self.value, self.max_chars)
+
+    __repr__ = __str__
+
+
+def sampled(rate: float = LOG_VERBOSE_SAMPLE_RATE) -> bool:
+    """Решает, логировать ли очередное подробное событие."""
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler, который при переполнении очереди отбрасывает запись вместо ожидания."""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+_listener: Optional[QueueListener] = None
+# Состояние корневого логгера до setup_queue_logging (восстанавливается в stop_queue_logging)
+_queue_handler: Optional[QueueHandler] = None
+_original_handlers: List[logging.Handler] = []
+_original_level: int = logging.WARNING
+
+
+def setup_queue_logging(handlers: Optional[Iterable[logging.Handler]] = None, level: str = LOG_LEVEL) -> QueueListener:
+    """
+    Переводит корневой логгер на очередь: в потоке вызова запись только
+    форматируется и кладется в очередь, а вывод (консоль, файлы, сеть)
+    выполняет отдельный поток QueueListener. Повторный вызов возвращает
+    уже запущенный listener. stop_queue_logging() возвращает прежние обработчики.
+    """
+    global _listener, _queue_handler, _original_handlers, _original_level
+    if _listener is not None:
+        return _listener
+    root = logging.getLogger()
+    # Копия списка: root.handlers ниже изменяется
+    _original_handlers = list(root.handlers)
+    _original_level = root.level
+    targets = list(handlers) if handlers is not None else (list(_original_handlers) or [logging.StreamHandler()])
+    for handler in targets:
+        if handler.formatter is None:
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    for handler in _original_handlers:
+        root.removeHandler(handler)
+    _queue_handler = _DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(_queue_handler.queue, *targets, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_queue_logging)
+    return _listener
+
+
+def stop_queue_logging() -> None:
+    """Дописывает оставшиеся записи, останавливает поток вывода и возвращает прежние обработчики."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    if _queue_handler is not None:
+        root.removeHandler(_queue_handler)
+        _queue_handler = None
+    _listener.stop()
+    _listener = None
+    for handler in _original_handlers:
+        if handler not in root.handlers:
+            root.addHandler(handler)
+    root.setLevel(_original_level)
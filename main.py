@@ -1,12 +1,38 @@
+from functools import partial
+
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
+from src.api.v1.endpoints.ai_analysis import close_spirit_analyzer, start_spirit_analyzer
 from src.api.v1.router import api_router
 from src.core.config import settings
+from src.core.inference import INFERENCE_PRELOAD
+from src.core.log_utils import setup_queue_logging, stop_queue_logging
 from src.core.middlewares import setup_middlewares
+from src.db.session import AsyncSessionLocal
+from src.services.explorer_client import close_explorer_client
+from src.services.waqf_indexer import WAQF_INDEXER_ENABLED, start_waqf_indexer, stop_waqf_indexer
+from src.services.web3_client import close_async_blockchain_service
+
+
+async def start_mubarakai(app: FastAPI) -> None:
+    """Запускает фоновые задачи MubarakAI (блоки, сверка балансов), если он подключен к приложению."""
+    mubarakai = getattr(app.state, "mubarakai", None)
+    if mubarakai is not None:
+        mubarakai.start_background_tasks()
+
+
+async def shutdown_mubarakai(app: FastAPI) -> None:
+    """Сохраняет пул транзакций и закрывает хранилище блоков MubarakAI, если он подключен к приложению."""
+    mubarakai = getattr(app.state, "mubarakai", None)
+    if mubarakai is not None:
+        await mubarakai.shutdown()
 
 
 def create_app() -> FastAPI:
+    # Вывод логов выполняется в отдельном потоке, а не в event loop
+    setup_queue_logging()
+
     app = FastAPI(
         title=settings.PROJECT_NAME,
         openapi_url=f"{settings.API_V1_STR}/openapi.json"
@@ -27,5 +53,20 @@ def create_app() -> FastAPI:
 
     # Подключение роутеров
     app.include_router(api_router, prefix=settings.API_V1_STR)
+    # Модель анализа текста загружается при старте воркера
+    if INFERENCE_PRELOAD:
+        app.add_event_handler("startup", start_spirit_analyzer)
+    app.add_event_handler("shutdown", close_spirit_analyzer)
+    # Фоновый индекс событий вакф-контрактов для эндпоинтов доноров
+    if WAQF_INDEXER_ENABLED:
+        app.add_event_handler("startup", partial(start_waqf_indexer, AsyncSessionLocal))
+        app.add_event_handler("shutdown", stop_waqf_indexer)
+    # Фоновые задачи MubarakAI; при остановке неподтвержденные транзакции
+    # сохраняются в хранилище блоков до следующего запуска
+    app.add_event_handler("startup", partial(start_mubarakai, app))
+    app.add_event_handler("shutdown", partial(shutdown_mubarakai, app))
+    app.add_event_handler("shutdown", close_async_blockchain_service)
+    app.add_event_handler("shutdown", close_explorer_client)
+    app.add_event_handler("shutdown", stop_queue_logging)
 
     return app
\ No newline at end of file
@@ -1,8 +1,10 @@
 import asyncio
 import hashlib
+import json
 import logging
 import random
 import os
+import time
 from contextlib import asynccontextmanager
 from dataclasses import asdict
 from datetime import datetime, timedelta
@@ -13,14 +15,29 @@ from typing import Any, Dict, List, Optional, Tuple
 import uvicorn
 import redis.asyncio as redis
 from api.server import create_app
-from sqlalchemy import func, select
+from sqlalchemy import func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from core.db_models import Base, MubarakUserDB
 from core.analytics import AnalyticsEngine
 from core.blockchain import BlockchainLedger
+from core.balance_index import BalanceIndex, reconcile_balances
+from core.block_producer import BLOCK_MAX_PENDING_TRANSACTIONS, BlockProducer
+from core.block_store import open_persistent_ledger
+from core.consensus import ChainConsensus
+from core.ledger_index import LedgerIndex
+from core.log_utils import Payload, sampled
+from core.caching import (
+    MISSING,
+    LocalCache,
+    defer_invalidation,
+    discard_deferred_invalidations,
+    flush_deferred_invalidations,
+    get_cache_engine,
+)
 from core.notifications import NotificationService
 from core.orchestrator import CrossModuleOrchestrator
 from core.recommendations import RecommendationEngine
+from core.user_context import UserContextLoader
 from models import ActivityType, ModuleType, MubarakUser, UserRole
 from modules.ar_rihla import ArRihlaModule
 from modules.baitul_hikma import BaitulHikmaModule
@@ -32,6 +49,58 @@ from modules.ummah_waqf import UmmahWaqfModule
 
 logger = logging.getLogger(__name__)
 
+# Кэш API-ключей воркера: сколько ключей помнить и как долго.
+API_KEY_CACHE_MAX_SIZE = int(os.getenv("API_KEY_CACHE_MAX_SIZE", "50000"))
+API_KEY_CACHE_TTL_SECONDS = int(os.getenv("API_KEY_CACHE_TTL_SECONDS", "300"))
+# Неизвестные ключи помним недолго: ключ мог быть только что выдан на другом воркере.
+API_KEY_NEGATIVE_TTL_SECONDS = int(os.getenv("API_KEY_NEGATIVE_TTL_SECONDS", "10"))
+# Префикс индекса "хэш API-ключа -> user_id" в Redis.
+API_KEY_INDEX_PREFIX = "apikey:"
+# Запись индекса живет ограниченное время и восстанавливается из БД при следующем обращении.
+API_KEY_INDEX_TTL_SECONDS = int(os.getenv("API_KEY_INDEX_TTL_SECONDS", "86400"))
+
+# Режим дополнительных рекомендаций в process_request:
+#   "inline"   - генерируются до ответа (как раньше);
+#   "deferred" - генерируются в фоне; если не успели за RECOMMENDATIONS_DEADLINE_MS,
+#                ответ уходит без них, а результат сохраняется для следующего дашборда
+#                и публикуется в канал recommendations:<user_id>.
+RECOMMENDATIONS_MODE = os.getenv("RECOMMENDATIONS_MODE", "inline").lower()
+RECOMMENDATIONS_DEADLINE_MS = int(os.getenv("RECOMMENDATIONS_DEADLINE_MS", "50"))
+# Сколько отложенных рекомендаций хранить на пользователя до следующего дашборда и как долго.
+PENDING_RECOMMENDATIONS_LIMIT = 20
+PENDING_RECOMMENDATIONS_TTL_SECONDS = 24 * 3600
+
+# Инициализация модулей при регистрации:
+#   "inline"   - модули инициализируются параллельно до ответа;
+#   "deferred" - в фоне, ответ возвращается сразу со статусом "pending",
+#                итог появляется в self.sessions[user_id]["module_states"].
+MODULE_INIT_MODE = os.getenv("MODULE_INIT_MODE", "inline").lower()
+# Сколько ждать инициализацию одного модуля; ошибка или таймаут модуля не отменяет регистрацию.
+MODULE_INIT_TIMEOUT_SECONDS = float(os.getenv("MODULE_INIT_TIMEOUT_SECONDS", "5"))
+
+# Сколько ждать рекомендации одного модуля для дашборда; опоздавшие модули пропускаются.
+DASHBOARD_MODULE_TIMEOUT_SECONDS = float(os.getenv("DASHBOARD_MODULE_TIMEOUT_SECONDS", "2"))
+# Собранный дашборд кэшируется на пользователя и часть дня (утро/день/вечер/ночь).
+DASHBOARD_CACHE_TTL_SECONDS = int(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "1800"))
+# Неполный дашборд (часть модулей не ответила) кэшируется ненадолго.
+DASHBOARD_PARTIAL_CACHE_TTL_SECONDS = int(os.getenv("DASHBOARD_PARTIAL_CACHE_TTL_SECONDS", "60"))
+
+# Периодическая сверка baraka_points с балансами по леджеру (0 - отключена).
+BALANCE_RECONCILE_INTERVAL_SECONDS = int(os.getenv("BALANCE_RECONCILE_INTERVAL_SECONDS", "3600"))
+# Исправлять ли найденные расхождения (иначе только логировать).
+BALANCE_RECONCILE_FIX = os.getenv("BALANCE_RECONCILE_FIX", "false").lower() == "true"
+
+
+def _day_part(now: datetime) -> str:
+    """Часть дня для ключа кэша дашборда."""
+    if 5 <= now.hour < 12:
+        return "morning"
+    if 12 <= now.hour < 17:
+        return "day"
+    if 17 <= now.hour < 23:
+        return "evening"
+    return "night"
+
 # ========== MUBARAKAI ОСНОВНОЙ КЛАСС ==========
 
 class MubarakAI:
@@ -67,23 +136,92 @@ class MubarakAI:
         self.recommendation_engine = RecommendationEngine()
         self.notification_service = NotificationService()
         self.main_ledger = BlockchainLedger()
-        # Порог для создания нового блока в блокчейне
-        self.BLOCK_CREATION_THRESHOLD = 5
+        # Цепочка хранится на диске и общая для всех воркеров узла; в пул возвращаются
+        # транзакции, сохраненные воркерами при предыдущей остановке
+        self.block_store, restored = open_persistent_ledger(self.main_ledger)
+        if restored:
+            logger.info("В пул восстановлено %s транзакций из хранилища блоков", restored)
+        # Индекс транзакций по хэшу для поиска без обхода цепочки.
+        # Он же ведет дерево Меркла пула и записывает его корень в каждый новый блок.
+        self.ledger_index = LedgerIndex(self.main_ledger)
+        self.main_ledger.chain.on_append = self.ledger_index.seal_block
+        # Балансы Барака-поинтов по подтвержденным блокам (таблица в файле хранилища блоков)
+        self.balance_index = BalanceIndex(self.block_store)
+        # Порог для создания нового блока в блокчейне (переменная окружения BLOCK_MAX_PENDING_TRANSACTIONS)
+        self.BLOCK_CREATION_THRESHOLD = BLOCK_MAX_PENDING_TRANSACTIONS
         # Уникальный идентификатор этого узла (сервера)
         self.node_identifier = str(uuid4()).replace('-', '')
-        # Ссылка на фоновую задачу для корректного завершения
+        # Блоки собираются в фоне по размеру пула или по времени, а не внутри запросов
+        self.block_producer = BlockProducer(
+            self.main_ledger,
+            miner=self.node_identifier,
+            max_pending=self.BLOCK_CREATION_THRESHOLD,
+            on_block=self.balance_index.request_sync,
+        )
+        # Ссылки на фоновые задачи для корректного завершения
         self.block_creation_task = None
+        self.balance_reconciliation_task = None
+        # Фоновые задачи генерации рекомендаций (ссылки нужны, чтобы их не собрал GC)
+        self.recommendation_tasks = set()
+        # Фоновые задачи инициализации модулей при MODULE_INIT_MODE="deferred"
+        self.module_init_tasks = set()
         # Множество для хранения адресов соседних узлов
         self.nodes = set()
+        self.consensus = ChainConsensus(
+            self.main_ledger, lambda: list(self.nodes), balances=self.balance_index.current_balances
+        )
 
         # --- Инициализация клиента Redis ---
         redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
         self.redis = redis.from_url(redis_url, decode_responses=True)
+        # LRU "хэш API-ключа -> user_id" (None - ключ не найден) перед индексом в Redis и БД
+        self.api_key_cache = LocalCache(API_KEY_CACHE_MAX_SIZE, API_KEY_CACHE_TTL_SECONDS)
+        # Контекст пользователя для модулей (язык, роли, настройки), кэшируется на несколько секунд
+        self.user_contexts = UserContextLoader()
         for module in self.modules.values():
             module.set_redis_client(self.redis)
             module.set_notification_service(self.notification_service)
             module.set_ledger(self.main_ledger)
 
+    def start_background_tasks(self):
+        """
+        Запускает фоновое создание блоков и периодическую сверку балансов.
+        Регистрируется обработчиком startup приложения (main.create_app).
+        """
+        if self.block_creation_task is None:
+            self.block_creation_task = asyncio.create_task(self._periodic_block_creation_task())
+        if self.balance_reconciliation_task is None and BALANCE_RECONCILE_INTERVAL_SECONDS > 0:
+            self.balance_reconciliation_task = asyncio.create_task(self._periodic_balance_reconciliation_task())
+
+    async def shutdown(self):
+        """
+        Останавливает фоновые задачи, закрывает клиент консенсуса и хранилище блоков.
+        Регистрируется обработчиком shutdown приложения (main.create_app).
+        """
+        for name in ("balance_reconciliation_task", "block_creation_task"):
+            task = getattr(self, name)
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            setattr(self, name, None)
+        # HTTP-клиент соседних узлов и пул процессов проверки блоков
+        await self.consensus.close()
+        self.close_ledger_store()
+
+    def close_ledger_store(self):
+        """
+        Сохраняет неподтвержденные транзакции и закрывает хранилище блоков.
+        Вызывается при остановке приложения, после отмены block_creation_task.
+        """
+        self.block_store.spill_pending(self.main_ledger.pending_transactions)
+        self.main_ledger.pending_transactions = []
+        self.balance_index.close()
+        self.block_store.close()
+
     async def create_db_tables(self):
         """Создает таблицы в БД, если их нет."""
         async with self.engine.begin() as conn:
@@ -97,15 +235,21 @@ class MubarakAI:
             # Сюда же можно добавить seed'еры для других модулей
 
     async def _periodic_block_creation_task(self):
-        """Фоновая задача, которая создает новый блок каждые 10 минут, если есть транзакции."""
-        while True:
-            await asyncio.sleep(600)  # 10 минут
-            if self.main_ledger.pending_transactions:
-                self.logger.info("Периодическая задача: создание нового блока для ожидающих транзакций.")
-                self.main_ledger.create_block(proof=random.randint(1, 100000), miner=self.node_identifier) # pragma: no cover
-            else:
-                self.logger.info("Периодическая задача: нет ожидающих транзакций, блок не создан.") # pragma: no cover
+        """
+        Фоновая задача создания блоков.
+        Блок создается, когда в пуле набирается BLOCK_CREATION_THRESHOLD транзакций
+        или когда самая старая транзакция ждет BLOCK_MAX_INTERVAL_SECONDS.
+        """
+        await self.block_producer.run()
 
+    async def _periodic_balance_reconciliation_task(self):
+        """Фоновая задача сверки baraka_points с леджером раз в BALANCE_RECONCILE_INTERVAL_SECONDS."""
+        while True:
+            await asyncio.sleep(BALANCE_RECONCILE_INTERVAL_SECONDS)
+            try:
+                await self.reconcile_baraka_balances(fix=BALANCE_RECONCILE_FIX)
+            except Exception:
+                logger.exception("Периодическая сверка балансов не удалась")
 
     @asynccontextmanager
     async def get_db_session(self):
@@ -150,24 +294,34 @@ class MubarakAI:
                 )
                 db_session.add(new_user_db)
                 await db_session.commit()
+            await self._index_api_key(api_key, user_id)
 
-            module_initializations = {}
-            for module_type, module in self.modules.items():
-                # TODO: Передать dataclass MubarakUser, а не объект БД
-                if hasattr(module, 'initialize'):
-                    module_initializations[module_type.value] = await module.initialize(user)
+            if MODULE_INIT_MODE == "deferred":
+                module_initializations = {
+                    module_type.value: {"status": "pending"}
+                    for module_type, module in self.modules.items() if hasattr(module, 'initialize')
+                }
+                task = asyncio.create_task(self._initialize_modules(user))
+                self.module_init_tasks.add(task)
+                task.add_done_callback(lambda t: self._on_modules_initialized(user_id, t))
+                welcome_package = await self._generate_welcome_package(user)
+            else:
+                module_initializations, welcome_package = await asyncio.gather(
+                    self._initialize_modules(user), self._generate_welcome_package(user)
+                )
 
-            self.sessions[user_id] = {
+            # Фоновая задача могла уже завершиться и записать итоговые состояния
+            self.sessions.setdefault(user_id, {
                 "created_at": datetime.now().isoformat(),
                 "active_modules": list(self.modules.keys()),
                 "module_states": module_initializations
-            }
-            welcome_package = await self._generate_welcome_package(user)
-            
+            })
+
             return True, user_id, {
                 "user": asdict(user),
                 "api_key": api_key,
                 "module_initializations": module_initializations,
+                "module_initializations_pending": MODULE_INIT_MODE == "deferred",
                 "welcome_package": welcome_package,
                 "next_steps": [
                     "complete_profile",
@@ -177,9 +331,36 @@ class MubarakAI:
                 ]
             }
         except Exception as e:
-            logger.exception(f"Ошибка регистрации пользователя: {user_data.get('email')}")
+            logger.exception("Ошибка регистрации пользователя: %s", user_data.get("email"))
             return False, str(e), {}
 
+    async def _initialize_modules(self, user: MubarakUser) -> Dict[str, Any]:
+        """Инициализирует модули параллельно; сбой одного модуля не влияет на остальные."""
+        # TODO: Передать dataclass MubarakUser, а не объект БД
+        modules = [(module_type, module) for module_type, module in self.modules.items() if hasattr(module, 'initialize')]
+        results = await asyncio.gather(*(self._initialize_module(module_type, module, user) for module_type, module in modules))
+        return {module_type.value: result for (module_type, _), result in zip(modules, results)}
+
+    async def _initialize_module(self, module_type: ModuleType, module, user: MubarakUser) -> Any:
+        try:
+            return await asyncio.wait_for(module.initialize(user), MODULE_INIT_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Модуль %s не успел инициализироваться для пользователя %s", module_type.value, user.user_id)
+            return {"status": "failed", "error": "timeout"}
+        except Exception as e:
+            logger.exception("Ошибка инициализации модуля %s для пользователя %s", module_type.value, user.user_id)
+            return {"status": "failed", "error": str(e)}
+
+    def _on_modules_initialized(self, user_id: str, task: asyncio.Task) -> None:
+        self.module_init_tasks.discard(task)
+        if task.cancelled():
+            return
+        session = self.sessions.setdefault(user_id, {
+            "created_at": datetime.now().isoformat(),
+            "active_modules": list(self.modules.keys()),
+        })
+        session["module_states"] = task.result()
+
     def register_nodes(self, nodes: List[str]) -> Dict[str, Any]:
         """
         Регистрирует новые узлы в сети.
@@ -196,111 +377,333 @@ class MubarakAI:
                 else:
                     raise ValueError(f"Некорректный URL узла: {node_url}")
             except ValueError as e:
-                logger.warning(f"Ошибка при регистрации узла: {e}")
+                logger.warning("Ошибка при регистрации узла: %s", e)
         
         return {"message": "Новые узлы успешно добавлены", "total_nodes": list(self.nodes)}
-    
+
+    async def resolve_conflicts(self) -> Dict[str, Any]:
+        """Консенсус: переходит на самую длинную корректную цепочку среди зарегистрированных узлов."""
+        replaced = await self.consensus.resolve()
+        return {
+            "message": "Цепочка заменена" if replaced else "Наша цепочка актуальна",
+            "replaced": replaced,
+            "length": len(self.main_ledger.chain),
+        }
+
+    def get_ledger_balance(self, user_id: str) -> int:
+        """Баланс Барака-поинтов пользователя по подтвержденным блокам."""
+        return self.balance_index.balance(user_id)
+
+    async def reconcile_baraka_balances(self, fix: bool = False) -> Dict[str, Any]:
+        """
+        Фоновая сверка baraka_points пользователей с балансами по леджеру.
+        При fix=True в БД записываются балансы из леджера.
+        """
+        async with self.get_db_session() as db_session:
+            mismatches = await reconcile_balances(self.balance_index, db_session, MubarakUserDB, fix=fix)
+        if mismatches:
+            logger.warning("Сверка балансов: найдено %d расхождений с леджером", len(mismatches))
+        return {"mismatches": mismatches, "fixed": fix}
+
     async def process_request(self, user_id: str, request: Dict) -> Dict[str, Any]:
         """Обработка запроса пользователя"""
         request_id = hashlib.sha256(f"{user_id}{datetime.now().isoformat()}".encode()).hexdigest()[:8]
-        logger.info(f"[RequestID: {request_id}] Получен запрос от пользователя {user_id}: {request}")
+        log_extra = {"request_id": request_id, "user_id": user_id}
+        logger.info(
+            "[RequestID: %s] Получен запрос от пользователя %s: type=%s module=%s",
+            request_id, user_id, request.get("type"), request.get("module"), extra=log_extra,
+        )
+        if logger.isEnabledFor(logging.DEBUG) and sampled():
+            logger.debug("[RequestID: %s] Тело запроса: %s", request_id, Payload(request), extra=log_extra)
         
         request_type = request.get("type")
         module_name = request.get("module")
         module_type = ModuleType(module_name) if module_name else ModuleType.FARD_AI
         
         if module_type not in self.modules:
-            logger.error(f"[RequestID: {request_id}] Запрошен несуществующий модуль: {module_name}")
+            logger.error("[RequestID: %s] Запрошен несуществующий модуль: %s", request_id, module_name)
             return {"error": "Модуль не найден"}
 
         module = self.modules[module_type]
         if not hasattr(module, 'process_request'):
-             logger.error(f"[RequestID: {request_id}] У модуля {module_type.value} отсутствует метод process_request")
+             logger.error("[RequestID: %s] У модуля %s отсутствует метод process_request", request_id, module_type.value)
              return {"error": f"Module {module_type.value} does not have process_request method"}
 
         # --- Управление сессией на запрос ---
         async with self.get_db_session() as db_session:
             try:
-                # Получаем язык пользователя для передачи в модуль
-                user_db = (await db_session.execute(select(MubarakUserDB.language).where(MubarakUserDB.user_id == user_id))).scalars().first()
-                if user_db:
-                    request['user_language'] = user_db
+                # Загружаем контекст пользователя одним запросом и передаем его в модуль,
+                # чтобы модулю не нужно было повторно загружать пользователя
+                user_context = await self.user_contexts.get(db_session, user_id)
+                if user_context:
+                    request['user_context'] = user_context
+                    if user_context.language:
+                        request['user_language'] = user_context.language
 
-                logger.info(f"[RequestID: {request_id}] Передача запроса в модуль {module_type.value}")
+                logger.debug("[RequestID: %s] Передача запроса в модуль %s", request_id, module_type.value, extra=log_extra)
                 # Передаем сессию в модуль
                 result = await module.process_request(user_id, request, db_session=db_session)
-                logger.info(f"[RequestID: {request_id}] Модуль {module_type.value} вернул результат: {result}")
+                logger.info(
+                    "[RequestID: %s] Модуль %s вернул результат: success=%s",
+                    request_id, module_type.value, result.get("success"), extra=log_extra,
+                )
+                if logger.isEnabledFor(logging.DEBUG) and sampled():
+                    logger.debug("[RequestID: %s] Результат модуля: %s", request_id, Payload(result), extra=log_extra)
 
                 # Коммитим изменения, если модуль отработал успешно и не вернул ошибку
                 if result.get("success"):
                     await db_session.commit()
+                    # Модуль мог изменить данные пользователя (очки, настройки)
+                    self.user_contexts.invalidate(user_id)
+                    defer_invalidation(db_session, f"user:{user_id}")
+                    # Кэш сбрасываем только после коммита, иначе параллельный запрос
+                    # может успеть закэшировать еще не закоммиченные данные.
+                    await flush_deferred_invalidations(self.redis, db_session)
                 else:
                     # Модуль мог вернуть success: False, откатывать транзакцию не обязательно,
                     # так как модуль не должен был делать изменений.
                     await db_session.rollback()
+                    discard_deferred_invalidations(db_session)
 
                 # TODO: Логику обновления статистики пользователя также нужно перенести сюда
                 # await self._update_user_stats(user_id, request_type, result, db_session)
 
-                logger.info(f"[RequestID: {request_id}] Генерация дополнительных рекомендаций")
+                logger.debug("[RequestID: %s] Генерация дополнительных рекомендаций", request_id, extra=log_extra)
 
-                # --- Оптимизация создания блоков ---
-                # Если в пуле накопилось достаточно транзакций, создаем новый блок
-                if len(self.main_ledger.pending_transactions) >= self.BLOCK_CREATION_THRESHOLD:
-                    self.logger.info(f"Достигнут порог в {self.BLOCK_CREATION_THRESHOLD} транзакций. Создание нового блока...")
-                    self.main_ledger.create_block(proof=random.randint(1, 100000), miner=self.node_identifier)
+                # Модуль мог добавить транзакции в пул: дерево Меркла пула дополняется сразу,
+                # а блок соберет фоновый производитель
+                self.ledger_index.sync()
+                self.block_producer.notify()
 
-                additional_recommendations = await self.recommendation_engine.generate_recommendations(
+                additional_recommendations, pending = await self._get_additional_recommendations(
                     user_id, request_type, result
                 )
-                
+
                 final_response = {
                     **result,
                     "additional_recommendations": additional_recommendations,
                     # "user_stats": await self._get_user_stats(user_id) # Тоже нужно переделать под БД
                 }
-                logger.info(f"[RequestID: {request_id}] Отправка финального ответа пользователю.")
+                if pending:
+                    final_response["recommendations_pending"] = True
+                logger.debug("[RequestID: %s] Отправка финального ответа пользователю.", request_id, extra=log_extra)
                 return final_response
 
             except Exception as e:
                 # Роллбэк теперь обрабатывается в контекстном менеджере
-                logger.exception(f"[RequestID: {request_id}] Критическая ошибка при обработке запроса в модуле {module_type.value} для пользователя {user_id}")
+                logger.exception(
+                    "[RequestID: %s] Критическая ошибка при обработке запроса в модуле %s для пользователя %s",
+                    request_id, module_type.value, user_id, extra=log_extra,
+                )
                 return {"success": False, "error": "Произошла внутренняя ошибка сервера."}
     
     async def get_daily_dashboard(self, user_id: str) -> Dict[str, Any]:
-        """Получение ежедневного дашборда"""
-        # TODO: Этот метод также нужно переписать для работы с БД
-        # Вместо self.users[user_id] нужно будет делать запрос к БД
-        # и передавать сессию в process_request
+        """
+        Получение ежедневного дашборда.
+        Модули опрашиваются параллельно, результат кэшируется на пользователя и часть дня
+        (тег "user:<id>" сбрасывается после изменений в process_request).
+        """
+        now = datetime.now()
+        cache = get_cache_engine(self.redis)
+        cache_key = f"dashboard:{user_id}:{now.date().isoformat()}:{_day_part(now)}"
+        try:
+            dashboard = await cache.get(cache_key)
+        except redis.RedisError as e:
+            logger.warning("Кэш дашборда недоступен: %s", e)
+            dashboard = MISSING
+
+        if dashboard is MISSING:
+            started = time.time()
+            dashboard = await self._build_daily_dashboard(user_id)
+            if "error" in dashboard:
+                return dashboard
+            ttl = DASHBOARD_PARTIAL_CACHE_TTL_SECONDS if dashboard["failed_modules"] else DASHBOARD_CACHE_TTL_SECONDS
+            try:
+                await cache.set(cache_key, dashboard, ttl, tags=(f"user:{user_id}",), computed_since=started)
+            except (redis.RedisError, TypeError, ValueError) as e:
+                logger.warning("Не удалось закэшировать дашборд пользователя %s: %s", user_id, e)
+
+        # Рекомендации, которые не успели попасть в ответы process_request, не кэшируются
+        pending = await self._get_pending_recommendations(user_id)
+        return {**dashboard, "recommendations": dashboard["recommendations"] + pending}
+
+    async def _build_daily_dashboard(self, user_id: str) -> Dict[str, Any]:
         async with self.get_db_session() as db_session:
-            user_db = (await db_session.execute(select(MubarakUserDB).where(MubarakUserDB.user_id == user_id))).scalars().first()
-            if not user_db:
-                return {"error": "Пользователь не найден"}
-
-            # --- Оркестрация для сбора контекста ---
-            dashboard_context = {
-                "db_session": db_session,
-                "user_career_level": user_db.career_level
-            }
-            
-            all_recommendations = []
-            for module_type, module in self.modules.items():
-                try:
-                    recs = await module.get_daily_recommendations(user_id, context=dashboard_context)
-                    all_recommendations.extend(recs)
-                except Exception as e:
-                    logger.warning(f"Не удалось получить рекомендации от модуля {module_type.value}: {e}")
-                    continue
-            
-            # ... остальная логика дашборда (требует дальнейшего рефакторинга)
-            return {"user_name": user_db.full_name, "recommendations": all_recommendations}
+            stmt = select(MubarakUserDB.full_name, MubarakUserDB.career_level).where(MubarakUserDB.user_id == user_id)
+            user_row = (await db_session.execute(stmt)).first()
+        if not user_row:
+            return {"error": "Пользователь не найден"}
+
+        module_types = list(self.modules)
+        results = await asyncio.gather(*(
+            self._get_module_recommendations(module_type, user_id, user_row.career_level)
+            for module_type in module_types
+        ))
+        all_recommendations = []
+        failed_modules = []
+        for module_type, recs in zip(module_types, results):
+            if recs is None:
+                failed_modules.append(module_type.value)
+            else:
+                all_recommendations.extend(recs)
+
+        # ... остальная логика дашборда (требует дальнейшего рефакторинга)
+        return {
+            "user_name": user_row.full_name,
+            "recommendations": all_recommendations,
+            "failed_modules": failed_modules,
+        }
+
+    async def _get_module_recommendations(self, module_type: ModuleType, user_id: str, career_level) -> Optional[List]:
+        """
+        Рекомендации одного модуля для дашборда. У каждого модуля своя сессия,
+        так как AsyncSession нельзя использовать из параллельных задач.
+        Возвращает None, если модуль не ответил за DASHBOARD_MODULE_TIMEOUT_SECONDS или упал.
+        """
+        async with self.get_db_session() as db_session:
+            context = {"db_session": db_session, "user_career_level": career_level}
+            try:
+                return await asyncio.wait_for(
+                    self.modules[module_type].get_daily_recommendations(user_id, context=context),
+                    DASHBOARD_MODULE_TIMEOUT_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Модуль %s не успел вернуть рекомендации для дашборда", module_type.value)
+            except Exception as e:
+                logger.warning("Не удалось получить рекомендации от модуля %s: %s", module_type.value, e)
+        return None
+
+    async def _get_additional_recommendations(self, user_id: str, request_type: str, result: Dict) -> Tuple[List, bool]:
+        """
+        Возвращает дополнительные рекомендации для ответа и флаг "генерируются в фоне".
+        В режиме "deferred" ждет генерацию не дольше RECOMMENDATIONS_DEADLINE_MS.
+        """
+        if RECOMMENDATIONS_MODE != "deferred":
+            recommendations = await self.recommendation_engine.generate_recommendations(user_id, request_type, result)
+            return recommendations, False
+
+        task = asyncio.create_task(self.recommendation_engine.generate_recommendations(user_id, request_type, result))
+        try:
+            # shield: по таймауту отменяется только ожидание, а не сама генерация
+            return await asyncio.wait_for(asyncio.shield(task), RECOMMENDATIONS_DEADLINE_MS / 1000), False
+        except asyncio.TimeoutError:
+            self.recommendation_tasks.add(task)
+            task.add_done_callback(lambda t: self._on_recommendations_ready(user_id, t))
+            return [], True
+
+    def _on_recommendations_ready(self, user_id: str, task: asyncio.Task) -> None:
+        self.recommendation_tasks.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.warning("Фоновая генерация рекомендаций для пользователя %s не удалась: %s", user_id, task.exception())
+            return
+        if task.result():
+            store = asyncio.create_task(self._store_pending_recommendations(user_id, task.result()))
+            self.recommendation_tasks.add(store)
+            store.add_done_callback(self.recommendation_tasks.discard)
+
+    async def _store_pending_recommendations(self, user_id: str, recommendations: List) -> None:
+        """Сохраняет рекомендации для следующего дашборда и уведомляет подписчиков канала."""
+        key = f"recommendations:pending:{user_id}"
+        payloads = [json.dumps(rec, ensure_ascii=False, default=str) for rec in recommendations]
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.rpush(key, *payloads)
+                pipe.ltrim(key, -PENDING_RECOMMENDATIONS_LIMIT, -1)
+                pipe.expire(key, PENDING_RECOMMENDATIONS_TTL_SECONDS)
+                await pipe.execute()
+            await self.redis.publish(f"recommendations:{user_id}", json.dumps(recommendations, ensure_ascii=False, default=str))
+        except redis.RedisError as e:
+            logger.warning("Не удалось сохранить отложенные рекомендации для пользователя %s: %s", user_id, e)
+
+    async def _get_pending_recommendations(self, user_id: str) -> List:
+        """
+        Забирает рекомендации, сгенерированные в фоне после ответов process_request.
+        Список вычитывается и удаляется атомарно, поэтому каждая рекомендация
+        попадает ровно в один дашборд, даже при параллельных запросах.
+        """
+        key = f"recommendations:pending:{user_id}"
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.lrange(key, 0, -1)
+                pipe.delete(key)
+                payloads, _ = await pipe.execute()
+        except redis.RedisError as e:
+            logger.warning("Не удалось получить отложенные рекомендации для пользователя %s: %s", user_id, e)
+            return []
+        return [json.loads(payload) for payload in payloads]
     
     async def get_user_by_api_key(self, api_key: str) -> Optional[str]:
-        """Находит user_id по API-ключу."""
+        """
+        Находит user_id по API-ключу.
+        Порядок поиска: LRU воркера -> индекс хэшей ключей в Redis -> БД (только колонка user_id).
+        В БД ключи по-прежнему хранятся открытым текстом (колонка api_key), поэтому
+        запасной путь сравнивает ключ как есть; в Redis попадает только его хэш.
+        """
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+        user_id = self.api_key_cache.get(key_hash)
+        if user_id is not MISSING:
+            return user_id
+
+        try:
+            user_id = await self.redis.get(f"{API_KEY_INDEX_PREFIX}{key_hash}")
+        except redis.RedisError as e:
+            logger.warning("Индекс API-ключей в Redis недоступен: %s", e)
+            user_id = None
+        if user_id:
+            self.api_key_cache.set(key_hash, user_id)
+            return user_id
+
         async with self.get_db_session() as db_session:
-            stmt = select(MubarakUserDB).where(MubarakUserDB.api_key == api_key)
-            user = (await db_session.execute(stmt)).scalars().first()
-            return user.user_id if user else None
+            stmt = select(MubarakUserDB.user_id).where(MubarakUserDB.api_key == api_key)
+            user_id = (await db_session.execute(stmt)).scalar_one_or_none()
+
+        if user_id is None:
+            self.api_key_cache.set(key_hash, None, ttl=API_KEY_NEGATIVE_TTL_SECONDS)
+            return None
+        await self._index_api_key(api_key, user_id)
+        return user_id
+
+    async def _index_api_key(self, api_key: str, user_id: str) -> None:
+        """Добавляет ключ в LRU воркера и в индекс Redis (хранится только хэш ключа)."""
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+        self.api_key_cache.set(key_hash, user_id)
+        try:
+            await self.redis.set(f"{API_KEY_INDEX_PREFIX}{key_hash}", user_id, ex=API_KEY_INDEX_TTL_SECONDS)
+        except redis.RedisError as e:
+            logger.warning("Не удалось добавить API-ключ в индекс Redis: %s", e)
+
+    async def _unindex_api_key(self, api_key: str) -> None:
+        """Удаляет ключ из LRU воркера и индекса Redis (после перевыпуска или удаления пользователя)."""
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+        self.api_key_cache.delete(key_hash)
+        try:
+            await self.redis.delete(f"{API_KEY_INDEX_PREFIX}{key_hash}")
+        except redis.RedisError as e:
+            # Запись истечет сама через API_KEY_INDEX_TTL_SECONDS
+            logger.warning("Не удалось удалить API-ключ из индекса Redis: %s", e)
+
+    async def rotate_api_key(self, user_id: str) -> Optional[str]:
+        """
+        Выпускает пользователю новый API-ключ. Старый ключ сразу перестает
+        находиться через Redis; в LRU других воркеров он живет не дольше
+        API_KEY_CACHE_TTL_SECONDS. Возвращает новый ключ или None, если пользователь не найден.
+        """
+        api_key = hashlib.sha256(f"{user_id}{datetime.now().isoformat()}{uuid4().hex}".encode()).hexdigest()
+        async with self.get_db_session() as db_session:
+            old_key = (await db_session.execute(
+                select(MubarakUserDB.api_key).where(MubarakUserDB.user_id == user_id)
+            )).scalar_one_or_none()
+            if old_key is None:
+                return None
+            await db_session.execute(
+                update(MubarakUserDB).where(MubarakUserDB.user_id == user_id).values(api_key=api_key)
+            )
+            await db_session.commit()
+        await self._unindex_api_key(old_key)
+        await self._index_api_key(api_key, user_id)
+        return api_key
 
     async def get_user_by_id(self, user_id: str) -> Optional[MubarakUser]:
         """Находит объект пользователя по ID."""
@@ -683,5 +1086,9 @@ class MubarakAI:
         return achievements.get(module_type, [])
     
     async def get_transaction_by_hash(self, tx_hash: str) -> Optional[Dict]:
-        """Находит транзакцию в главном реестре по ее хешу."""
-        return self.main_ledger.find_transaction(tx_hash)
\ No newline at end of file
+        """
+        Находит транзакцию в главном реестре по ее хешу.
+        Индекс синхронизируется с цепочкой и пулом при каждом поиске, поэтому промах
+        означает, что транзакции нет: цепочка повторно не обходится.
+        """
+        return self.ledger_index.find(tx_hash)
\ No newline at end of file
@@ -0,0 +1,86 @@
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+# Префиксы разделяют хэши листьев и внутренних узлов,
+# чтобы внутренний узел нельзя было выдать за транзакцию.
+_LEAF_PREFIX = b"\x00"
+_NODE_PREFIX = b"\x01"
+
+
+def leaf_hash(tx_hash: str) -> bytes:
+    """Хэш листа дерева для транзакции с хэшем `tx_hash` (см. ledger_index.transaction_hash)."""
+    return hashlib.sha256(_LEAF_PREFIX + tx_hash.encode()).digest()
+
+
+def _node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(_NODE_PREFIX + left + right).digest()
+
+
+class MerkleTree:
+    """
+    Дерево Меркла, которое строится инкрементально по мере добавления листьев.
+
+    Добавление листа пересчитывает только путь от него до корня (O(log n)),
+    корень доступен за O(1). Узел без пары переносится на уровень выше без изменений.
+    """
+
+    def __init__(self, tx_hashes: Iterable[str] = ()):
+        # levels[0] - листья, levels[-1] - корень
+        self._levels: List[List[bytes]] = [[]]
+        for tx_hash in tx_hashes:
+            self.append(tx_hash)
+
+    def __len__(self) -> int:
+        return len(self._levels[0])
+
+    def append(self, tx_hash: str) -> None:
+        node = leaf_hash(tx_hash)
+        index = len(self._levels[0])
+        self._levels[0].append(node)
+        level = 0
+        while len(self._levels[level]) > 1:
+            if index % 2 == 1:
+                node = _node_hash(self._levels[level][index - 1], node)
+            index //= 2
+            if level + 1 == len(self._levels):
+                self._levels.append([])
+            parents = self._levels[level + 1]
+            if index < len(parents):
+                parents[index] = node
+            else:
+                parents.append(node)
+            level += 1
+
+    @property
+    def root(self) -> Optional[str]:
+        """Корень дерева (hex) или None для пустого дерева."""
+        top = self._levels[-1]
+        return top[0].hex() if top else None
+
+    @property
+    def last_leaf(self) -> Optional[bytes]:
+        return self._levels[0][-1] if self._levels[0] else None
+
+    def proof(self, index: int) -> List[Dict[str, str]]:
+        """
+        Доказательство включения листа `index`: хэши соседей от листа к корню
+        и сторона, с которой сосед присоединяется ("left" или "right").
+        """
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        path = []
+        for level in self._levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                path.append({"hash": level[sibling].hex(), "position": "left" if sibling < index else "right"})
+            index //= 2
+        return path
+
+
+def verify_proof(tx_hash: str, proof: List[Dict[str, str]], root: str) -> bool:
+    """Проверяет, что транзакция входит в дерево с корнем `root`."""
+    node = leaf_hash(tx_hash)
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        node = _node_hash(sibling, node) if step["position"] == "left" else _node_hash(node, sibling)
+    return node.hex() == root
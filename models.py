@@ -1,4 +1,7 @@
-from sqlalchemy import Integer, String, Boolean, JSON, DateTime, func, ForeignKey, Float
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import BigInteger, Integer, String, Boolean, JSON, DateTime, func, ForeignKey, Float, Numeric
 from sqlalchemy.orm import Mapped, mapped_column, relationship, MappedAsDataclass
 
 from src.db.base import Base
@@ -83,4 +86,76 @@ class Waqf(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
     creator: Mapped["User"] = relationship(back_populates="created_waqfs")
-    donations: Mapped[list["WaqfDonation"]] = relationship(back_populates="waqf")
\ No newline at end of file
+    donations: Mapped[list["WaqfDonation"]] = relationship(back_populates="waqf")
+
+
+# --- Индекс событий контрактов WaqfProject (см. services/waqf_indexer.py и mapping.ts) ---
+# Суммы хранятся в wei: Numeric(78, 0) вмещает любое uint256.
+
+class IndexedProject(Base):
+    """Проект WaqfProject, по которому были события."""
+    __tablename__ = "indexed_projects"
+
+    address: Mapped[str] = mapped_column(String(42), primary_key=True)
+    beneficiary: Mapped[str | None] = mapped_column(String(42), nullable=True)
+    goal_amount: Mapped[Decimal] = mapped_column(Numeric(78, 0), server_default='0', nullable=False)
+    deadline: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    raised_amount: Mapped[Decimal] = mapped_column(Numeric(78, 0), server_default='0', nullable=False)
+
+    donors: Mapped[list["IndexedDonor"]] = relationship(back_populates="project")
+    milestones: Mapped[list["IndexedMilestone"]] = relationship(back_populates="project", order_by="IndexedMilestone.milestone_index")
+
+
+class IndexedDonor(Base):
+    """Сумма и число пожертвований донора в проект."""
+    __tablename__ = "indexed_donors"
+
+    project_address: Mapped[str] = mapped_column(ForeignKey("indexed_projects.address"), primary_key=True)
+    address: Mapped[str] = mapped_column(String(42), primary_key=True)
+    total_donated: Mapped[Decimal] = mapped_column(Numeric(78, 0), nullable=False)
+    contributions_count: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    project: Mapped["IndexedProject"] = relationship(back_populates="donors")
+
+
+class IndexedContribution(Base):
+    """Отдельное пожертвование (событие DonationReceived)."""
+    __tablename__ = "indexed_contributions"
+
+    tx_hash: Mapped[str] = mapped_column(String(66), primary_key=True)
+    log_index: Mapped[int] = mapped_column(Integer, primary_key=True)
+    project_address: Mapped[str] = mapped_column(ForeignKey("indexed_projects.address"), index=True, nullable=False)
+    donor_address: Mapped[str] = mapped_column(String(42), nullable=False)
+    amount: Mapped[Decimal] = mapped_column(Numeric(78, 0), nullable=False)
+    block_number: Mapped[int] = mapped_column(BigInteger, index=True, nullable=False)
+
+
+class IndexedMilestone(Base):
+    """Этап проекта и факт выплаты по нему (событие MilestonePaid)."""
+    __tablename__ = "indexed_milestones"
+
+    project_address: Mapped[str] = mapped_column(ForeignKey("indexed_projects.address"), primary_key=True)
+    milestone_index: Mapped[int] = mapped_column(Integer, primary_key=True)
+    description: Mapped[str | None] = mapped_column(String, nullable=True)
+    amount: Mapped[Decimal] = mapped_column(Numeric(78, 0), server_default='0', nullable=False)
+    is_paid: Mapped[bool] = mapped_column(Boolean, server_default='false', nullable=False)
+    paid_block: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+
+    project: Mapped["IndexedProject"] = relationship(back_populates="milestones")
+
+
+class IndexedBlock(Base):
+    """Хэши недавно обработанных блоков - для обнаружения реорганизаций цепочки."""
+    __tablename__ = "indexed_blocks"
+
+    number: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    hash: Mapped[str] = mapped_column(String(66), nullable=False)
+
+
+class IndexerCheckpoint(Base):
+    """Последний обработанный блок индексатора."""
+    __tablename__ = "indexer_checkpoints"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    block_number: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    block_hash: Mapped[str | None] = mapped_column(String(66), nullable=True)
@@ -0,0 +1,70 @@
+from typing import List
+
+from fastapi import APIRouter, Body, Depends, Query
+
+from api.security import require_role
+from core.consensus import CONSENSUS_PAGE_SIZE, block_hash
+from core.dependencies import get_mubarak_ai_instance
+from core.main_app import MubarakAI
+from models import UserRole
+
+# Протокол обмена цепочками между узлами. Роутер подключается в router.py;
+# итоговые пути должны совпадать с CONSENSUS_NODE_API_PREFIX. Чтение цепочки открыто
+# для соседних узлов, а регистрация узлов и запуск консенсуса - только для администраторов.
+router = APIRouter(
+    prefix="/nodes",
+    tags=["Nodes"],
+)
+
+
+@router.post("/register")
+async def register_nodes(
+    nodes: List[str] = Body(..., embed=True),
+    user_id: str = Depends(require_role(UserRole.ADMIN)),
+    mubarakai: MubarakAI = Depends(get_mubarak_ai_instance),
+):
+    """Регистрирует соседние узлы сети."""
+    return mubarakai.register_nodes(nodes)
+
+
+@router.post("/resolve")
+async def resolve_conflicts(
+    user_id: str = Depends(require_role(UserRole.ADMIN)),
+    mubarakai: MubarakAI = Depends(get_mubarak_ai_instance),
+):
+    """Запускает консенсус: переход на самую длинную корректную цепочку соседей."""
+    return await mubarakai.resolve_conflicts()
+
+
+@router.get("/chain/summary")
+async def chain_summary(mubarakai: MubarakAI = Depends(get_mubarak_ai_instance)):
+    """Длина цепочки и хэш последнего блока."""
+    chain = mubarakai.main_ledger.chain
+    length = len(chain)
+    return {"length": length, "tip_hash": block_hash(chain[length - 1]) if length else None}
+
+
+@router.get("/chain/hashes")
+async def chain_hashes(
+    start: int = Query(0, ge=0),
+    stop: int = Query(..., ge=0),
+    mubarakai: MubarakAI = Depends(get_mubarak_ai_instance),
+):
+    """Хэши блоков на позициях [start, stop) - для поиска общего предка."""
+    chain = mubarakai.main_ledger.chain
+    stop = min(stop, len(chain), start + CONSENSUS_PAGE_SIZE)
+    return {"hashes": [block_hash(block) for block in chain[start:stop]]}
+
+
+@router.get("/chain/blocks")
+async def chain_blocks(
+    start: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    mubarakai: MubarakAI = Depends(get_mubarak_ai_instance),
+):
+    """
+    Блоки начиная с позиции start, не больше CONSENSUS_PAGE_SIZE за запрос;
+    клиент консенсуса дозапрашивает остаток, если страница короче запрошенной.
+    """
+    chain = mubarakai.main_ledger.chain
+    return {"blocks": chain[start:start + min(limit, CONSENSUS_PAGE_SIZE)]}
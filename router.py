@@ -4,6 +4,7 @@ from fastapi import APIRouter
 from src.api.v1.endpoints import users
 from src.api.v1.endpoints import blockchain
 from src.api.v1.endpoints import ai_analysis # 1. Импортируем роутер анализа
+from src.api.v1.endpoints import nodes
 
 
 api_router = APIRouter()
@@ -11,4 +12,6 @@ api_router = APIRouter()
 # Подключаем роутеры из модулей, указывая префикс и теги для группировки в документации
 api_router.include_router(users.router, prefix="/users", tags=["Users"])
 api_router.include_router(blockchain.router, prefix="/blockchain", tags=["Blockchain"])
-api_router.include_router(ai_analysis.router, prefix="/ai", tags=["AI Analysis"]) # 2. Подключаем роутер анализа
\ No newline at end of file
+api_router.include_router(ai_analysis.router, prefix="/ai", tags=["AI Analysis"]) # 2. Подключаем роутер анализа
+# Протокол обмена цепочками между узлами (префикс /nodes задан в самом роутере)
+api_router.include_router(nodes.router)
\ No newline at end of file
@@ -1,25 +1,114 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, Callable, Optional, Tuple
 
+from fastapi import status
 from jose import jwt
 from passlib.context import CryptContext
 
 from src.core.config import settings
+from src.core.exceptions import DetailedHTTPException
 
-# Создаем контекст для хэширования паролей, указывая алгоритм bcrypt
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+# Алгоритм для новых хэшей: "bcrypt" или "argon2" (нужен пакет argon2-cffi).
+# При переходе на argon2 старые bcrypt-хэши продолжают проверяться
+# и прозрачно перехэшируются при следующем успешном входе.
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt").lower()
+# Параметры argon2id: память в КиБ, число проходов и потоков.
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+# Потоки для хэширования: bcrypt и argon2 отпускают GIL, поэтому процессы не нужны.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Сколько операций может ждать в очереди сверх числа потоков, прежде чем отвечать 503.
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", str(PASSWORD_HASH_WORKERS * 8)))
+
+
+def _build_pwd_context() -> CryptContext:
+    if PASSWORD_HASH_SCHEME == "argon2":
+        try:
+            import argon2  # noqa: F401
+        except ImportError:
+            logger.warning("PASSWORD_HASH_SCHEME=argon2, но пакет argon2-cffi не установлен; используется bcrypt")
+            return CryptContext(schemes=["bcrypt"], deprecated="auto")
+        # deprecated="auto": все схемы, кроме первой, считаются устаревшими
+        return CryptContext(
+            schemes=["argon2", "bcrypt"],
+            deprecated="auto",
+            argon2__type="ID",
+            argon2__memory_cost=ARGON2_MEMORY_COST,
+            argon2__rounds=ARGON2_TIME_COST,
+            argon2__parallelism=ARGON2_PARALLELISM,
+        )
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+# Контекст для хэширования паролей
+pwd_context = _build_pwd_context()
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_pending_hash_operations = 0
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Проверяет, соответствует ли обычный пароль хэшированному."""
+    """
+    Проверяет, соответствует ли обычный пароль хэшированному.
+    Блокирует поток на время хэширования; из async-кода используйте verify_password_async.
+    """
     return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    """Хэширует обычный пароль."""
+    """
+    Хэширует обычный пароль.
+    Блокирует поток на время хэширования; из async-кода используйте get_password_hash_async.
+    """
     return pwd_context.hash(password)
 
 
+async def _run_in_hash_pool(fn: Callable, *args) -> Any:
+    """
+    Выполняет хэширование в пуле потоков, не блокируя event loop.
+    Если очередь переполнена, сразу отвечает 503, чтобы шторм логинов
+    не копил бесконечную очередь и не тормозил остальные запросы.
+    """
+    global _pending_hash_operations
+    if _pending_hash_operations >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+        logger.warning("Очередь хэширования паролей переполнена (%s операций)", _pending_hash_operations)
+        raise DetailedHTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервер перегружен, повторите попытку позже.",
+            error_code="PASSWORD_HASHING_BUSY",
+        )
+    _pending_hash_operations += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _pending_hash_operations -= 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Асинхронная версия verify_password."""
+    return await _run_in_hash_pool(pwd_context.verify, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Асинхронная версия get_password_hash."""
+    return await _run_in_hash_pool(pwd_context.hash, password)
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Проверяет пароль и, если хэш устарел (другой алгоритм или параметры),
+    возвращает новый хэш, который нужно сохранить. Иначе второй элемент - None.
+    """
+    return await _run_in_hash_pool(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     """
     Создает новый JWT-токен доступа.
@@ -2,10 +2,12 @@ from fastapi.testclient import TestClient
 from typing import List, Dict
 import fakeredis.aioredis
 from unittest.mock import MagicMock
+import asyncio
 from src.api.v1.endpoints.ai_analysis import get_spirit_analyzer
 import pytest
 
 from src.main import app
+from src.core.inference import BatchedInference
 from src.core.spirit_analyzer import SpiritAnalyzer
 # --- Создание "мока" (имитации) для SpiritAnalyzer ---
 
@@ -24,11 +26,14 @@ class MockSpiritAnalyzer:
             {"label": "HOPE", "score": 0.75},
         ]
 
+mock_analyzer_pool = BatchedInference(loader=MockSpiritAnalyzer)
+
+
 def override_get_spirit_analyzer():
     """
     Эта функция будет подменять оригинальную зависимость `get_spirit_analyzer`.
     """
-    return MockSpiritAnalyzer()
+    return mock_analyzer_pool
 
 def override_get_current_user():
     """
@@ -109,8 +114,9 @@ async def test_analyzer_is_not_called_on_cache_hit(client: TestClient, override_
     mock_analyzer = MagicMock(spec=SpiritAnalyzer)
     mock_analyzer.analyze_topics.return_value = [{"label": "TEST", "score": 0.99}]
 
-    # Подменяем зависимость анализатора на наш MagicMock
-    app.dependency_overrides[get_spirit_analyzer] = lambda: mock_analyzer
+    # Подменяем зависимость анализатора на пул с нашим MagicMock внутри
+    mock_pool = BatchedInference(loader=lambda: mock_analyzer)
+    app.dependency_overrides[get_spirit_analyzer] = lambda: mock_pool
 
     request_payload = {"text": "Это достаточно длинный текст для успешного прохождения валидации."}
     auth_headers = {"Authorization": "Bearer fake-token"}
@@ -163,4 +169,45 @@ def test_analyze_text_validation_error_missing_field(client: TestClient, overrid
         json={"wrong_field": "some text"},
         headers=auth_headers
     )
-    assert response.status_code == 422
\ No newline at end of file
+    assert response.status_code == 422
+
+
+# --- Тесты для микро-батчинга инференса ---
+
+async def test_batched_inference_groups_concurrent_texts():
+    """
+    Конкурентные запросы должны попадать в модель одним батчем,
+    а каждый вызывающий - получать свой результат.
+    """
+    class BatchRecordingAnalyzer:
+        def __init__(self):
+            self.batches = []
+
+        def analyze_topics_batch(self, texts):
+            self.batches.append(list(texts))
+            return [[{"label": text, "score": 1.0}] for text in texts]
+
+    analyzer = BatchRecordingAnalyzer()
+    pool = BatchedInference(loader=lambda: analyzer, max_batch_size=8, max_wait_ms=50)
+
+    texts = [f"текст номер {i}" for i in range(5)]
+    results = await asyncio.gather(*(pool.analyze(text) for text in texts))
+    await pool.close()
+
+    assert results == [[{"label": text, "score": 1.0}] for text in texts]
+    assert analyzer.batches == [texts]
+
+
+async def test_batched_inference_fails_texts_without_result():
+    """Если модель вернула меньше результатов, чем текстов, лишние запросы получают ошибку, а не зависают."""
+    class ShortAnalyzer:
+        def analyze_topics_batch(self, texts):
+            return [[{"label": "PATIENCE", "score": 1.0}]]
+
+    pool = BatchedInference(loader=ShortAnalyzer, max_batch_size=8, max_wait_ms=50)
+
+    results = await asyncio.gather(pool.analyze("первый"), pool.analyze("второй"), return_exceptions=True)
+    await pool.close()
+
+    assert results[0] == [{"label": "PATIENCE", "score": 1.0}]
+    assert isinstance(results[1], RuntimeError)
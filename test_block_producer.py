@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+from src.core.block_producer import BlockProducer
+
+
+class InMemoryLedger:
+    """Минимальный леджер: пул транзакций и цепочка блоков."""
+
+    def __init__(self):
+        self.chain = []
+        self.pending_transactions = []
+
+    def create_block(self, proof, miner):
+        self.chain.append({"proof": proof, "miner": miner, "transactions": self.pending_transactions})
+        self.pending_transactions = []
+
+
+async def test_block_is_produced_when_pool_reaches_threshold():
+    ledger = InMemoryLedger()
+    producer = BlockProducer(ledger, miner="node-1", max_pending=3, max_interval=60)
+    task = asyncio.create_task(producer.run())
+
+    for i in range(3):
+        ledger.pending_transactions.append({"amount": i})
+        producer.notify()
+    await asyncio.sleep(0.05)
+
+    assert len(ledger.chain) == 1
+    assert len(ledger.chain[0]["transactions"]) == 3
+    task.cancel()
+
+
+async def test_block_is_produced_after_max_interval():
+    ledger = InMemoryLedger()
+    producer = BlockProducer(ledger, miner="node-1", max_pending=100, max_interval=0.1)
+    task = asyncio.create_task(producer.run())
+
+    ledger.pending_transactions.append({"amount": 1})
+    producer.notify()
+    await asyncio.sleep(0.05)
+    assert ledger.chain == []
+    await asyncio.sleep(0.15)
+
+    assert len(ledger.chain) == 1
+    task.cancel()
+
+
+async def test_transactions_added_during_build_stay_in_pool():
+    class SlowLedger(InMemoryLedger):
+        def create_block(self, proof, miner):
+            time.sleep(0.1)  # сборка идет в потоке, event loop свободен
+            super().create_block(proof, miner)
+
+    ledger = SlowLedger()
+    producer = BlockProducer(ledger, miner="node-1", max_pending=2, max_interval=60)
+    ledger.pending_transactions.extend([{"amount": 1}, {"amount": 2}])
+
+    build = asyncio.create_task(producer.produce_block())
+    await asyncio.sleep(0.02)
+    ledger.pending_transactions.append({"amount": 3})
+    await build
+
+    assert [tx["amount"] for tx in ledger.chain[0]["transactions"]] == [1, 2]
+    assert ledger.pending_transactions == [{"amount": 3}]
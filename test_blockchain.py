@@ -0,0 +1,175 @@
+import pytest
+
+from src.core.balance_index import BalanceIndex
+from src.core.block_store import BlockConflictError, BlockStore, open_persistent_ledger
+from src.core.ledger_index import LedgerIndex, transaction_hash
+from src.core.merkle import MerkleTree, verify_proof
+
+
+class InMemoryLedger:
+    """Минимальный леджер: пул транзакций и цепочка блоков."""
+
+    def __init__(self):
+        self.chain = []
+        self.pending_transactions = []
+
+    def add_transaction(self, sender, recipient, amount):
+        tx = {"sender": sender, "recipient": recipient, "amount": amount}
+        self.pending_transactions.append(tx)
+        return transaction_hash(tx)
+
+    def create_block(self, proof, miner):
+        block = {"index": len(self.chain) + 1, "proof": proof, "transactions": self.pending_transactions}
+        self.pending_transactions = []
+        self.chain.append(block)
+        return block
+
+
+def test_index_finds_pending_and_confirmed_transactions():
+    ledger = InMemoryLedger()
+    index = LedgerIndex(ledger)
+
+    first = ledger.add_transaction("0", "user-1", 10)
+    assert index.find(first)["status"] == "pending"
+
+    ledger.create_block(proof=1, miner="node-1")
+    second = ledger.add_transaction("user-1", "waqf-7", 5)
+
+    assert index.find(first) == {
+        "sender": "0", "recipient": "user-1", "amount": 10, "status": "confirmed", "block_index": 1,
+    }
+    assert index.find(second)["status"] == "pending"
+    assert index.find("unknown") is None
+
+
+def test_index_is_rebuilt_when_chain_is_replaced():
+    ledger = InMemoryLedger()
+    index = LedgerIndex(ledger)
+    old = ledger.add_transaction("0", "user-1", 10)
+    ledger.create_block(proof=1, miner="node-1")
+    assert index.find(old) is not None
+
+    # Консенсус заменил цепочку на более длинную с другими транзакциями
+    replacement = InMemoryLedger()
+    new = replacement.add_transaction("0", "user-2", 20)
+    replacement.create_block(proof=2, miner="node-2")
+    replacement.create_block(proof=3, miner="node-2")
+    ledger.chain = replacement.chain
+
+    assert index.find(old) is None
+    assert index.find(new)["block_index"] == 1
+
+
+def test_merkle_proofs_verify_for_every_leaf():
+    for size in (1, 2, 3, 7, 8, 33):
+        hashes = [f"tx-{i}" for i in range(size)]
+        tree = MerkleTree(hashes)
+        rebuilt = MerkleTree()
+        for tx_hash in hashes:
+            rebuilt.append(tx_hash)
+
+        assert rebuilt.root == tree.root
+        assert all(verify_proof(h, tree.proof(i), tree.root) for i, h in enumerate(hashes))
+        assert not verify_proof("forged", tree.proof(0), tree.root)
+
+
+def test_sealed_block_carries_merkle_root_and_lookup_returns_proof(tmp_path):
+    ledger = InMemoryLedger()
+    store, _ = open_persistent_ledger(ledger, str(tmp_path / "ledger.db"))
+    index = LedgerIndex(ledger)
+    ledger.chain.on_append = index.seal_block
+    hashes = [ledger.add_transaction("0", f"user-{i}", i + 1) for i in range(5)]
+    index.sync()  # пул проиндексирован до запечатывания блока
+
+    ledger.create_block(proof=1, miner="node-1")
+    found = index.find(hashes[3])
+
+    assert ledger.chain[-1]["merkle_root"] == MerkleTree(hashes).root
+    assert verify_proof(hashes[3], found["merkle_proof"], found["merkle_root"])
+    store.close()
+
+
+def test_proof_comes_from_the_stored_block_after_a_lost_append(tmp_path):
+    path = str(tmp_path / "ledger.db")
+    ledger = InMemoryLedger()
+    store, _ = open_persistent_ledger(ledger, path)
+    index = LedgerIndex(ledger)
+    ledger.chain.on_append = index.seal_block
+    for i in range(5):
+        ledger.add_transaction("0", f"user-{i}", i + 1)
+    index.sync()
+    # Наш блок запечатан, но позицию раньше занял блок другого воркера
+    index.seal_block({"index": 1, "transactions": list(ledger.pending_transactions)})
+    winner = [{"sender": "0", "recipient": "other", "amount": amount} for amount in (7, 8)]
+    other_worker = BlockStore(path)
+    other_worker.append({
+        "index": 1, "transactions": winner, "merkle_root": MerkleTree(transaction_hash(tx) for tx in winner).root,
+    })
+
+    found = index.find(transaction_hash(winner[1]))
+
+    assert verify_proof(transaction_hash(winner[1]), found["merkle_proof"], found["merkle_root"])
+    other_worker.close()
+    store.close()
+
+
+def test_persistent_chain_survives_restart(tmp_path):
+    path = str(tmp_path / "ledger.db")
+    ledger = InMemoryLedger()
+    ledger.chain.append({"index": 1, "proof": 100, "transactions": []})  # генезис
+    store, _ = open_persistent_ledger(ledger, path)
+    tx = ledger.add_transaction("0", "user-1", 10)
+    ledger.create_block(proof=1, miner="node-1")
+    ledger.add_transaction("user-1", "waqf-7", 5)
+    store.spill_pending(ledger.pending_transactions)
+    store.close()
+
+    restarted = InMemoryLedger()
+    restarted.chain.append({"index": 1, "proof": 999, "transactions": []})
+    store, restored = open_persistent_ledger(restarted, path)
+
+    assert len(restarted.chain) == 2
+    assert restarted.chain[0]["proof"] == 100
+    assert restored == 1
+    assert LedgerIndex(restarted).find(tx)["status"] == "confirmed"
+    store.close()
+
+
+def test_append_from_stale_worker_is_rejected(tmp_path):
+    path = str(tmp_path / "ledger.db")
+    worker_a, worker_b = BlockStore(path), BlockStore(path)
+    worker_a.append({"index": 1})
+    # Воркер B еще не видел блок A и пытается занять ту же позицию
+    worker_b._length = 0
+
+    with pytest.raises(BlockConflictError):
+        worker_b.append({"index": 1, "miner": "b"})
+    assert len(worker_b) == 1
+    worker_a.close()
+    worker_b.close()
+
+
+def test_balance_index_applies_new_blocks_and_rebuilds_after_fork(tmp_path):
+    path = str(tmp_path / "ledger.db")
+    ledger = InMemoryLedger()
+    store, _ = open_persistent_ledger(ledger, path)
+    balances = BalanceIndex(store)
+    ledger.add_transaction("0", "user-1", 10)
+    ledger.create_block(proof=1, miner="node-1")
+    ledger.add_transaction("user-1", "waqf-7", 4)
+    ledger.create_block(proof=2, miner="node-1")
+
+    assert balances.current_balances(["user-1", "waqf-7", "user-2"]) == {"user-1": 6, "waqf-7": 4, "user-2": 0}
+
+    # Консенсус заменил второй блок: чтение не перестраивает индекс, а планирует фоновый sync
+    store.replace_tail(1, [{"index": 2, "transactions": [{"sender": "0", "recipient": "user-2", "amount": 3}]}])
+    assert not balances.is_current()
+    assert balances.balance("user-1") in (6, 10)
+    balances.sync()
+
+    assert balances.is_current()
+    assert balances.balance("user-1") == 10
+    assert balances.balance("waqf-7") == 0
+    assert balances.balance("user-2") == 3
+    balances.close()
+    store.close()
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from enum import Enum
+from uuid import UUID
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+from src.core import codec
+from src.core.cache_keys import CACHE_KEY_MAX_LENGTH, make_cache_key
+from src.core.caching import LocalCache, MISSING, TwoTierCache, invalidate_tags, redis_cache
+
+
+class CachedService:
+    """Имитация модуля: атрибуты redis и logger, как у настоящих модулей."""
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = 0
+
+    @redis_cache(expiration=60)
+    async def get_listing(self, category: str):
+        self.calls += 1
+        return {"category": category, "items": [1, 2, 3]}
+
+    @redis_cache(expiration=60, tags=("waqf:{waqf_id}", "waqf:list"))
+    async def get_waqf(self, waqf_id: int):
+        self.calls += 1
+        return {"waqf_id": waqf_id, "calls": self.calls}
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(max_size=2, default_ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "a" становится самым свежим
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is MISSING
+    assert cache.get("c") == 3
+
+
+async def test_redis_cache_serves_hits_from_local_tier():
+    service = CachedService(fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+    first = await service.get_listing("education")
+    # Удаляем ключи напрямую из Redis: второй вызов должен обслужиться локальным уровнем
+    await service.redis.flushall()
+    second = await service.get_listing("education")
+
+    assert first == second
+    assert service.calls == 1
+
+
+async def test_local_hits_return_independent_copies():
+    cache = TwoTierCache(fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+    await cache.set("cache:key", {"items": [1, 2]}, 60)
+    first = await cache.get("cache:key")
+    first["items"].append(3)
+
+    assert await cache.get("cache:key") == {"items": [1, 2]}
+    await cache.close()
+
+
+async def test_corrupt_value_is_a_miss():
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    cache = TwoTierCache(redis)
+
+    await redis.set(cache._storage_key("cache:key"), "{не json")
+
+    assert await cache.get("cache:key") is MISSING
+    await cache.close()
+
+
+async def test_invalidation_is_propagated_to_other_workers():
+    server = fakeredis.FakeServer()
+    worker_a = TwoTierCache(fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+    worker_b = TwoTierCache(fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+
+    await worker_a.set("cache:key", {"version": 1}, 60)
+    assert await worker_b.get("cache:key") == {"version": 1}
+    await asyncio.sleep(0.1)  # даем подписчику воркера B подключиться к каналу
+
+    await worker_a.set("cache:key", {"version": 2}, 60)
+    await asyncio.sleep(0.2)
+
+    assert await worker_b.get("cache:key") == {"version": 2}
+    await worker_a.close()
+    await worker_b.close()
+
+
+async def test_concurrent_misses_call_function_once():
+    service = CachedService(fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+    results = await asyncio.gather(*(service.get_listing("health") for _ in range(20)))
+
+    assert all(result == results[0] for result in results)
+    assert service.calls == 1
+
+
+async def test_waiting_worker_reuses_value_computed_under_lock():
+    server = fakeredis.FakeServer()
+    worker_a = TwoTierCache(fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+    worker_b = TwoTierCache(fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+    calls = []
+
+    async def slow_query():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return {"rows": 42}
+
+    results = await asyncio.gather(
+        worker_a.get_or_compute("cache:report", slow_query, 60),
+        worker_b.get_or_compute("cache:report", slow_query, 60),
+    )
+
+    assert results == [{"rows": 42}, {"rows": 42}]
+    assert len(calls) == 1
+    await worker_a.close()
+    await worker_b.close()
+
+
+async def test_stale_value_is_served_while_refreshing():
+    cache = TwoTierCache(fakeredis.aioredis.FakeRedis(decode_responses=True))
+    versions = iter([1, 2])
+
+    async def compute():
+        return {"version": next(versions)}
+
+    # Значение сразу устаревшее (expiration=0), но остается доступным 60 секунд
+    await cache.set("cache:dashboard", {"version": 0}, 0, stale_ttl=60)
+
+    stale = await cache.get_or_compute("cache:dashboard", compute, 60, stale_ttl=60)
+    await asyncio.sleep(0.1)  # даем фоновому обновлению завершиться
+    fresh = await cache.get_or_compute("cache:dashboard", compute, 60, stale_ttl=60)
+
+    assert stale == {"version": 0}
+    assert fresh == {"version": 1}
+    await cache.close()
+
+
+async def test_tag_invalidation_drops_only_tagged_entries():
+    service = CachedService(fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+    await service.get_waqf(1)
+    await service.get_waqf(2)
+    await invalidate_tags(service.redis, "waqf:1")
+    await service.get_waqf(1)
+    await service.get_waqf(2)
+
+    assert service.calls == 3
+
+
+async def test_value_computed_before_invalidation_is_not_stored():
+    cache = TwoTierCache(fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+    async def slow_query():
+        await asyncio.sleep(0.1)
+        return {"raised": 100}
+
+    # Инвалидация приходит, пока значение еще вычисляется по старым данным
+    pending = asyncio.create_task(cache.get_or_compute("cache:waqf", slow_query, 60, tags=("waqf:7",)))
+    await asyncio.sleep(0.05)
+    await cache.invalidate_tags("waqf:7")
+
+    assert await pending == {"raised": 100}
+    assert await cache.get("cache:waqf") is MISSING
+    await cache.close()
+
+
+def test_cache_key_is_canonical_and_bounded():
+    first = make_cache_key("waqf.search", {"filters": {"b": 2, "a": 1}, "ids": {3, 1, 2}})
+    second = make_cache_key("waqf.search", {"filters": {"a": 1, "b": 2}, "ids": {1, 2, 3}})
+    long_text = make_cache_key("ai.analyze", {"text": "бисмиллях " * 1000})
+
+    assert first == second
+    assert len(long_text) <= CACHE_KEY_MAX_LENGTH
+    assert make_cache_key("ai.analyze", {"text": "a"}, version=2) != make_cache_key("ai.analyze", {"text": "a"})
+    assert make_cache_key("user", {"user": object()}, key_func=lambda user: "42") == "cache:user:42"
+
+    # Разные аргументы не должны давать один ключ
+    colliding = [
+        ({"x": 1}, {"x": "1"}),
+        ({"x": None}, {"x": "None"}),
+        ({"x": True}, {"x": 1}),
+        ({"x": ["a,b"]}, {"x": ["a", "b"]}),
+        ({"x": {"a": "1,b=2"}}, {"x": {"a": "1", "b": "2"}}),
+        ({"x": "%i1"}, {"x": 1}),
+        ({"x": "a:b"}, {"x": "a%3Ab"}),
+    ]
+    for left, right in colliding:
+        assert make_cache_key("f", left) != make_cache_key("f", right), (left, right)
+
+
+# --- Тесты для кодека значений ---
+
+class Priority(Enum):
+    HIGH = "high"
+
+
+@dataclass
+class DonationSummary:
+    waqf_id: int
+    total: Decimal
+
+
+CODEC_VARIANTS = [
+    (serializer, compression)
+    for serializer in sorted(codec._SERIALIZERS)
+    for compression in [codec.COMPRESSION_NONE, *sorted(codec._COMPRESSORS)]
+]
+
+
+@pytest.fixture(params=CODEC_VARIANTS, ids=lambda variant: f"serializer{variant[0]}-compression{variant[1]}")
+def codec_variant(request, monkeypatch):
+    serializer, compression = request.param
+    monkeypatch.setattr(codec, "CACHE_SERIALIZER", serializer)
+    monkeypatch.setattr(codec, "CACHE_COMPRESSION", compression)
+    monkeypatch.setattr(codec, "CACHE_COMPRESSION_THRESHOLD", 0)
+    return request.param
+
+
+def test_codec_round_trips_non_json_types(codec_variant):
+    value = {
+        "created_at": datetime(2025, 12, 15, 10, 30, tzinfo=timezone.utc),
+        "day": date(2025, 12, 15),
+        "amount": Decimal("10.25"),
+        "id": UUID("12345678-1234-5678-1234-567812345678"),
+        "pair": (1, "a"),
+        "tags": {"waqf", "zakat"},
+        "frozen": frozenset({1}),
+        "by_id": {1: "a", (2, 3): "b"},
+        "raw": b"\x00\xff",
+        "nested": [{"\x00t": ["date", "2025-01-01"]}, None, True, 1.5],
+    }
+
+    decoded = codec.decode(codec.encode(value))
+
+    assert decoded == value
+    assert type(decoded["pair"]) is tuple and type(decoded["frozen"]) is frozenset
+
+
+def test_codec_rejects_objects_that_would_not_round_trip(codec_variant):
+    for value in (DonationSummary(waqf_id=7, total=Decimal("99.90")), {"priority": Priority.HIGH}, object()):
+        with pytest.raises(TypeError):
+            codec.encode(value)
+
+
+def test_codec_compresses_large_values_and_reads_legacy_json(codec_variant):
+    large = {"recommendations": [{"title": "Пожертвовать в вакф", "priority": "high"}] * 500}
+
+    encoded = codec.encode(large)
+
+    assert codec.decode(encoded) == large
+    assert encoded[2] == codec_variant[0]
+    assert encoded[3] == codec_variant[1]
+    # Значения, записанные до появления кодека, остаются читаемыми
+    assert codec.decode('{"legacy": true}') == {"legacy": True}
+
+
+def test_codec_rejects_unknown_version():
+    encoded = bytearray(codec.encode({"a": 1}))
+    encoded[1] = codec.CODEC_VERSION + 1
+
+    with pytest.raises(codec.CodecError):
+        codec.decode(bytes(encoded))
@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import httpx
+
+from src.core.consensus import NODE_API_PREFIX, ChainConsensus, block_hash
+
+
+def make_chain(length, miner="node-a", base=None):
+    """Строит корректную цепочку, продолжая base (если передан)."""
+    chain = list(base or [])
+    while len(chain) < length:
+        previous = chain[-1] if chain else None
+        chain.append({
+            "index": len(chain) + 1,
+            "previous_hash": block_hash(previous) if previous else "1",
+            "transactions": [
+                {"sender": "0", "recipient": "user-1", "amount": len(chain) + 1},
+                {"sender": "user-1", "recipient": miner, "amount": len(chain) + 1},
+            ],
+        })
+    return chain
+
+
+class Ledger:
+    def __init__(self, chain):
+        self.chain = chain
+        self.pending_transactions = []
+
+
+def stand_in_node(chain, requests_log, page_limit=1000):
+    """Локальный узел: отвечает на эндпоинты протокола из nodes.py по своей цепочке."""
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests_log.append(request.url.path)
+        params = {k: int(v[0]) for k, v in parse_qs(request.url.query.decode()).items()}
+        path = request.url.path.removeprefix(NODE_API_PREFIX)
+        if path == "/summary":
+            return httpx.Response(200, json={"length": len(chain)})
+        if path == "/hashes":
+            return httpx.Response(200, json={"hashes": [block_hash(b) for b in chain[params["start"]:params["stop"]]]})
+        if path == "/blocks":
+            limit = min(params["limit"], page_limit)
+            return httpx.Response(200, json={"blocks": chain[params["start"]:params["start"] + limit]})
+        return httpx.Response(404)
+    return httpx.MockTransport(handler)
+
+
+async def test_longer_chain_is_adopted_downloading_only_new_blocks():
+    common = make_chain(10)
+    peer_chain = make_chain(25, base=common)
+    ledger = Ledger(list(common))
+    log = []
+    consensus = ChainConsensus(
+        ledger, lambda: ["peer:5000"], transport=stand_in_node(peer_chain, log),
+        executor=ThreadPoolExecutor(2), page_size=4,
+    )
+
+    assert await consensus.resolve() is True
+    assert ledger.chain == peer_chain
+    # Загружены только 15 новых блоков, по 4 за запрос
+    assert log.count(f"{NODE_API_PREFIX}/blocks") == 4
+    await consensus.close()
+
+
+async def test_fork_is_replaced_and_orphaned_transactions_return_to_pool():
+    common = make_chain(5)
+    local = make_chain(7, miner="local", base=common)
+    peer_chain = make_chain(9, miner="peer", base=common)
+    ledger = Ledger(list(local))
+    consensus = ChainConsensus(ledger, lambda: ["peer:5000"], transport=stand_in_node(peer_chain, []))
+
+    assert await consensus.resolve() is True
+    assert ledger.chain == peer_chain
+    assert [tx["recipient"] for tx in ledger.pending_transactions] == ["local", "local"]
+    await consensus.close()
+
+
+async def test_invalid_chain_is_rejected():
+    ledger = Ledger(make_chain(3))
+    tampered = make_chain(6, base=ledger.chain)
+    tampered[4]["transactions"][1]["amount"] = 1_000_000
+    consensus = ChainConsensus(ledger, lambda: ["peer:5000"], transport=stand_in_node(tampered, []))
+
+    assert await consensus.resolve() is False
+    assert len(ledger.chain) == 3
+    await consensus.close()
+
+
+async def test_chain_with_different_genesis_is_rejected():
+    ledger = Ledger(make_chain(3, miner="local"))
+    other = make_chain(8, miner="other")
+    consensus = ChainConsensus(ledger, lambda: ["peer:5000"], transport=stand_in_node(other, []))
+
+    assert await consensus.resolve() is False
+    assert len(ledger.chain) == 3
+    await consensus.close()
+
+
+async def test_short_peer_pages_are_completed():
+    common = make_chain(2)
+    peer_chain = make_chain(12, base=common)
+    ledger = Ledger(list(common))
+    log = []
+    consensus = ChainConsensus(
+        ledger, lambda: ["peer:5000"], transport=stand_in_node(peer_chain, log, page_limit=3),
+        executor=ThreadPoolExecutor(2), page_size=5,
+    )
+
+    assert await consensus.resolve() is True
+    assert ledger.chain == peer_chain
+    assert log.count(f"{NODE_API_PREFIX}/blocks") == 4
+    await consensus.close()
+
+
+async def test_proof_of_work_is_enforced():
+    ledger = Ledger(make_chain(2))
+    peer_chain = make_chain(5, base=ledger.chain)  # блоки без proof
+    consensus = ChainConsensus(
+        ledger, lambda: ["peer:5000"], transport=stand_in_node(peer_chain, []),
+        executor=ThreadPoolExecutor(1), difficulty=2,
+    )
+
+    assert await consensus.resolve() is False
+    await consensus.close()
+
+
+async def test_chain_spending_more_than_the_balance_is_rejected():
+    ledger = Ledger(make_chain(3))
+    overdrawn = list(ledger.chain)
+    for _ in range(3):
+        overdrawn.append({
+            "index": len(overdrawn) + 1,
+            "previous_hash": block_hash(overdrawn[-1]),
+            "transactions": [{"sender": "user-1", "recipient": "forger", "amount": 1_000}],
+        })
+    consensus = ChainConsensus(
+        ledger, lambda: ["peer:5000"], transport=stand_in_node(overdrawn, []), executor=ThreadPoolExecutor(1)
+    )
+
+    assert await consensus.resolve() is False
+    assert len(ledger.chain) == 3
+    await consensus.close()
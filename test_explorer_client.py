@@ -0,0 +1,121 @@
+import asyncio
+
+import fakeredis.aioredis
+import httpx
+import pytest
+
+from src.services import explorer_client
+from src.services.explorer_client import AddressTransactionCache, ExplorerClient, RedisTokenBucket
+
+ADDRESS = "0x" + "33" * 20
+
+
+def stand_in_explorer(chain, requests):
+    """API эксплорера в формате Etherscan поверх списка транзакций `chain`."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        requests.append((int(params["startblock"]), int(params["page"])))
+        start, page, offset = int(params["startblock"]), int(params["page"]), int(params["offset"])
+        matching = [tx for tx in chain if int(tx["blockNumber"]) >= start]
+        result = matching[(page - 1) * offset:page * offset]
+        if not result:
+            return httpx.Response(200, json={"status": "0", "message": "No transactions found", "result": []})
+        return httpx.Response(200, json={"status": "1", "message": "OK", "result": result})
+
+    return httpx.MockTransport(handler)
+
+
+def tx(block, index):
+    return {"blockNumber": str(block), "transactionIndex": str(index), "hash": f"0x{block:04x}{index:04x}", "value": "1"}
+
+
+async def test_refresh_fetches_only_new_blocks_and_pages_by_cursor(monkeypatch):
+    monkeypatch.setattr(explorer_client, "EXPLORER_PAGE_SIZE", 2)
+    monkeypatch.setattr(explorer_client, "EXPLORER_REFRESH_SECONDS", 0)
+    chain = [tx(1, 0), tx(2, 0), tx(2, 1), tx(3, 0)]
+    requests = []
+    explorer = ExplorerClient("http://explorer", rate_limit=1000, transport=stand_in_explorer(chain, requests))
+    cache = AddressTransactionCache(fakeredis.aioredis.FakeRedis(decode_responses=True), explorer)
+
+    assert await cache.refresh(ADDRESS) == 5
+    assert requests == [(0, 1), (2, 1), (2, 2)]
+
+    chain.extend([tx(3, 1), tx(4, 0)])
+    requests.clear()
+    await cache.refresh(ADDRESS)
+    assert requests == [(3, 1), (3, 2)]
+
+    first, cursor = await cache.page(ADDRESS, limit=4)
+    assert [t["hash"] for t in first] == [tx(4, 0)["hash"], tx(3, 1)["hash"], tx(3, 0)["hash"], tx(2, 1)["hash"]]
+    rest, end = await cache.page(ADDRESS, cursor, limit=4)
+    assert [t["hash"] for t in rest] == [tx(2, 0)["hash"], tx(1, 0)["hash"]]
+    assert end is None
+    await explorer.close()
+
+
+async def test_rate_limited_response_is_retried():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"status": "1", "message": "OK", "result": [tx(1, 0)]})
+
+    explorer = ExplorerClient("http://explorer", rate_limit=1000, transport=httpx.MockTransport(handler))
+
+    assert await explorer.txlist(ADDRESS, 0) == [tx(1, 0)]
+    assert len(calls) == 2
+    await explorer.close()
+
+
+async def test_concurrent_first_load_waits_for_the_lock_owner():
+    requests = []
+    served = stand_in_explorer([tx(1, 0), tx(2, 0)], requests)
+
+    async def slow_explorer(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.3)
+        return served.handler(request)
+
+    explorer = ExplorerClient("http://explorer", rate_limit=1000, transport=httpx.MockTransport(slow_explorer))
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+    first, second = await asyncio.gather(
+        AddressTransactionCache(redis, explorer).page(ADDRESS), AddressTransactionCache(redis, explorer).page(ADDRESS)
+    )
+
+    assert [t["hash"] for t in first[0]] == [t["hash"] for t in second[0]] == [tx(2, 0)["hash"], tx(1, 0)["hash"]]
+    assert requests == [(0, 1)]
+    assert not await redis.exists(f"explorer:lock:{ADDRESS}")
+    await explorer.close()
+
+
+async def test_rate_limit_is_shared_between_workers():
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    worker_a = RedisTokenBucket(redis, "explorer:rate", rate=1)
+    worker_b = RedisTokenBucket(redis, "explorer:rate", rate=1)
+
+    await worker_a.acquire()
+
+    assert await worker_b._take() > 0
+
+
+async def test_partially_loaded_address_expires(monkeypatch):
+    monkeypatch.setattr(explorer_client, "EXPLORER_PAGE_SIZE", 1)
+    served = stand_in_explorer([tx(1, 0), tx(2, 0)], [])
+
+    def fail_second_page(request: httpx.Request) -> httpx.Response:
+        if request.url.params["startblock"] != "0":
+            return httpx.Response(500)
+        return served.handler(request)
+
+    explorer = ExplorerClient("http://explorer", rate_limit=1000, transport=httpx.MockTransport(fail_second_page))
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+    with pytest.raises(httpx.HTTPError):
+        await AddressTransactionCache(redis, explorer).refresh(ADDRESS)
+
+    for key in (f"explorer:txs:{ADDRESS}", f"explorer:tx:{ADDRESS}", f"explorer:meta:{ADDRESS}"):
+        assert await redis.ttl(key) > 0, key
+    await explorer.close()
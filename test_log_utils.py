@@ -0,0 +1,35 @@
+import io
+import logging
+
+from src.core.log_utils import Payload, setup_queue_logging, stop_queue_logging
+
+
+def test_payload_summary_is_capped_and_hides_bytes():
+    request = {"type": "photo_check", "file_content": b"\xff" * 1_000_000, "items": list(range(10_000))}
+
+    summary = str(Payload(request, max_chars=120))
+
+    assert "<bytes 1000000>" in summary
+    assert len(summary) <= 121
+
+
+def test_queue_logging_reaches_existing_handler_and_is_restored():
+    root = logging.getLogger()
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    saved_handlers, saved_level = root.handlers[:], root.level
+    root.handlers = [handler]
+    try:
+        listener = setup_queue_logging(level="INFO")
+        assert setup_queue_logging() is listener
+        assert len(root.handlers) == 1 and root.handlers[0] is not handler
+        logging.getLogger("test").info("через очередь")
+        stop_queue_logging()
+
+        assert root.handlers == [handler]
+        logging.getLogger("test").warning("после остановки")
+        assert stream.getvalue().splitlines() == ["через очередь", "после остановки"]
+    finally:
+        stop_queue_logging()
+        root.handlers, root.level = saved_handlers, saved_level
@@ -0,0 +1,101 @@
+import json
+
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.db.base import Base
+from src.db import models
+from src.services.waqf_indexer import WaqfEventIndexer, get_indexed_donors, is_contract_indexed
+from src.services.web3_client import DONATION_RECEIVED_TOPIC, AsyncBlockchainService, AsyncRpcClient
+
+CONTRACT = "0x" + "ab" * 20
+DONOR_A, DONOR_B = "0x" + "0a" * 20, "0x" + "0b" * 20
+ETHER = 10 ** 18
+
+
+class StandInChain:
+    """Локальная цепочка: блоки с хэшами и события пожертвований; отвечает на JSON-RPC."""
+
+    def __init__(self):
+        self.blocks = []  # [(hash, [(donor, amount)])]
+
+    def mine(self, *donations, fork="main"):
+        self.blocks.append((f"0x{fork}{len(self.blocks):060x}", list(donations)))
+
+    def logs(self, start, stop):
+        return [
+            {
+                "address": CONTRACT,
+                "blockNumber": hex(number),
+                "blockHash": block_hash,
+                "transactionHash": f"0x{number:032x}{position:032x}",
+                "logIndex": hex(position),
+                "topics": [DONATION_RECEIVED_TOPIC, "0x" + donor[2:].rjust(64, "0")],
+                "data": hex(amount),
+            }
+            for number, (block_hash, donations) in enumerate(self.blocks)
+            if start <= number <= stop
+            for position, (donor, amount) in enumerate(donations)
+        ]
+
+    def answer(self, call):
+        method, params = call["method"], call["params"]
+        if method == "eth_blockNumber":
+            result = hex(len(self.blocks) - 1)
+        elif method == "eth_getBlockByNumber":
+            number = int(params[0], 16)
+            result = {"number": params[0], "hash": self.blocks[number][0]} if number < len(self.blocks) else None
+        elif method == "eth_getLogs":
+            result = self.logs(int(params[0]["fromBlock"], 16), int(params[0]["toBlock"], 16))
+        else:
+            return {"id": call["id"], "error": {"code": 3, "message": "execution reverted"}}
+        return {"id": call["id"], "result": result}
+
+    def transport(self):
+        return httpx.MockTransport(
+            lambda request: httpx.Response(200, json=[self.answer(call) for call in json.loads(request.content)])
+        )
+
+
+@pytest.fixture
+async def session_factory():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    tables = [
+        models.IndexedProject.__table__, models.IndexedDonor.__table__, models.IndexedContribution.__table__,
+        models.IndexedMilestone.__table__, models.IndexedBlock.__table__, models.IndexerCheckpoint.__table__,
+    ]
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=tables)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def test_indexer_follows_new_blocks_and_rolls_back_reorgs(session_factory):
+    chain = StandInChain()
+    chain.mine()
+    chain.mine((DONOR_A, 1 * ETHER))
+    chain.mine((DONOR_B, 2 * ETHER))
+    indexer = WaqfEventIndexer(
+        AsyncBlockchainService(AsyncRpcClient("http://node", transport=chain.transport())), addresses=[], from_block=0
+    )
+
+    async with session_factory() as db:
+        assert not await is_contract_indexed(db, CONTRACT)
+        assert await indexer.sync(db) == 2
+        assert await is_contract_indexed(db, CONTRACT)
+        donors = await get_indexed_donors(db, CONTRACT, waqf_id=1)
+    assert [(d["address"].lower(), d["total_donated_in_ether"]) for d in donors] == [(DONOR_B, 2), (DONOR_A, 1)]
+
+    # Блок 2 заменен другим, цепочка выросла
+    chain.blocks.pop()
+    chain.mine((DONOR_A, 3 * ETHER), fork="f0")
+    chain.mine()
+
+    async with session_factory() as db:
+        await indexer.sync(db)
+        donors = await get_indexed_donors(db, CONTRACT, waqf_id=1)
+        project = await db.get(models.IndexedProject, CONTRACT)
+    assert [(d["address"].lower(), d["total_donated_in_ether"]) for d in donors] == [(DONOR_A, 4)]
+    assert project.raised_amount == 4 * ETHER
+    await indexer.rpc.close()
@@ -0,0 +1,111 @@
+import json
+
+import httpx
+from eth_abi import decode, encode
+from eth_utils import function_signature_to_4byte_selector
+
+from src.services.web3_client import MULTICALL3_ADDRESS, AsyncBlockchainService, AsyncRpcClient
+
+CONTRACT = "0x" + "11" * 20
+BENEFICIARY = "0x" + "22" * 20
+
+
+def stand_in_node(milestone_count, http_requests, multicall=True, multicall_error=False):
+    """
+    Узел JSON-RPC с контрактом WaqfProject и (опционально) Multicall3;
+    multicall_error - вызовы Multicall3 завершаются ошибкой узла.
+    """
+    selectors = {
+        function_signature_to_4byte_selector(signature): signature
+        for signature in ("goalAmount()", "raisedAmount()", "deadline()", "beneficiary()", "milestones(uint256)")
+    }
+    aggregate3 = function_signature_to_4byte_selector("aggregate3((address,bool,bytes)[])")
+
+    def view(data: bytes):
+        """Ответ view-функции или None, если вызов откатывается."""
+        signature = selectors.get(data[:4])
+        if signature == "beneficiary()":
+            return encode(["address"], [BENEFICIARY])
+        if signature == "deadline()":
+            return encode(["uint256"], [1_700_000_000])
+        if signature == "milestones(uint256)":
+            index = int.from_bytes(data[4:36], "big")
+            if index >= milestone_count:
+                return None
+            return encode(["string", "uint256", "bool", "uint256"], [f"этап {index}", 10 ** 18, False, 0])
+        if signature is None:
+            return None
+        return encode(["uint256"], [2 * 10 ** 18])
+
+    def answer(call):
+        if call["method"] == "eth_blockNumber":
+            return {"id": call["id"], "result": "0x10"}
+        if call["method"] == "eth_getCode":
+            deployed = multicall and call["params"][0] == MULTICALL3_ADDRESS
+            return {"id": call["id"], "result": "0x6080" if deployed else "0x"}
+        target, data = call["params"][0]["to"], bytes.fromhex(call["params"][0]["data"][2:])
+        if target == MULTICALL3_ADDRESS:
+            assert multicall, "Multicall3 вызывается, хотя eth_getCode вернул пустой код"
+            if multicall_error:
+                return {"id": call["id"], "error": {"code": -32000, "message": "out of gas"}}
+            assert data[:4] == aggregate3
+            (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+            results = [(view(payload) is not None, view(payload) or b"") for _, _, payload in calls]
+            return {"id": call["id"], "result": "0x" + encode(["(bool,bytes)[]"], [results]).hex()}
+        result = view(data)
+        if result is None:
+            return {"id": call["id"], "error": {"code": 3, "message": "execution reverted"}}
+        return {"id": call["id"], "result": "0x" + result.hex()}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls = json.loads(request.content)
+        http_requests.append([call["method"] for call in calls])
+        return httpx.Response(200, json=[answer(call) for call in calls])
+
+    return httpx.MockTransport(handler)
+
+
+async def test_project_details_use_one_multicall_and_are_cached_per_block():
+    http_requests = []
+    service = AsyncBlockchainService(AsyncRpcClient("http://node", transport=stand_in_node(3, http_requests)))
+
+    details = await service.get_project_details(CONTRACT)
+    again = await service.get_project_details(CONTRACT)
+
+    assert http_requests == [["eth_blockNumber"], ["eth_getCode"], ["eth_call"]]
+    assert again is details
+    assert details["beneficiary"].lower() == BENEFICIARY
+    assert details["block_number"] == 16
+    assert [m["description"] for m in details["milestones"]] == ["этап 0", "этап 1", "этап 2"]
+    await service.rpc.close()
+
+
+async def test_project_details_fall_back_to_batched_calls_without_multicall():
+    http_requests = []
+    service = AsyncBlockchainService(
+        AsyncRpcClient("http://node", transport=stand_in_node(3, http_requests, multicall=False))
+    )
+
+    details = await service.get_project_details(CONTRACT)
+
+    assert http_requests[:2] == [["eth_blockNumber"], ["eth_getCode"]]
+    assert http_requests[2] == ["eth_call"] * 21
+    assert len(http_requests) == 3
+    assert details["state"] is None
+    assert len(details["milestones"]) == 3
+    await service.rpc.close()
+
+
+async def test_failed_multicall_falls_back_for_that_call_only():
+    http_requests = []
+    service = AsyncBlockchainService(
+        AsyncRpcClient("http://node", transport=stand_in_node(3, http_requests, multicall_error=True))
+    )
+
+    details = await service.get_project_details(CONTRACT)
+
+    assert len(details["milestones"]) == 3
+    assert service._multicall_available is True
+    assert http_requests[:3] == [["eth_blockNumber"], ["eth_getCode"], ["eth_call"]]
+    assert http_requests[3] == ["eth_call"] * 21
+    await service.rpc.close()
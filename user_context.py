@@ -0,0 +1,73 @@
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.caching import MISSING, LocalCache
+from core.db_models import MubarakUserDB
+
+# Сколько секунд контекст пользователя переиспользуется между запросами воркера.
+USER_CONTEXT_TTL_SECONDS = int(os.getenv("USER_CONTEXT_TTL_SECONDS", "5"))
+USER_CONTEXT_CACHE_MAX_SIZE = int(os.getenv("USER_CONTEXT_CACHE_MAX_SIZE", "10000"))
+
+# Колонки, которые загружаются всегда.
+_BASE_COLUMNS = ("user_id", "full_name", "language", "career_level", "baraka_points")
+# Колонки, которые загружаются, только если они есть в модели.
+_OPTIONAL_COLUMNS = ("roles", "settings")
+
+
+@dataclass(frozen=True)
+class UserContext:
+    """
+    Данные пользователя, нужные модулям при обработке запроса.
+    Загружается одним запросом на запрос и передается модулю в request["user_context"],
+    чтобы модули не загружали пользователя повторно. Экземпляр общий для запросов
+    в пределах TTL кэша, поэтому изменять его (в том числе списки) нельзя.
+    """
+    user_id: str
+    full_name: Optional[str] = None
+    language: Optional[str] = None
+    career_level: Optional[str] = None
+    baraka_points: int = 0
+    roles: List[str] = field(default_factory=list)
+    settings: Dict[str, Any] = field(default_factory=dict)
+
+
+def _context_columns() -> list:
+    names = _BASE_COLUMNS + tuple(name for name in _OPTIONAL_COLUMNS if hasattr(MubarakUserDB, name))
+    return [getattr(MubarakUserDB, name) for name in names]
+
+
+class UserContextLoader:
+    """Загружает UserContext и кратковременно кэширует его в памяти воркера."""
+
+    def __init__(self, ttl: int = USER_CONTEXT_TTL_SECONDS, max_size: int = USER_CONTEXT_CACHE_MAX_SIZE):
+        self._cache = LocalCache(max_size, ttl)
+        self._columns = _context_columns()
+
+    async def get(self, db_session: AsyncSession, user_id: str) -> Optional[UserContext]:
+        """Возвращает контекст пользователя или None, если пользователь не найден."""
+        context = self._cache.get(user_id)
+        if context is not MISSING:
+            return context
+
+        stmt = select(*self._columns).where(MubarakUserDB.user_id == user_id)
+        row = (await db_session.execute(stmt)).mappings().first()
+        if row is None:
+            return None
+
+        values = dict(row)
+        # В БД роли и настройки могут быть NULL
+        roles = values.get("roles") or []
+        values["roles"] = [roles] if isinstance(roles, str) else list(roles)
+        values["settings"] = dict(values.get("settings") or {})
+        values["baraka_points"] = values.get("baraka_points") or 0
+        context = UserContext(**values)
+        self._cache.set(user_id, context)
+        return context
+
+    def invalidate(self, user_id: str) -> None:
+        """Сбрасывает контекст после изменения данных пользователя в этом воркере."""
+        self._cache.delete(user_id)
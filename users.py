@@ -5,6 +5,7 @@ from datetime import timedelta, datetime, timezone
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.api.v1 import schemas
@@ -16,8 +17,9 @@ from src.db.models import User as DBUser
 from src.models.enums import UserRole
 from src.api.deps import get_current_user, get_current_admin_user, RoleChecker
 # Предполагается, что зависимость для получения сессии БД находится здесь
-from src.db.session import get_db, redis_client
-from src.core.security import verify_signature, create_access_token, verify_password
+from src.db.session import get_db
+from src.db.redis_client import get_redis_client
+from src.core.security import verify_signature, create_access_token, verify_and_update_password_async
 from src.core.config import settings
 
 router = APIRouter()
@@ -36,12 +38,22 @@ async def login_for_access_token(
     Аутентифицирует пользователя и возвращает JWT-токен.
     """
     user = await crud_user.get_user_by_email(db, email=form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    is_valid, new_hash = (False, None)
+    if user:
+        # Хэширование выполняется в отдельном пуле и не блокирует другие запросы
+        is_valid, new_hash = await verify_and_update_password_async(form_data.password, user.hashed_password)
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # Хэш устарел (например, после перехода на argon2) - сохраняем новый
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        await crud_user.invalidate_user_cache(user.id)
     
     # Проверяем, не заблокирован ли пользователь
     if user.banned_until and user.banned_until > datetime.now(timezone.utc):
@@ -198,7 +210,10 @@ async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/me/link-wallet-message", response_model=WalletLinkMessageResponse)
-async def get_link_wallet_message(current_user: DBUser = Depends(get_current_user)):
+async def get_link_wallet_message(
+    current_user: DBUser = Depends(get_current_user),
+    redis_client: Redis = Depends(get_redis_client),
+):
     """
     Шаг 1: Получить уникальное сообщение для подписи кошельком.
     """
@@ -208,7 +223,7 @@ async def get_link_wallet_message(current_user: DBUser = Depends(get_current_use
 
     # Сохраняем nonce в Redis с коротким временем жизни (например, 5 минут)
     # Ключ привязан к ID пользователя, чтобы избежать коллизий
-    redis_client.set(f"link_wallet_nonce:{current_user.id}", nonce, ex=300)
+    await redis_client.set(f"link_wallet_nonce:{current_user.id}", nonce, ex=300)
 
     return WalletLinkMessageResponse(message=message)
 
@@ -218,6 +233,7 @@ async def link_wallet(
     request_data: WalletLinkRequest,
     db: AsyncSession = Depends(get_db),
     current_user: DBUser = Depends(get_current_user),
+    redis_client: Redis = Depends(get_redis_client),
 ):
     """
     Шаг 2: Привязать кошелек к аккаунту после верификации подписи.
@@ -230,9 +246,10 @@ async def link_wallet(
             detail="Этот кошелек уже привязан к другому аккаунту."
         )
 
-    # 2. Получаем nonce из Redis
+    # 2. Получаем nonce из Redis и сразу удаляем его (одной атомарной командой),
+    # чтобы его нельзя было использовать повторно даже в параллельных запросах
     nonce_key = f"link_wallet_nonce:{current_user.id}"
-    nonce = redis_client.get(nonce_key)
+    nonce = await redis_client.getdel(nonce_key)
     if not nonce:
         raise HTTPException(
             status_code=status.HTTP_408_REQUEST_TIMEOUT,
@@ -240,20 +257,19 @@ async def link_wallet(
         )
 
     # 3. Восстанавливаем исходное сообщение и проверяем подпись
-    message = f"Я привязываю этот кошелек к моему аккаунту в MubarakAI. Nonce: {nonce.decode()}"
+    message = f"Я привязываю этот кошелек к моему аккаунту в MubarakAI. Nonce: {nonce}"
     is_valid = verify_signature(
         message=message,
         signature=request_data.signature,
         expected_address=request_data.wallet_address
     )
 
-    # Удаляем nonce после использования, чтобы его нельзя было использовать повторно
-    redis_client.delete(nonce_key)
-
     if not is_valid:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Подпись недействительна.")
 
     # 4. Если все в порядке, обновляем профиль пользователя в PostgreSQL
+    # current_user - неизменяемая копия из кэша; изменяется экземпляр из сессии
+    db_user = await crud_user.get_user(db, user_id=current_user.id)
     user_in = schemas.UserUpdate(wallet_address=request_data.wallet_address)
-    updated_user = await crud_user.update_user(db=db, db_user=current_user, user_in=user_in)
+    updated_user = await crud_user.update_user(db=db, db_user=db_user, user_in=user_in)
     return updated_user
\ No newline at end of file
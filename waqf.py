@@ -1,8 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
-from typing import List
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
+from typing import List, Optional
+
+import httpx
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.api.schemas.waqf import WaqfTransactionSchema, DonationRequestSchema, DonationResponseSchema, NftCertificateSchema, RefundRequestSchema, RefundResponseSchema, VoteRequestSchema, VoteResponseSchema, ReleaseFundsRequestSchema, ReleaseFundsResponseSchema, WaqfProjectDetailsSchema, DonorSchema
 from src.services.blockchain import BlockchainService, get_blockchain_service
+from src.services.explorer_client import (
+    EXPLORER_REFRESH_WAIT_SECONDS,
+    AddressTransactionCache,
+    ExplorerClient,
+    ExplorerError,
+    ExplorerRefreshPending,
+    get_explorer_client,
+)
+from src.services.waqf_indexer import get_indexed_donors, is_contract_indexed
+from src.services.web3_client import AsyncBlockchainService, get_async_blockchain_service
+from src.db.redis_client import get_redis_client
+from src.db.session import get_db
 from src.core.websockets import manager # Импортируем наш менеджер
 
 router = APIRouter()
@@ -11,19 +29,26 @@ router = APIRouter()
     "/{waqf_id}/transactions",
     response_model=List[WaqfTransactionSchema],
     summary="Получить историю транзакций для Вакф-проекта",
-    description="Возвращает список всех транзакций, связанных с конкретным вакф-проектом, для обеспечения полной прозрачности."
+    description="Возвращает транзакции, связанные с вакф-проектом, от новых к старым. Курсор следующей страницы передается в заголовке X-Next-Cursor."
 )
 async def get_waqf_transactions(
     waqf_id: int,
-    blockchain_service: BlockchainService = Depends(get_blockchain_service)
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Значение X-Next-Cursor из предыдущего ответа"),
+    limit: int = Query(50, ge=1, le=200),
+    explorer: ExplorerClient = Depends(get_explorer_client),
+    redis_client: Redis = Depends(get_redis_client),
 ):
     """
     Эндпоинт для получения истории транзакций пожертвований для вакф-проекта.
 
     - **waqf_id**: ID вакф-проекта в вашей базе данных.
+    - **cursor**: курсор страницы; без него возвращаются самые новые транзакции.
+    - **limit**: размер страницы.
 
-    Этот эндпоинт обращается к API блокчейн-эксплорера (например, Etherscan)
-    для получения списка транзакций для кошелька, связанного с вакф-проектом.
+    Транзакции кошелька загружаются из API блокчейн-эксплорера (например, Etherscan)
+    в кэш Redis инкрементально: при обновлении запрашиваются только блоки после
+    последнего загруженного, а страницы отдаются из кэша.
     """
     # 1. По ID вакф-проекта нужно получить из вашей БД адрес его кошелька.
     #    Здесь мы используем заглушку.
@@ -33,12 +58,27 @@ async def get_waqf_transactions(
     #    waqf_wallet_address = waqf_project.wallet_address
     waqf_wallet_address = "0x...YOUR_WAQF_PROJECT_WALLET_ADDRESS..." # ЗАГЛУШКА: Замените на реальный адрес
 
-    # 2. Используем сервис для получения транзакций
-    transactions = await blockchain_service.get_transactions_for_address(waqf_wallet_address)
+    # 2. Берем страницу из кэша, предварительно догрузив новые транзакции
+    try:
+        transactions, next_cursor = await AddressTransactionCache(redis_client, explorer).page(
+            waqf_wallet_address, cursor, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExplorerRefreshPending:
+        raise HTTPException(
+            status_code=503,
+            detail="Транзакции проекта еще загружаются",
+            headers={"Retry-After": str(int(EXPLORER_REFRESH_WAIT_SECONDS))},
+        )
+    except (ExplorerError, httpx.HTTPError):
+        raise HTTPException(status_code=502, detail="Блокчейн-эксплорер недоступен")
 
-    if not transactions:
+    if not transactions and cursor is None:
         raise HTTPException(status_code=404, detail="Транзакции для данного проекта не найдены")
 
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return transactions
 
 @router.post(
@@ -47,10 +87,10 @@ async def get_waqf_transactions(
     summary="Сделать пожертвование в вакф-проект",
     description="Создает и отправляет транзакцию пожертвования в блокчейн для указанного проекта."
 )
-def make_donation(
+async def make_donation(
     waqf_id: int,
     donation_data: DonationRequestSchema,
-    blockchain_service: BlockchainService = Depends(get_blockchain_service)
+    blockchain_service: AsyncBlockchainService = Depends(get_async_blockchain_service)
 ):
     """
     ### Важное замечание о безопасности:
@@ -70,7 +110,7 @@ def make_donation(
 
     try:
         # 2. Вызываем сервис для отправки транзакции
-        tx_hash = blockchain_service.make_donation(
+        tx_hash = await blockchain_service.make_donation(
             contract_address=contract_address,
             amount_in_ether=donation_data.amount_in_ether,
             donor_private_key=donation_data.donor_private_key
@@ -119,10 +159,10 @@ async def get_user_nft_certificates(
     summary="Запросить возврат средств из вакф-проекта",
     description="Позволяет жертвователю вернуть свои средства, если кампания по сбору не достигла цели в установленный срок."
 )
-def claim_refund(
+async def claim_refund(
     waqf_id: int,
     refund_data: RefundRequestSchema,
-    blockchain_service: BlockchainService = Depends(get_blockchain_service)
+    blockchain_service: AsyncBlockchainService = Depends(get_async_blockchain_service)
 ):
     """
     ### Условия для возврата:
@@ -139,7 +179,7 @@ def claim_refund(
 
     try:
         # 2. Вызываем сервис для отправки транзакции возврата
-        tx_hash = blockchain_service.claim_refund(
+        tx_hash = await blockchain_service.claim_refund(
             contract_address=contract_address,
             user_private_key=refund_data.user_private_key
         )
@@ -154,11 +194,11 @@ def claim_refund(
     summary="Проголосовать за выплату по этапу",
     description="Позволяет донору отдать свой голос за одобрение выплаты средств за выполненный этап."
 )
-def vote_for_milestone(
+async def vote_for_milestone(
     waqf_id: int,
     milestone_index: int,
     vote_data: VoteRequestSchema,
-    blockchain_service: BlockchainService = Depends(get_blockchain_service)
+    blockchain_service: AsyncBlockchainService = Depends(get_async_blockchain_service)
 ):
     """
     ### Условия для голосования:
@@ -169,7 +209,7 @@ def vote_for_milestone(
     contract_address = "0x...YOUR_WAQF_PROJECT_CONTRACT_ADDRESS..." # ЗАГЛУШКА
 
     try:
-        tx_hash = blockchain_service.vote_for_milestone(
+        tx_hash = await blockchain_service.vote_for_milestone(
             contract_address=contract_address,
             milestone_index=milestone_index,
             user_private_key=vote_data.user_private_key
@@ -184,11 +224,11 @@ def vote_for_milestone(
     summary="Инициировать выплату по этапу",
     description="Финализирует голосование и, в случае успеха, выплачивает средства бенефициару."
 )
-def release_milestone_funds(
+async def release_milestone_funds(
     waqf_id: int,
     milestone_index: int,
     release_data: ReleaseFundsRequestSchema,
-    blockchain_service: BlockchainService = Depends(get_blockchain_service)
+    blockchain_service: AsyncBlockchainService = Depends(get_async_blockchain_service)
 ):
     """
     ### Условия для выплаты:
@@ -199,7 +239,7 @@ def release_milestone_funds(
     contract_address = "0x...YOUR_WAQF_PROJECT_CONTRACT_ADDRESS..." # ЗАГЛУШКА
 
     try:
-        tx_hash = blockchain_service.release_milestone_funds(
+        tx_hash = await blockchain_service.release_milestone_funds(
             contract_address=contract_address,
             milestone_index=milestone_index,
             user_private_key=release_data.user_private_key
@@ -214,9 +254,9 @@ def release_milestone_funds(
     summary="Получить полную информацию о вакф-проекте",
     description="Возвращает текущее состояние проекта, прогресс сбора, дедлайн и информацию по всем этапам, включая статус голосования."
 )
-def get_waqf_project_details(
+async def get_waqf_project_details(
     waqf_id: int,
-    blockchain_service: BlockchainService = Depends(get_blockchain_service)
+    blockchain_service: AsyncBlockchainService = Depends(get_async_blockchain_service)
 ):
     """
     Этот эндпоинт напрямую читает данные из view-функций смарт-контракта.
@@ -228,7 +268,7 @@ def get_waqf_project_details(
     contract_address = "0x...YOUR_WAQF_PROJECT_CONTRACT_ADDRESS..." # ЗАГЛУШКА
 
     try:
-        project_details = blockchain_service.get_project_details(contract_address)
+        project_details = await blockchain_service.get_project_details(contract_address)
         return project_details
     except Exception as e:
         # Ошибка может возникнуть, если адрес контракта неверный или ABI не соответствует
@@ -240,23 +280,28 @@ def get_waqf_project_details(
     summary="Получить список доноров проекта",
     description="Возвращает отсортированный список всех доноров и общую сумму их вкладов."
 )
-def get_project_donors(
+async def get_project_donors(
     waqf_id: int,
-    blockchain_service: BlockchainService = Depends(get_blockchain_service)
+    db: AsyncSession = Depends(get_db),
+    blockchain_service: AsyncBlockchainService = Depends(get_async_blockchain_service)
 ):
     """
-    Этот эндпоинт сканирует события `DonationReceived` смарт-контракта,
-    чтобы составить полный список доноров.
+    Этот эндпоинт читает доноров из локального индекса событий `DonationReceived`
+    (см. services/waqf_indexer.py). Если индекс по контракту не ведется
+    (индексатор выключен), события `DonationReceived` сканируются в узле.
     """
     contract_address = "0x...YOUR_WAQF_PROJECT_CONTRACT_ADDRESS..." # ЗАГЛУШКА
 
-    try:
-        donors = blockchain_service.get_project_donors(contract_address, waqf_id)
-        if not donors:
-            raise HTTPException(status_code=404, detail="Доноры для этого проекта не найдены.")
-        return donors
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Не удалось получить список доноров: {e}")
+    if await is_contract_indexed(db, contract_address):
+        donors = await get_indexed_donors(db, contract_address, waqf_id)
+    else:
+        try:
+            donors = await blockchain_service.get_project_donors(contract_address, waqf_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Не удалось получить список доноров: {e}")
+    if not donors:
+        raise HTTPException(status_code=404, detail="Доноры для этого проекта не найдены.")
+    return donors
 
 @router.websocket("/ws/{waqf_id}/subscribe")
 async def websocket_endpoint(websocket: WebSocket, waqf_id: int):
@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import os
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from eth_utils import to_checksum_address
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.db.models import (
+    IndexedBlock,
+    IndexedContribution,
+    IndexedDonor,
+    IndexedMilestone,
+    IndexedProject,
+    IndexerCheckpoint,
+)
+from src.services.web3_client import (
+    DONATION_RECEIVED_TOPIC,
+    MILESTONE_PAID_TOPIC,
+    WAQF_LOGS_FROM_BLOCK,
+    AsyncBlockchainService,
+    JsonRpcError,
+    close_async_blockchain_service,
+    get_async_blockchain_service,
+)
+
+logger = logging.getLogger(__name__)
+
+# Запускать ли фоновую индексацию внутри приложения. Включается только при одном
+# воркере: каждый воркер с этим флагом запустит свой индексатор. При нескольких
+# воркерах индексатор запускается отдельным процессом: python -m src.services.waqf_indexer
+WAQF_INDEXER_ENABLED = os.getenv("WAQF_INDEXER_ENABLED", "false").lower() in ("1", "true", "yes")
+# Адреса контрактов WaqfProject через запятую; пусто - события любых контрактов.
+WAQF_CONTRACT_ADDRESSES = [a.strip() for a in os.getenv("WAQF_CONTRACT_ADDRESSES", "").split(",") if a.strip()]
+# Как часто проверять новые блоки.
+WAQF_INDEXER_INTERVAL_SECONDS = float(os.getenv("WAQF_INDEXER_INTERVAL_SECONDS", "15"))
+# Сколько блоков охватывает один запрос eth_getLogs.
+WAQF_INDEXER_BATCH_BLOCKS = int(os.getenv("WAQF_INDEXER_BATCH_BLOCKS", "2000"))
+# Сколько последних блоков помнить для отката при реорганизации цепочки.
+WAQF_INDEXER_REORG_DEPTH = int(os.getenv("WAQF_INDEXER_REORG_DEPTH", "64"))
+
+_CHECKPOINT_NAME = "waqf"
+
+
+def _raise_errors(*results: Any) -> None:
+    for result in results:
+        if isinstance(result, JsonRpcError):
+            raise result
+
+
+class WaqfEventIndexer:
+    """
+    Инкрементальный индекс событий DonationReceived и MilestonePaid - то же,
+    что mapping.ts делает для subgraph, но в нашей БД.
+
+    Индексатор идет по блокам от контрольной точки, на каждом шаге запоминает
+    хэш последнего обработанного блока и при расхождении с узлом (реорганизация)
+    откатывает агрегаты до общего блока и индексирует заново.
+    """
+
+    def __init__(
+        self,
+        service: AsyncBlockchainService,
+        addresses: Optional[List[str]] = None,
+        from_block: int = WAQF_LOGS_FROM_BLOCK,
+        batch_blocks: int = WAQF_INDEXER_BATCH_BLOCKS,
+        reorg_depth: int = WAQF_INDEXER_REORG_DEPTH,
+    ):
+        self.service = service
+        self.rpc = service.rpc
+        self.addresses = WAQF_CONTRACT_ADDRESSES if addresses is None else addresses
+        self.from_block = from_block
+        self.batch_blocks = max(1, batch_blocks)
+        self.reorg_depth = reorg_depth
+
+    async def sync(self, db_session: AsyncSession) -> int:
+        """Индексирует все блоки до текущей головы цепочки. Возвращает число обработанных событий."""
+        processed = 0
+        while True:
+            step = await self.step(db_session)
+            if step is None:
+                return processed
+            processed += step
+
+    async def step(self, db_session: AsyncSession) -> Optional[int]:
+        """
+        Обрабатывает очередной диапазон блоков и коммитит его одной транзакцией.
+        Возвращает число событий или None, если индекс догнал цепочку.
+        """
+        checkpoint = await db_session.get(IndexerCheckpoint, _CHECKPOINT_NAME)
+        if checkpoint is None:
+            checkpoint = IndexerCheckpoint(name=_CHECKPOINT_NAME, block_number=self.from_block - 1, block_hash=None)
+            db_session.add(checkpoint)
+
+        calls = [("eth_blockNumber", [])]
+        if checkpoint.block_hash:
+            calls.append(("eth_getBlockByNumber", [hex(checkpoint.block_number), False]))
+        results = await self.rpc.batch(calls)
+        _raise_errors(*results)
+        head = int(results[0], 16)
+        if checkpoint.block_hash and (results[1] is None or results[1]["hash"] != checkpoint.block_hash):
+            await self._rollback(db_session, checkpoint)
+            await db_session.commit()
+            return 0
+        if checkpoint.block_number >= head:
+            await db_session.commit()
+            return None
+
+        start = checkpoint.block_number + 1
+        stop = min(head, start + self.batch_blocks - 1)
+        log_filter: Dict[str, Any] = {
+            "fromBlock": hex(start),
+            "toBlock": hex(stop),
+            "topics": [[DONATION_RECEIVED_TOPIC, MILESTONE_PAID_TOPIC]],
+        }
+        if self.addresses:
+            log_filter["address"] = self.addresses
+        logs, stop_block = await self.rpc.batch([
+            ("eth_getLogs", [log_filter]),
+            ("eth_getBlockByNumber", [hex(stop), False]),
+        ])
+        _raise_errors(logs, stop_block)
+        if stop_block is None or any(
+            int(log["blockNumber"], 16) == stop and log["blockHash"] != stop_block["hash"] for log in logs
+        ):
+            # Цепочка изменилась между запросами - повторим диапазон на следующем шаге
+            await db_session.rollback()
+            return 0
+
+        logs = [log for log in logs if not log.get("removed")]
+        logs.sort(key=lambda log: (int(log["blockNumber"], 16), int(log["logIndex"], 16)))
+        for log in logs:
+            if log["topics"][0] == DONATION_RECEIVED_TOPIC:
+                await self._apply_donation(db_session, log)
+            else:
+                await self._apply_milestone_paid(db_session, log)
+
+        # Хэши блоков с событиями и последнего блока диапазона - точки отката при реорганизации
+        block_hashes = {int(log["blockNumber"], 16): log["blockHash"] for log in logs}
+        block_hashes[stop] = stop_block["hash"]
+        for number, block_hash in block_hashes.items():
+            await db_session.merge(IndexedBlock(number=number, hash=block_hash))
+        await db_session.execute(delete(IndexedBlock).where(IndexedBlock.number < stop - self.reorg_depth))
+        checkpoint.block_number, checkpoint.block_hash = stop, stop_block["hash"]
+        await db_session.commit()
+        return len(logs)
+
+    async def run(self, session_factory: async_sessionmaker, interval: float = WAQF_INDEXER_INTERVAL_SECONDS) -> None:
+        """Фоновый цикл индексации. Ошибки узла или БД не останавливают цикл."""
+        while True:
+            try:
+                async with session_factory() as db_session:
+                    processed = await self.sync(db_session)
+                if processed:
+                    logger.info("Индекс вакф-событий: обработано %s событий", processed)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка индексации вакф-событий")
+            await asyncio.sleep(interval)
+
+    # --- Применение событий ---
+
+    async def _project(self, db_session: AsyncSession, address: str) -> IndexedProject:
+        project = await db_session.get(IndexedProject, address)
+        if project is not None:
+            return project
+        project = IndexedProject(address=address, goal_amount=Decimal(0), raised_amount=Decimal(0))
+        # Как в mapping.ts: параметры проекта читаются из контракта один раз, при первом событии
+        try:
+            details = await self.service.get_project_details(address)
+        except Exception as e:
+            logger.warning("Не удалось прочитать параметры проекта %s: %s", address, e)
+            details = None
+        if details:
+            project.beneficiary = details["beneficiary"]
+            project.goal_amount = details["goal_amount_in_ether"] * Decimal(10) ** 18
+            project.deadline = details["deadline"]
+            for milestone in details["milestones"]:
+                db_session.add(IndexedMilestone(
+                    project_address=address,
+                    milestone_index=milestone["index"],
+                    description=milestone["description"],
+                    amount=milestone["amount_in_ether"] * Decimal(10) ** 18,
+                    is_paid=False,
+                ))
+        db_session.add(project)
+        return project
+
+    async def _apply_donation(self, db_session: AsyncSession, log: Dict[str, Any]) -> None:
+        key = (log["transactionHash"], int(log["logIndex"], 16))
+        if await db_session.get(IndexedContribution, key) is not None:
+            return
+        project = await self._project(db_session, log["address"].lower())
+        donor_address = "0x" + log["topics"][1][-40:]
+        amount = Decimal(int(log["data"], 16))
+        db_session.add(IndexedContribution(
+            tx_hash=key[0],
+            log_index=key[1],
+            project_address=project.address,
+            donor_address=donor_address,
+            amount=amount,
+            block_number=int(log["blockNumber"], 16),
+        ))
+        donor = await db_session.get(IndexedDonor, (project.address, donor_address))
+        if donor is None:
+            donor = IndexedDonor(
+                project_address=project.address, address=donor_address, total_donated=Decimal(0), contributions_count=0
+            )
+            db_session.add(donor)
+        donor.total_donated += amount
+        donor.contributions_count += 1
+        project.raised_amount += amount
+
+    async def _apply_milestone_paid(self, db_session: AsyncSession, log: Dict[str, Any]) -> None:
+        project = await self._project(db_session, log["address"].lower())
+        index = int(log["topics"][1], 16)
+        milestone = await db_session.get(IndexedMilestone, (project.address, index))
+        if milestone is None:
+            milestone = IndexedMilestone(project_address=project.address, milestone_index=index, amount=Decimal(int(log["data"], 16)))
+            db_session.add(milestone)
+        milestone.is_paid = True
+        milestone.paid_block = int(log["blockNumber"], 16)
+
+    # --- Реорганизации ---
+
+    async def _rollback(self, db_session: AsyncSession, checkpoint: IndexerCheckpoint) -> None:
+        """Откатывает индекс до последнего блока, который остался в цепочке узла."""
+        stored = (await db_session.execute(
+            select(IndexedBlock).order_by(IndexedBlock.number.desc())
+        )).scalars().all()
+        canonical = await self.rpc.batch([("eth_getBlockByNumber", [hex(block.number), False]) for block in stored])
+        fork = next(
+            (
+                block for block, remote in zip(stored, canonical)
+                if isinstance(remote, dict) and remote.get("hash") == block.hash
+            ),
+            None,
+        )
+        # Реорганизация глубже сохраненных блоков - индексируем заново с начала
+        fork_number = fork.number if fork else self.from_block - 1
+        logger.warning(
+            "Реорганизация цепочки: индекс вакф-событий откатывается с блока %s до %s", checkpoint.block_number, fork_number
+        )
+
+        reverted = (await db_session.execute(
+            select(
+                IndexedContribution.project_address,
+                IndexedContribution.donor_address,
+                func.sum(IndexedContribution.amount),
+                func.count(),
+            )
+            .where(IndexedContribution.block_number > fork_number)
+            .group_by(IndexedContribution.project_address, IndexedContribution.donor_address)
+        )).all()
+        for project_address, donor_address, amount, count in reverted:
+            donor = await db_session.get(IndexedDonor, (project_address, donor_address))
+            donor.total_donated -= amount
+            donor.contributions_count -= count
+            if donor.contributions_count <= 0:
+                await db_session.delete(donor)
+            project = await db_session.get(IndexedProject, project_address)
+            project.raised_amount -= amount
+        await db_session.execute(delete(IndexedContribution).where(IndexedContribution.block_number > fork_number))
+        await db_session.execute(
+            update(IndexedMilestone)
+            .where(IndexedMilestone.paid_block > fork_number)
+            .values(is_paid=False, paid_block=None)
+        )
+        await db_session.execute(delete(IndexedBlock).where(IndexedBlock.number > fork_number))
+        checkpoint.block_number, checkpoint.block_hash = fork_number, fork.hash if fork else None
+
+
+async def get_indexed_donors(db_session: AsyncSession, contract_address: str, waqf_id: int) -> List[Dict[str, Any]]:
+    """Доноры проекта из индекса, по убыванию суммы вкладов (формат как у AsyncBlockchainService)."""
+    donors = (await db_session.execute(
+        select(IndexedDonor)
+        .where(IndexedDonor.project_address == contract_address.lower())
+        .order_by(IndexedDonor.total_donated.desc())
+    )).scalars().all()
+    return [
+        {
+            "waqf_id": waqf_id,
+            "address": to_checksum_address(donor.address),
+            "total_donated_in_ether": Decimal(donor.total_donated) / Decimal(10) ** 18,
+        }
+        for donor in donors
+    ]
+
+
+async def is_contract_indexed(db_session: AsyncSession, contract_address: str) -> bool:
+    """
+    Ведется ли индекс событий контракта: индексатор прошел хотя бы один диапазон
+    блоков, а контракт входит в WAQF_CONTRACT_ADDRESSES (пусто - любые контракты).
+    """
+    if WAQF_CONTRACT_ADDRESSES and contract_address.lower() not in {a.lower() for a in WAQF_CONTRACT_ADDRESSES}:
+        return False
+    checkpoint = await db_session.get(IndexerCheckpoint, _CHECKPOINT_NAME)
+    return checkpoint is not None and checkpoint.block_hash is not None
+
+
+_indexer_task: Optional[asyncio.Task] = None
+
+
+async def start_waqf_indexer(session_factory: async_sessionmaker) -> None:
+    """Запускает фоновую индексацию. Вызывается при старте приложения."""
+    global _indexer_task
+    if _indexer_task is None:
+        indexer = WaqfEventIndexer(await get_async_blockchain_service())
+        _indexer_task = asyncio.create_task(indexer.run(session_factory))
+
+
+async def stop_waqf_indexer() -> None:
+    global _indexer_task
+    if _indexer_task is not None:
+        _indexer_task.cancel()
+        try:
+            await _indexer_task
+        except asyncio.CancelledError:
+            pass
+        _indexer_task = None
+
+
+async def run_standalone() -> None:
+    """Индексатор отдельным процессом - единственным на БД при любом числе воркеров приложения."""
+    from src.db.session import AsyncSessionLocal
+
+    indexer = WaqfEventIndexer(await get_async_blockchain_service())
+    try:
+        await indexer.run(AsyncSessionLocal)
+    finally:
+        await close_async_blockchain_service()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_standalone())
@@ -0,0 +1,384 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from eth_abi import decode, encode
+from eth_account import Account
+from eth_utils import event_signature_to_log_topic, function_signature_to_4byte_selector, to_checksum_address
+
+from src.core.caching import MISSING, LocalCache
+
+logger = logging.getLogger(__name__)
+
+# Адрес JSON-RPC узла Ethereum (тот же, что использует deploy.py).
+NODE_PROVIDER_URL = os.getenv("NODE_PROVIDER_URL", "http://localhost:8545")
+# Таймаут одного JSON-RPC запроса (в том числе пачки).
+WEB3_REQUEST_TIMEOUT_SECONDS = float(os.getenv("WEB3_REQUEST_TIMEOUT_SECONDS", "10"))
+# Размер пула keep-alive соединений к узлу.
+WEB3_MAX_CONNECTIONS = int(os.getenv("WEB3_MAX_CONNECTIONS", "50"))
+# Сколько этапов проекта запрашивать одной пачкой, пока контракт не вернет ошибку.
+WAQF_MILESTONES_BATCH = int(os.getenv("WAQF_MILESTONES_BATCH", "16"))
+# Адрес контракта Multicall3 (одинаков во всех основных сетях); пусто - без multicall.
+MULTICALL3_ADDRESS = os.getenv("MULTICALL3_ADDRESS", "0xcA11bde05977b3631167028862bE2a173976CA11")
+# Сколько считать номер последнего блока актуальным (меньше времени блока сети).
+WEB3_BLOCK_NUMBER_TTL_SECONDS = float(os.getenv("WEB3_BLOCK_NUMBER_TTL_SECONDS", "1"))
+# Сколько проектов помнить в кэше деталей (ключ - проект и номер блока).
+WAQF_DETAILS_CACHE_SIZE = int(os.getenv("WAQF_DETAILS_CACHE_SIZE", "1000"))
+WAQF_DETAILS_CACHE_TTL_SECONDS = 60
+# Блок, с которого искать события пожертвований (блок развертывания контрактов).
+WAQF_LOGS_FROM_BLOCK = int(os.getenv("WAQF_LOGS_FROM_BLOCK", "0"))
+
+_WEI_IN_ETHER = Decimal(10) ** 18
+
+# view-функции WaqfProject: сигнатура и типы результата
+_VIEWS = {
+    "goalAmount": ("goalAmount()", ["uint256"]),
+    "raisedAmount": ("raisedAmount()", ["uint256"]),
+    "deadline": ("deadline()", ["uint256"]),
+    "beneficiary": ("beneficiary()", ["address"]),
+    "state": ("state()", ["uint8"]),
+    "milestones": ("milestones(uint256)", ["string", "uint256", "bool", "uint256"]),
+}
+# Топики событий WaqfProject (см. mapping.ts)
+DONATION_RECEIVED_TOPIC = "0x" + event_signature_to_log_topic("DonationReceived(address,uint256)").hex()
+MILESTONE_PAID_TOPIC = "0x" + event_signature_to_log_topic("MilestonePaid(uint256,uint256)").hex()
+
+
+class JsonRpcError(Exception):
+    """Ошибка, которую вернул узел (например, revert контракта)."""
+
+    def __init__(self, error: Dict[str, Any]):
+        self.code = error.get("code")
+        self.data = error.get("data")
+        super().__init__(error.get("message", "JSON-RPC error"))
+
+
+def _calldata_bytes(signature: str, types: Sequence[str] = (), args: Sequence[Any] = ()) -> bytes:
+    return function_signature_to_4byte_selector(signature) + encode(list(types), list(args))
+
+
+def _calldata(signature: str, types: Sequence[str] = (), args: Sequence[Any] = ()) -> str:
+    return "0x" + _calldata_bytes(signature, types, args).hex()
+
+
+def _to_ether(wei: int) -> Decimal:
+    return Decimal(wei) / _WEI_IN_ETHER
+
+
+class AsyncRpcClient:
+    """
+    Асинхронный JSON-RPC клиент поверх общего пула keep-alive соединений httpx.
+    Несколько вызовов можно отправить одним HTTP-запросом через batch().
+    """
+
+    def __init__(
+        self,
+        url: str = NODE_PROVIDER_URL,
+        timeout: float = WEB3_REQUEST_TIMEOUT_SECONDS,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.url = url
+        self._ids = itertools.count(1)
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=WEB3_MAX_CONNECTIONS, max_keepalive_connections=WEB3_MAX_CONNECTIONS),
+            transport=transport,
+        )
+
+    async def call(self, method: str, params: Sequence[Any] = ()) -> Any:
+        result = (await self.batch([(method, params)]))[0]
+        if isinstance(result, JsonRpcError):
+            raise result
+        return result
+
+    async def batch(self, calls: Sequence[Tuple[str, Sequence[Any]]]) -> List[Any]:
+        """
+        Отправляет вызовы одной пачкой. Возвращает результаты в порядке вызовов;
+        ошибка отдельного вызова возвращается как JsonRpcError, а не выбрасывается.
+        """
+        if not calls:
+            return []
+        requests = [
+            {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": list(params)}
+            for method, params in calls
+        ]
+        response = await self._client.post(self.url, json=requests)
+        response.raise_for_status()
+        payload = response.json()
+        if isinstance(payload, dict):
+            # Узел отклонил пачку целиком
+            raise JsonRpcError(payload.get("error") or {})
+        by_id = {item.get("id"): item for item in payload}
+        results = []
+        for request in requests:
+            item = by_id.get(request["id"])
+            if item is None:
+                results.append(JsonRpcError({"message": f"Нет ответа на {request['method']}"}))
+            elif "error" in item:
+                results.append(JsonRpcError(item["error"]))
+            else:
+                results.append(item.get("result"))
+        return results
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class AsyncBlockchainService:
+    """
+    Асинхронный сервис для контрактов WaqfProject.
+
+    Все обращения к узлу идут через один AsyncRpcClient, не занимая потоки
+    Starlette; независимые чтения (nonce, цена газа) отправляются одной JSON-RPC
+    пачкой, а view-функции проекта - одним вызовом Multicall3 на зафиксированном
+    блоке. Детали проекта кэшируются по номеру блока: повторные чтения в том же
+    блоке не обращаются к узлу.
+    """
+
+    def __init__(self, rpc: AsyncRpcClient):
+        self.rpc = rpc
+        self._details_cache = LocalCache(WAQF_DETAILS_CACHE_SIZE, WAQF_DETAILS_CACHE_TTL_SECONDS)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._block_number: Optional[int] = None
+        self._block_fresh_until = 0.0
+        self._block_lock = asyncio.Lock()
+        # Развернут ли Multicall3 в сети узла; None - еще не проверено (см. _has_multicall)
+        self._multicall_available: Optional[bool] = None if MULTICALL3_ADDRESS else False
+
+    # --- Чтение ---
+
+    async def get_project_details(self, contract_address: str) -> Dict[str, Any]:
+        """Состояние проекта и все этапы на последнем блоке (из кэша, если блок не сменился)."""
+        contract_address = to_checksum_address(contract_address)
+        block = await self._latest_block()
+        key = f"{contract_address}:{block}"
+        details = self._details_cache.get(key)
+        if details is not MISSING:
+            return details
+        # Одновременные промахи по одному проекту ждут одно чтение
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            details = await self._read_project_details(contract_address, block)
+            self._details_cache.set(key, details)
+            future.set_result(details)
+            return details
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение передано ожидающим; помечаем его полученным, даже если их нет
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _read_project_details(self, contract_address: str, block: int) -> Dict[str, Any]:
+        summary = ["goalAmount", "raisedAmount", "deadline", "beneficiary", "state"]
+        calls = [(name, ()) for name in summary]
+        calls += [("milestones", (i,)) for i in range(WAQF_MILESTONES_BATCH)]
+        results = await self._read_views(contract_address, calls, block)
+        for name, result in zip(summary[:4], results):
+            if result is None:
+                raise JsonRpcError({"message": f"Вызов {name}() контракта {contract_address} не удался"})
+        goal, raised, deadline, beneficiary = (
+            self._decode(name, result)[0] for name, result in zip(summary[:4], results)
+        )
+        # state() есть не во всех версиях контракта
+        state = self._decode("state", results[4])[0] if results[4] is not None else None
+
+        milestones = await self._collect_milestones(contract_address, results[len(summary):], block)
+        return {
+            "contract_address": contract_address,
+            "beneficiary": beneficiary,
+            "goal_amount_in_ether": _to_ether(goal),
+            "raised_amount_in_ether": _to_ether(raised),
+            "deadline": datetime.fromtimestamp(deadline, tz=timezone.utc),
+            "state": state,
+            "block_number": block,
+            "milestones": milestones,
+        }
+
+    async def get_project_donors(self, contract_address: str, waqf_id: int) -> List[Dict[str, Any]]:
+        """Доноры проекта по событиям DonationReceived, по убыванию суммы вкладов."""
+        logs = await self.rpc.call("eth_getLogs", [{
+            "address": to_checksum_address(contract_address),
+            "fromBlock": hex(WAQF_LOGS_FROM_BLOCK),
+            "toBlock": "latest",
+            "topics": [DONATION_RECEIVED_TOPIC],
+        }])
+        totals: Dict[str, int] = {}
+        for log in logs:
+            donor = to_checksum_address("0x" + log["topics"][1][-40:])
+            totals[donor] = totals.get(donor, 0) + int(log["data"], 16)
+        return [
+            {"waqf_id": waqf_id, "address": donor, "total_donated_in_ether": _to_ether(wei)}
+            for donor, wei in sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        ]
+
+    # --- Транзакции ---
+
+    async def make_donation(self, contract_address: str, amount_in_ether: Decimal, donor_private_key: str) -> str:
+        wei = int(Decimal(str(amount_in_ether)) * _WEI_IN_ETHER)
+        return await self._transact(contract_address, _calldata("donate()"), donor_private_key, value=wei)
+
+    async def claim_refund(self, contract_address: str, user_private_key: str) -> str:
+        return await self._transact(contract_address, _calldata("claimRefund()"), user_private_key)
+
+    async def vote_for_milestone(self, contract_address: str, milestone_index: int, user_private_key: str) -> str:
+        data = _calldata("voteForMilestone(uint256)", ["uint256"], [milestone_index])
+        return await self._transact(contract_address, data, user_private_key)
+
+    async def release_milestone_funds(self, contract_address: str, milestone_index: int, user_private_key: str) -> str:
+        data = _calldata("releaseMilestoneFunds(uint256)", ["uint256"], [milestone_index])
+        return await self._transact(contract_address, data, user_private_key)
+
+    async def _transact(self, contract_address: str, data: str, private_key: str, value: int = 0) -> str:
+        """Подписывает и отправляет транзакцию. Nonce, цена газа, chainId и оценка газа - одной пачкой."""
+        account = Account.from_key(private_key)
+        tx = {"from": account.address, "to": to_checksum_address(contract_address), "data": data, "value": hex(value)}
+        nonce, gas_price, chain_id, gas = await self.rpc.batch([
+            ("eth_getTransactionCount", [account.address, "pending"]),
+            ("eth_gasPrice", []),
+            ("eth_chainId", []),
+            ("eth_estimateGas", [tx]),
+        ])
+        # Ошибка оценки газа - обычно revert: транзакция заведомо не пройдет, газ не тратим
+        for result in (nonce, gas_price, chain_id, gas):
+            if isinstance(result, JsonRpcError):
+                raise result
+
+        unsigned = {
+            "to": tx["to"],
+            "data": data,
+            "value": value,
+            "nonce": int(nonce, 16),
+            "gasPrice": int(gas_price, 16),
+            "gas": int(gas, 16),
+            "chainId": int(chain_id, 16),
+        }
+        # Подпись - чистые вычисления на CPU, выполняем вне event loop
+        signed = await asyncio.to_thread(account.sign_transaction, unsigned)
+        raw = getattr(signed, "raw_transaction", None) or signed.rawTransaction
+        return await self.rpc.call("eth_sendRawTransaction", ["0x" + bytes(raw).hex()])
+
+    # --- Вспомогательное ---
+
+    async def _collect_milestones(self, contract_address: str, results: List[Optional[bytes]], block: int) -> List[Dict[str, Any]]:
+        """
+        Разбирает этапы из ответов milestones(i). Контракт откатывает обращение
+        к несуществующему этапу; если все ответы оказались этапами, читается следующая пачка.
+        """
+        milestones: List[Dict[str, Any]] = []
+        while True:
+            for result in results:
+                if result is None:
+                    return milestones
+                description, amount, is_paid, approval_votes = self._decode("milestones", result)
+                milestones.append({
+                    "index": len(milestones),
+                    "description": description,
+                    "amount_in_ether": _to_ether(amount),
+                    "is_paid": is_paid,
+                    "approval_votes_in_ether": _to_ether(approval_votes),
+                })
+            start = len(milestones)
+            results = await self._read_views(
+                contract_address, [("milestones", (i,)) for i in range(start, start + WAQF_MILESTONES_BATCH)], block
+            )
+
+    async def _latest_block(self) -> int:
+        """Номер последнего блока; запрашивается у узла не чаще раза в WEB3_BLOCK_NUMBER_TTL_SECONDS."""
+        if time.monotonic() < self._block_fresh_until:
+            return self._block_number
+        async with self._block_lock:
+            if time.monotonic() >= self._block_fresh_until:
+                self._block_number = int(await self.rpc.call("eth_blockNumber"), 16)
+                self._block_fresh_until = time.monotonic() + WEB3_BLOCK_NUMBER_TTL_SECONDS
+        return self._block_number
+
+    async def _has_multicall(self) -> bool:
+        """
+        Развернут ли Multicall3 по адресу MULTICALL3_ADDRESS (например, в локальной
+        сети его нет). Проверяется один раз через eth_getCode; ошибка узла не
+        запоминается - проверка повторится при следующем чтении.
+        """
+        if self._multicall_available is None:
+            try:
+                code = await self.rpc.call("eth_getCode", [MULTICALL3_ADDRESS, "latest"])
+            except JsonRpcError as e:
+                logger.warning("Не удалось проверить наличие Multicall3: %s", e)
+                return False
+            self._multicall_available = code not in (None, "0x")
+        return self._multicall_available
+
+    async def _read_views(
+        self, contract_address: str, calls: List[Tuple[str, tuple]], block: int
+    ) -> List[Optional[bytes]]:
+        """
+        Вызывает view-функции контракта на блоке `block`. Возвращает ответы в порядке
+        вызовов; None - вызов откатился. Все вызовы идут одним eth_call к Multicall3,
+        а если его нет в сети - одной JSON-RPC пачкой.
+        """
+        payloads = [_calldata_bytes(_VIEWS[view][0], ["uint256"] * len(args), args) for view, args in calls]
+        block_tag = hex(block)
+        if await self._has_multicall():
+            data = "0x" + _calldata_bytes(
+                "aggregate3((address,bool,bytes)[])",
+                ["(address,bool,bytes)[]"],
+                [[(contract_address, True, payload) for payload in payloads]],
+            ).hex()
+            try:
+                result = await self.rpc.call("eth_call", [{"to": MULTICALL3_ADDRESS, "data": data}, block_tag])
+            except JsonRpcError as e:
+                # Ошибка одного вызова (лимит газа, сбой узла) - этот запрос читается пачкой
+                logger.warning("Вызов Multicall3 не удался, чтение пачкой: %s", e)
+                result = None
+            if result and result != "0x":
+                (entries,) = decode(["(bool,bytes)[]"], bytes.fromhex(result[2:]))
+                return [return_data if success and return_data else None for success, return_data in entries]
+
+        results = await self.rpc.batch([
+            ("eth_call", [{"to": contract_address, "data": "0x" + payload.hex()}, block_tag]) for payload in payloads
+        ])
+        return [
+            None if isinstance(result, JsonRpcError) or result in (None, "0x") else bytes.fromhex(result[2:])
+            for result in results
+        ]
+
+    @staticmethod
+    def _decode(view: str, result: bytes) -> tuple:
+        _, output_types = _VIEWS[view]
+        return decode(output_types, result)
+
+
+_service: Optional[AsyncBlockchainService] = None
+
+
+async def get_async_blockchain_service() -> AsyncBlockchainService:
+    """
+    Зависимость FastAPI: один сервис (и пул соединений) на процесс.
+    Асинхронная, чтобы FastAPI не переносил ее вызов в пул потоков.
+    """
+    global _service
+    if _service is None:
+        _service = AsyncBlockchainService(AsyncRpcClient())
+    return _service
+
+
+async def close_async_blockchain_service() -> None:
+    """Закрывает пул соединений к узлу. Вызывается при остановке приложения."""
+    global _service
+    if _service is not None:
+        await _service.rpc.close()
+        _service = None